@@ -3,10 +3,11 @@ Script for generating a new clinvar table with the ExAC fields below added to ea
 """
 import argparse
 from collections import defaultdict
-import gzip
 import pysam
 import sys
 
+from table_io import TableReader, TableWriter
+
 NEEDED_EXAC_FIELDS = [ 'Filter',  # whether the variant is PASS
  'AC', 'AC_Het', 'AC_Hom', 'AC_Adj', 'AN', 'AN_Adj', 'AF', 
  'AC_AFR', 'AC_AMR', 'AC_EAS', 'AC_FIN', 'AC_NFE', 'AC_OTH', 'AC_SAS', 
@@ -102,21 +103,17 @@ def get_exac_column_values(exac_f, chrom, pos, ref, alt):
 
 
 exac_f = pysam.TabixFile(args.exac_sites_vcf)
-clinvar_f = gzip.open(args.clinvar_table) if args.clinvar_table.endswith('.gz') else open(args.clinvar_table)
-clinvar_header = next(clinvar_f).rstrip('\n').split('\t')
-clinvar_with_exac_header = clinvar_header + NEEDED_EXAC_FIELDS
-print("\t".join(clinvar_with_exac_header))
-for i, clinvar_row in enumerate(clinvar_f):
-    clinvar_fields = clinvar_row.rstrip('\n').split('\t')
-    clinvar_dict = dict(zip(clinvar_header, clinvar_fields))
-
-    chrom = clinvar_dict['chrom']
-    pos = int(clinvar_dict['pos'])
-    ref = clinvar_dict['ref']
-    alt = clinvar_dict['alt']
-    exac_column_values = get_exac_column_values(exac_f, chrom, pos, ref, alt)
-    
-    print("\t".join(clinvar_fields + exac_column_values))
+clinvar_table = TableReader(args.clinvar_table)
+chrom_i, pos_i, ref_i, alt_i = clinvar_table.indexes(['chrom', 'pos', 'ref', 'alt'])
+out = TableWriter(sys.stdout)
+out.write_row(clinvar_table.column_names + NEEDED_EXAC_FIELDS)
+for clinvar_fields in clinvar_table:
+    exac_column_values = get_exac_column_values(exac_f, clinvar_fields[chrom_i], int(clinvar_fields[pos_i]),
+                                                clinvar_fields[ref_i], clinvar_fields[alt_i])
+
+    out.write_row(clinvar_fields + exac_column_values)
+out.close()
+clinvar_table.close()
 
 for k, v in counts.items():
     sys.stderr.write("%30s: %s\n" % (k, v))
@@ -3,10 +3,11 @@ Script for generating a new clinvar table with the gnomAD fields below added to
 """
 import argparse
 from collections import defaultdict
-import gzip
 import pysam
 import sys
 
+from table_io import TableReader, TableWriter
+
 NEEDED_GNOMAD_FIELDS = [ 'Filter',  # whether the variant is PASS
  'AC', 'AN', 'AF', 'DP','Hom',
  'AC_AFR', 'AC_AMR', 'AC_ASJ', 'AC_EAS', 'AC_SAS', 'AC_FIN', 'AC_NFE', 'AC_OTH', 
@@ -103,21 +104,17 @@ def get_gnomad_column_values(gnomad_f, chrom, pos, ref, alt):
 
 
 gnomad_f = pysam.TabixFile(args.gnomad_sites_vcf)
-clinvar_f = gzip.open(args.clinvar_table) if args.clinvar_table.endswith('.gz') else open(args.clinvar_table)
-clinvar_header = next(clinvar_f).rstrip('\n').split('\t')
-clinvar_with_gnomad_header = clinvar_header + NEEDED_GNOMAD_FIELDS
-print("\t".join(clinvar_with_gnomad_header))
-for i, clinvar_row in enumerate(clinvar_f):
-    clinvar_fields = clinvar_row.rstrip('\n').split('\t')
-    clinvar_dict = dict(zip(clinvar_header, clinvar_fields))
-
-    chrom = clinvar_dict['chrom']
-    pos = int(clinvar_dict['pos'])
-    ref = clinvar_dict['ref']
-    alt = clinvar_dict['alt']
-    gnomad_column_values = get_gnomad_column_values(gnomad_f, chrom, pos, ref, alt)
-    
-    print("\t".join(clinvar_fields + gnomad_column_values))
+clinvar_table = TableReader(args.clinvar_table)
+chrom_i, pos_i, ref_i, alt_i = clinvar_table.indexes(['chrom', 'pos', 'ref', 'alt'])
+out = TableWriter(sys.stdout)
+out.write_row(clinvar_table.column_names + NEEDED_GNOMAD_FIELDS)
+for clinvar_fields in clinvar_table:
+    gnomad_column_values = get_gnomad_column_values(gnomad_f, clinvar_fields[chrom_i], int(clinvar_fields[pos_i]),
+                                                    clinvar_fields[ref_i], clinvar_fields[alt_i])
+
+    out.write_row(clinvar_fields + gnomad_column_values)
+out.close()
+clinvar_table.close()
 
 for k, v in counts.items():
     sys.stderr.write("%30s: %s\n" % (k, v))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+Benchmark normalize_variants.py on a table from parse_clinvar_xml.py against reading the reference one variant at a
+time, and optionally against normalize.py from https://github.com/ericminikel/minimal_representation, which master.py
+used to download. Checks that they all output the same rows.
+
+Run with:
+    python benchmark_normalize_variants.py -i clinvar_table_raw.single.b37.tsv.gz -R b37.fa [--normalize-py normalize.py]
+"""
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import itertools
+import os
+import sys
+import time
+
+from normalize_variants import ReferenceCache, normalize_lines
+
+
+def read_table(path, max_rows=None):
+    with (gzip.open(path) if path.endswith('.gz') else open(path)) as f:
+        header = next(f)
+        return header.rstrip('\n').split('\t'), list(itertools.islice(f, max_rows))
+
+
+def run_native(column_names, lines, fasta, window_size, batch_size):
+    reference = ReferenceCache(fasta, window_size=window_size)
+    return list(normalize_lines(lines, column_names, reference, batch_size=batch_size)), reference.reads
+
+
+def run_normalize_py(column_names, lines, fasta, normalize_module):
+    """Normalize each row with normalize.normalize, in the order they were read, as normalize.py does"""
+    errors = (normalize_module.RefEqualsAltError, normalize_module.WrongRefError,
+              normalize_module.InvalidNucleotideSequenceError)
+    chrom_column, pos_column, ref_column, alt_column = [column_names.index(column)
+                                                        for column in ('chrom', 'pos', 'ref', 'alt')]
+    output = []
+    for line in lines:
+        values = line.rstrip('\n').split('\t')
+        values += [''] * (len(column_names) - len(values))
+        try:
+            chrom, pos, ref, alt = normalize_module.normalize(fasta, values[chrom_column], int(values[pos_column]),
+                                                              values[ref_column], values[alt_column])
+        except errors:
+            continue
+        values[chrom_column], values[pos_column], values[ref_column], values[alt_column] = chrom, str(pos), ref, alt
+        output.append('\t'.join(values) + '\n')
+    return output, None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark variant normalization')
+    parser.add_argument('-i', '--infile', required=True, help="Table from parse_clinvar_xml.py. Can be gzipped.")
+    parser.add_argument('-R', '--reference-genome', required=True, help=".fa genome reference file")
+    parser.add_argument('--normalize-py', help="Path of normalize.py to compare with")
+    parser.add_argument('-n', '--max-rows', type=int, help="Only use the first this many rows of the table")
+    args = parser.parse_args()
+
+    import pysam
+
+    column_names, lines = read_table(args.infile, args.max_rows)
+    print("%d rows" % len(lines))
+    methods = [
+        ('normalize_variants.py', lambda fasta: run_native(column_names, lines, fasta, 2**16, 100000)),
+        ('one row at a time', lambda fasta: run_native(column_names, lines, fasta, 0, 1)),
+    ]
+    if args.normalize_py:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(args.normalize_py)))
+        normalize_module = __import__(os.path.basename(args.normalize_py).rsplit('.', 1)[0])
+        methods.append(('normalize.py', lambda fasta: run_normalize_py(column_names, lines, fasta, normalize_module)))
+
+    expected = None
+    for name, method in methods:
+        fasta = pysam.FastaFile(args.reference_genome)
+        start = time.time()
+        output, reads = method(fasta)
+        seconds = time.time() - start
+        fasta.close()
+        print("%-22s %8.2f s %10.0f rows/s %s" % (name, seconds, len(lines) / seconds,
+                                                 ("%d reference reads" % reads) if reads is not None else ""))
+        output.sort()
+        if expected is None:
+            expected = output
+        elif output != expected:
+            mismatches = len(set(output) ^ set(expected))
+            sys.exit("ERROR: %s output differs from normalize_variants.py's in %d rows" % (name, mismatches))
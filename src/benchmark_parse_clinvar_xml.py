@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""
+Benchmark parse_clinvar_tree on synthetic ClinVar XML of different shapes, made by synthetic_clinvar_xml.py, so that
+parser performance can be compared across commits without downloading a release.
+
+Each scenario is parsed in a fresh child process, so that the peak memory reported is that of parsing the scenario
+alone. The results are written as JSON:
+    {"python": ..., "options": {...}, "scenarios": {<name>: {"clinvar_sets": ..., "rows": ..., "seconds": ...,
+     "records_per_sec": ..., "us_per_clinvar_set": ..., "peak_rss_mb": ...}, ...}}
+where records_per_sec is ClinVarSets per second, and seconds is the best of --repeat runs.
+
+To gate regressions, save the results of a known good commit and compare against them:
+    python benchmark_parse_clinvar_xml.py -o baseline.json
+    python benchmark_parse_clinvar_xml.py --compare baseline.json
+which exits with status 1 if any scenario got slower, or used more memory, by more than the allowed factor.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+
+from parse_clinvar_xml import parse_clinvar_tree, get_handle, get_peak_rss
+from synthetic_clinvar_xml import generate_clinvar_xml
+
+# keyword arguments for synthetic_clinvar_xml.clinvar_set_xml
+SCENARIOS = [
+    ('single', dict(multi_fraction=0)),
+    ('multi', dict(multi_fraction=1)),
+    ('many_scvs', dict(scvs=25)),
+    ('long_comments', dict(comment_length=5000)),
+    ('many_trait_sets', dict(trait_sets=10)),
+    ('mixed', dict(multi_fraction=0.1, scvs=5, comment_length=1000, trait_sets=3)),
+]
+
+
+def run_scenario(xml_path, processes=1, streaming=False):
+    """Parse the XML at xml_path, discarding the rows, and return the stats from parse_clinvar_tree along with the
+    peak resident set size in MB of this process and its children
+    """
+    handle = get_handle(xml_path)
+    with open(os.devnull, 'w') as dest, open(os.devnull, 'w') as multi:
+        stats = parse_clinvar_tree(handle, dest=dest, multi=multi, verbose=False, processes=processes,
+                                   streaming=streaming)
+    handle.close()
+    stats['peak_rss_mb'] = max(get_peak_rss()) / 2.0**20
+    return stats
+
+
+def _run_scenario_in_child(xml_path, processes, streaming):
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(run_scenario, (xml_path, processes, streaming))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def run_benchmark(num_clinvar_sets, scenarios=None, repeat=3, processes=1, streaming=False, seed=0, log=None):
+    """Run the benchmark and return the results as a JSON-serialisable dictionary.
+
+    Args:
+        num_clinvar_sets: Number of ClinVarSets to generate for each scenario
+        scenarios: Names of the scenarios to run, or None for all of them
+        repeat: Number of times to parse each scenario. The best time and the highest peak memory are reported.
+        processes, streaming: Passed to parse_clinvar_tree
+        seed: Random seed for the synthetic XML
+        log: Optional function to call with a line of progress
+    """
+    results = {
+        'python': platform.python_version(),
+        'options': {'num_clinvar_sets': num_clinvar_sets, 'repeat': repeat, 'processes': processes,
+                    'streaming': streaming, 'seed': seed},
+        'scenarios': {},
+    }
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for name, shape in SCENARIOS:
+            if scenarios is not None and name not in scenarios:
+                continue
+            xml_path = os.path.join(tmp_dir, name + '.xml')
+            with open(xml_path, 'wb') as out:
+                generate_clinvar_xml(out, num_clinvar_sets, seed=seed, **shape)
+
+            runs = [_run_scenario_in_child(xml_path, processes, streaming) for _ in range(repeat)]
+            seconds = min(run['seconds'] for run in runs)
+            result = {
+                'clinvar_sets': runs[0]['clinvar_sets'],
+                'rows': runs[0]['rows'],
+                'xml_mb': os.path.getsize(xml_path) / 2.0**20,
+                'seconds': seconds,
+                'records_per_sec': runs[0]['clinvar_sets'] / seconds if seconds else None,
+                'us_per_clinvar_set': seconds * 1e6 / runs[0]['clinvar_sets'] if runs[0]['clinvar_sets'] else None,
+                'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+            }
+            results['scenarios'][name] = result
+            os.remove(xml_path)
+            if log is not None:
+                log("%-16s %8d sets %8.1f sets/s %10.1f us/set %8.1f MB" % (
+                    name, result['clinvar_sets'], result['records_per_sec'] or 0, result['us_per_clinvar_set'] or 0,
+                    result['peak_rss_mb']))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    return results
+
+
+def compare_results(results, baseline, max_slowdown=1.25, max_memory_growth=1.25):
+    """Returns a list of messages describing each scenario whose time per ClinVarSet or peak memory is worse than in
+    the baseline results by more than the given factors. Scenarios missing from either are ignored.
+    """
+    regressions = []
+    for name, result in sorted(results['scenarios'].items()):
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        if result['us_per_clinvar_set'] > base['us_per_clinvar_set'] * max_slowdown:
+            regressions.append("%s: %.1f us per ClinVarSet, was %.1f" % (
+                name, result['us_per_clinvar_set'], base['us_per_clinvar_set']))
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * max_memory_growth:
+            regressions.append("%s: peak memory %.1f MB, was %.1f" % (name, result['peak_rss_mb'], base['peak_rss_mb']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark parse_clinvar_xml.py on synthetic ClinVar XML')
+    parser.add_argument('-n', '--num-clinvar-sets', type=int, default=2000,
+                        help="Number of ClinVarSets to generate for each scenario")
+    parser.add_argument('-s', '--scenario', nargs='+', choices=[name for name, _ in SCENARIOS],
+                        help="Scenarios to run. Default: all")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of times to parse each scenario")
+    parser.add_argument('-p', '--processes', type=int, default=1, help="Passed to parse_clinvar_tree")
+    parser.add_argument('--streaming', action='store_true', help="Passed to parse_clinvar_tree")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--out', default='-', help="Path to write the JSON results to. Default: stdout")
+    parser.add_argument('--compare', help="Path of JSON results from an earlier run to check for regressions against")
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help="With --compare, the allowed factor of increase in time per ClinVarSet")
+    parser.add_argument('--max-memory-growth', type=float, default=1.25,
+                        help="With --compare, the allowed factor of increase in peak memory")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.num_clinvar_sets, scenarios=args.scenario, repeat=args.repeat,
+                            processes=args.processes, streaming=args.streaming, seed=args.seed,
+                            log=lambda line: print(line, file=sys.stderr))
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    json.dump(results, out, indent=2, sort_keys=True)
+    out.write('\n')
+    if out is not sys.stdout:
+        out.close()
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.max_slowdown, args.max_memory_growth)
+        for message in regressions:
+            print("Regression: " + message, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmark for extracting PubMed IDs from ClinVar Comment text: parse_clinvar_xml.extract_comment_pmids vs. the
+loop it replaced, which searched again in a copy of the remaining text after every ID.
+
+Run with: python benchmark_pmid_extraction.py [--min-time seconds]
+"""
+
+from __future__ import print_function
+
+import argparse
+import re
+import timeit
+
+from parse_clinvar_xml import extract_comment_pmids
+
+# the way comments are written by submitters in ClinVarFullRelease.xml
+COMMENT_SAMPLES = [
+    "This variant has been reported in the literature in individuals with breast and ovarian cancer (PMID: 10094557, "
+    "19200354, 21120943). It is classified as pathogenic.",
+    "Converted during submission to Likely pathogenic.",
+    "PubMed ID: 8755918; 9285779; 11385711.",
+    "The c.68_69delAG variant (PMID:8673093,9150149) is a founder mutation.",
+    "The variant was observed in trans with a pathogenic variant in an affected individual [PMID 23788249]. "
+    "Functional studies demonstrated reduced activity (PMID 25741868).",
+    "Sequence variant seen in 3 unrelated probands.\nPublications: PubMed 17094996 PubMed 27854360",
+    # a long curation summary citing dozens of papers, like those submitted by some clinical labs
+    "Summary of evidence (PMIDs " + ", ".join(str(20000000 + i * 7919) for i in range(60)) + "). " +
+    "The variant segregates with disease in multiple families and is absent from population databases. " * 10,
+    # a long comment with no IDs after the mention
+    "See PubMed for details. " + "Segregation data were not available for this family. " * 40,
+]
+
+
+def legacy_extract_comment_pmids(text):
+    """The comment PMID loop from parse_clinvar_xml.py before extract_comment_pmids"""
+    comment_pmids = []
+    mentions_pubmed = re.search('(?:PubMed|PMID)(.*)', text)
+    if mentions_pubmed is not None and mentions_pubmed.group(1) is not None:
+        remaining_text = mentions_pubmed.group(1)
+        while True:
+            pubmed_id_extraction = re.search('[^0-9]+([0-9]+)[^0-9](.*)', remaining_text)
+            if pubmed_id_extraction is None:
+                break
+            elif pubmed_id_extraction.group(1) is not None:
+                comment_pmids.append(pubmed_id_extraction.group(1))
+                if pubmed_id_extraction.group(2) is not None:
+                    remaining_text = pubmed_id_extraction.group(2)
+
+    return comment_pmids
+
+
+def time_per_call(func, text, min_time):
+    """Returns the best time in seconds of 3 runs of func(text), each repeated until it takes at least min_time"""
+    number = 1
+    while True:
+        elapsed = timeit.timeit(lambda: func(text), number=number)
+        if elapsed >= min_time:
+            break
+        number *= 2
+    return min([elapsed] + timeit.repeat(lambda: func(text), number=number, repeat=2)) / number
+
+
+def run_benchmark(min_time):
+    print("%-10s %10s %12s %12s %8s" % ("sample", "length", "legacy (us)", "scan (us)", "speedup"))
+    for i, text in enumerate(COMMENT_SAMPLES):
+        assert extract_comment_pmids(text) == legacy_extract_comment_pmids(text)
+        legacy_time = time_per_call(legacy_extract_comment_pmids, text, min_time)
+        scan_time = time_per_call(extract_comment_pmids, text, min_time)
+        print("%-10s %10d %12.2f %12.2f %7.1fx" % (
+            i, len(text), legacy_time * 1e6, scan_time * 1e6, legacy_time / scan_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark PubMed ID extraction from ClinVar comments')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="Minimum time in seconds to spend on each timing run")
+    args = parser.parse_args()
+
+    run_benchmark(args.min_time)
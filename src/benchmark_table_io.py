@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+Benchmark reading a table and writing it back out, the way add_exac_fields.py, add_gnomad_fields.py and
+check_allele_table.py used to, with gzip.open and a dictionary of column name -> value for each row, against table_io.py.
+Each method reads the chrom, pos, ref and alt of every row, and writes the row to a sink that checksums it, and the
+checksums are compared.
+
+Run with:
+    python benchmark_table_io.py -i clinvar_allele_trait_pairs.single.b37.tsv.gz
+"""
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import hashlib
+import sys
+import time
+
+from table_io import TableReader, TableWriter
+
+LOC_COLUMNS = ['chrom', 'pos', 'ref', 'alt']
+
+
+class Checksum(object):
+    """File-like object that only keeps an md5 of what's written to it"""
+
+    def __init__(self):
+        self.md5 = hashlib.md5()
+
+    def write(self, data):
+        self.md5.update(data if bytes is str else data.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+
+def run_dict_per_row(path, out):
+    f = gzip.open(path) if path.endswith('.gz') else open(path)
+    header = next(f).rstrip('\n').split('\t')
+    out.write('\t'.join(header) + '\n')
+    rows = 0
+    for line in f:
+        fields = line.rstrip('\n').split('\t')
+        row = dict(zip(header, fields))
+        chrom, pos, ref, alt = row['chrom'], int(row['pos']), row['ref'], row['alt']
+        out.write('\t'.join(fields) + '\n')
+        rows += 1
+    f.close()
+    return rows
+
+
+def run_records(path, out):
+    rows = 0
+    with TableReader(path) as table, TableWriter(out) as writer:
+        writer.write_row(table.column_names)
+        for record in table.records():
+            chrom, pos, ref, alt = record['chrom'], int(record['pos']), record['ref'], record['alt']
+            writer.write_row(record.values)
+            rows += 1
+    return rows
+
+
+def run_indexes(path, out):
+    rows = 0
+    with TableReader(path) as table, TableWriter(out) as writer:
+        chrom_i, pos_i, ref_i, alt_i = table.indexes(LOC_COLUMNS)
+        writer.write_row(table.column_names)
+        for values in table:
+            chrom, pos, ref, alt = values[chrom_i], int(values[pos_i]), values[ref_i], values[alt_i]
+            writer.write_row(values)
+            rows += 1
+    return rows
+
+
+METHODS = [
+    ('gzip.open + dict per row', run_dict_per_row),
+    ('TableReader + Record', run_records),
+    ('TableReader + indexes', run_indexes),
+]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark table_io.py against reading tables with gzip.open')
+    parser.add_argument('-i', '--infile', required=True, help="Table with chrom, pos, ref and alt columns. Can be gzipped.")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="Number of times to run each method. The fastest "
+                        "run is reported.")
+    args = parser.parse_args()
+
+    expected = None
+    for name, method in METHODS:
+        best = None
+        for _ in range(args.repeat):
+            out = Checksum()
+            start = time.time()
+            rows = method(args.infile, out)
+            seconds = time.time() - start
+            best = seconds if best is None else min(best, seconds)
+        print("%-26s %8.2f s %10.0f rows/s" % (name, best, rows / max(best, 1e-9)))
+        if expected is None:
+            expected = out.md5.hexdigest()
+        elif out.md5.hexdigest() != expected:
+            sys.exit("ERROR: %s output differs from %s's" % (name, METHODS[0][0]))
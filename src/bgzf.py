@@ -0,0 +1,251 @@
+"""
+Minimal reader and writer for BGZF (blocked gzip), the gzip variant that bgzip, tabix and pysam use. A BGZF file is a
+series of gzip members that each hold at most 64KB of uncompressed data and record their own compressed size, followed
+by an empty end-of-file block. Any gzip reader can decompress it, and tabix can index it.
+
+Positions in a BGZF file are "virtual offsets": the file offset of the start of a block, shifted left 16 bits, plus
+the offset within that block's uncompressed data.
+"""
+
+import collections
+import struct
+import zlib
+from multiprocessing.pool import ThreadPool
+
+# maximum amount of uncompressed data per block - the same as htslib's, which leaves room for incompressible data
+BGZF_BLOCK_SIZE = 0xff00
+
+# gzip header with the FEXTRA flag set, and a 'BC' extra subfield whose 2-byte value (the total block size - 1)
+# follows immediately after
+_BLOCK_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+
+BGZF_EOF_BLOCK = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00'
+                  b'\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def compress_block(data, compresslevel=6):
+    """Returns a complete BGZF block containing data, which must be at most BGZF_BLOCK_SIZE bytes"""
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)  # raw deflate, without a zlib header
+    compressed = compressor.compress(data) + compressor.flush()
+    return (_BLOCK_HEADER + struct.pack('<H', len(_BLOCK_HEADER) + 2 + len(compressed) + 8 - 1) + compressed +
+            struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)))
+
+
+class BgzfWriter(object):
+    """File-like object that BGZF-compresses what's written to it.
+
+    Example:
+        with BgzfWriter('table.tsv.gz') as f:
+            f.write(b'...')
+    """
+
+    def __init__(self, filename=None, fileobj=None, compresslevel=6, threads=1):
+        """
+        Args:
+            filename: Path of the output file. Ignored if fileobj is given.
+            fileobj: Open binary file object to write the compressed data to. It's not closed by close().
+            compresslevel: zlib compression level, 1 to 9
+            threads: Number of threads to compress blocks with. zlib releases the GIL while compressing, so blocks are
+                compressed in parallel, and written in order.
+        """
+        if fileobj is None:
+            fileobj = open(filename, 'wb')
+            self._owns_fileobj = True
+        else:
+            self._owns_fileobj = False
+        self.fileobj = fileobj
+        self.name = filename if filename is not None else getattr(fileobj, 'name', None)
+        self.compresslevel = compresslevel
+        self.closed = False
+
+        self._buffer = []
+        self._buffer_size = 0  # always < BGZF_BLOCK_SIZE between calls
+        self._compressed_offset = 0  # number of compressed bytes written so far
+        self.block_offsets = []  # file offset of each block written so far
+        self._block_count = 0  # number of blocks written or being compressed
+        self._pool = ThreadPool(threads) if threads > 1 else None
+        self._max_pending = 4 * threads
+        self._pending = collections.deque()
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        if self._buffer_size >= BGZF_BLOCK_SIZE:
+            data = b''.join(self._buffer)
+            end = len(data) - len(data) % BGZF_BLOCK_SIZE
+            for start in range(0, end, BGZF_BLOCK_SIZE):
+                self._write_block(data[start:start + BGZF_BLOCK_SIZE])
+            self._buffer = [data[end:]]
+            self._buffer_size = len(data) - end
+
+    def _write_block(self, data):
+        self._block_count += 1
+        if self._pool is None:
+            self._write_compressed(compress_block(data, self.compresslevel))
+            return
+        self._pending.append(self._pool.apply_async(compress_block, (data, self.compresslevel)))
+        while len(self._pending) > self._max_pending:
+            self._write_compressed(self._pending.popleft().get())
+
+    def _write_compressed(self, block):
+        self.fileobj.write(block)
+        self.block_offsets.append(self._compressed_offset)
+        self._compressed_offset += len(block)
+
+    def _wait(self):
+        while self._pending:
+            self._write_compressed(self._pending.popleft().get())
+
+    def tell(self):
+        """Returns the virtual offset that the next byte written will be at"""
+        self._wait()
+        return (self._compressed_offset << 16) | self._buffer_size
+
+    def tell_block(self):
+        """Returns the number of the block that the next byte written will be in, and its offset in that block,
+        without waiting for blocks that are being compressed. See get_virtual_offset.
+        """
+        return self._block_count, self._buffer_size
+
+    def get_virtual_offset(self, block_number, offset):
+        """Returns the virtual offset for a position from tell_block. Only valid once the block was written, eg. after
+        close().
+        """
+        if block_number == len(self.block_offsets):
+            return (self._compressed_offset << 16) | offset
+        return (self.block_offsets[block_number] << 16) | offset
+
+    def flush(self):
+        """Write out any buffered data as a (possibly short) block"""
+        if self._buffer_size:
+            self._write_block(b''.join(self._buffer))
+            self._buffer = []
+            self._buffer_size = 0
+        self._wait()
+        self.fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+            self.fileobj.write(BGZF_EOF_BLOCK)
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+            if self._owns_fileobj:
+                self.fileobj.close()
+            else:
+                self.fileobj.flush()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BgzfReader(object):
+    """Read-only file-like object for a BGZF file that supports seeking to virtual offsets.
+
+    Example:
+        with BgzfReader('release.xml.bgz') as f:
+            f.seek(virtual_offset)
+            data = f.read(length)
+    """
+
+    def __init__(self, filename=None, fileobj=None):
+        if fileobj is None:
+            fileobj = open(filename, 'rb')
+            self._owns_fileobj = True
+        else:
+            self._owns_fileobj = False
+        self.fileobj = fileobj
+        self.name = filename if filename is not None else getattr(fileobj, 'name', None)
+
+        self._load_block(0)
+
+    def _load_block(self, start):
+        """Read and decompress the block that starts at file offset start"""
+        self.fileobj.seek(start)
+        header = self.fileobj.read(len(_BLOCK_HEADER) + 2)
+        self._block_start = start
+        self._offset = 0
+        if not header:
+            self._block = b''  # end of file
+            self._next_block_start = start
+            return
+
+        if len(header) < len(_BLOCK_HEADER) + 2 or header[:4] != _BLOCK_HEADER[:4] or header[12:14] != b'BC':
+            raise IOError("%s: not a BGZF block at offset %d" % (self.name, start))
+        block_size = struct.unpack('<H', header[-2:])[0] + 1
+        data = self.fileobj.read(block_size - len(header))
+        if len(data) != block_size - len(header):
+            raise IOError("%s: truncated BGZF block at offset %d" % (self.name, start))
+
+        self._block = zlib.decompress(data[:-8], -15)
+        self._next_block_start = start + block_size
+
+    def seek(self, virtual_offset):
+        block_start = virtual_offset >> 16
+        if block_start != self._block_start:
+            self._load_block(block_start)
+        self._offset = virtual_offset & 0xffff
+        if self._offset > len(self._block):
+            raise IOError("%s: virtual offset %d is past the end of its block" % (self.name, virtual_offset))
+
+    def tell(self):
+        """Returns the virtual offset of the next byte to be read"""
+        return (self._block_start << 16) | self._offset
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self._offset >= len(self._block):
+                if self._next_block_start == self._block_start:
+                    break  # end of file
+                self._load_block(self._next_block_start)
+                continue
+
+            end = len(self._block) if size < 0 else min(len(self._block), self._offset + size)
+            parts.append(self._block[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+
+        return b''.join(parts)
+
+    def readline(self):
+        """Returns the next line, including its newline, or b'' at the end of the file"""
+        parts = []
+        while True:
+            if self._offset >= len(self._block):
+                if self._next_block_start == self._block_start:
+                    break  # end of file
+                self._load_block(self._next_block_start)
+                continue
+
+            end = self._block.find(b'\n', self._offset) + 1
+            if end > 0:
+                parts.append(self._block[self._offset:end])
+                self._offset = end
+                break
+            parts.append(self._block[self._offset:])
+            self._offset = len(self._block)
+
+        return b''.join(parts)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        if self._owns_fileobj:
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,38 +1,74 @@
 #!/usr/bin/env python
-import pandas as pd
+import gzip
 import sys
+from collections import defaultdict
 
 """
 Summarizes some of the columns of clinvar_alleles.tsv.gz file
 Usage: python clinvar_alleles_stats.py <clinvar_alleles.tsv.gz>
 """
 
-alleles_name = sys.argv[1]
-
 columns_to_summarize = [
     'variation_type', 'clinical_significance',
     'review_status', 'gold_stars', 'all_submitters',
     'inheritance_modes', 'age_of_onset', 'prevalence', 'disease_mechanism',
     'origin']
 
-df = pd.read_csv(alleles_name, sep="\t", compression='gzip', index_col=False)
-
 sep = "=" * 16
 
-print "Columns:",
-for i, col in enumerate(df.columns, start=1):
-    print "{}: {},".format(i, col),
-print
 
-print sep
+def _display_width(value):
+    """Returns the number of characters of a value, which is UTF-8 encoded in python 2"""
+    return len(value.decode('utf-8', 'replace') if isinstance(value, bytes) else value)
+
+
+class AlleleStats(object):
+    """Counts the values of the summarized columns as the rows of the table are added, so that the table is only read
+    once, and isn't loaded into memory
+    """
+
+    def __init__(self, column_names):
+        self.column_names = column_names
+        self.rows = 0
+        self.value_counts = dict((col, defaultdict(int)) for col in columns_to_summarize)
+        self._column_indexes = [(col, column_names.index(col)) for col in columns_to_summarize]
+
+    def add(self, values):
+        """Count the values of a row, given as a list of strings. Empty values aren't counted."""
+        self.rows += 1
+        for col, i in self._column_indexes:
+            value = values[i] if i < len(values) else ''
+            if value:
+                self.value_counts[col][value] += 1
 
-print "Total rows:", df.shape[0]
+    def write(self, out):
+        out.write("Columns: " + " ".join("{}: {},".format(i, col) for i, col in enumerate(self.column_names, start=1))
+                  + "\n")
+        out.write(sep + "\n")
+        out.write("Total rows: {}\n".format(self.rows))
+        for col, i in self._column_indexes:
+            out.write(sep + "\n")
+            out.write("column {}: {}\n".format(i + 1, col))
+            # most common first, like pandas' value_counts
+            counts = sorted(self.value_counts[col].items(), key=lambda item: (-item[1], item[0]))
+            if not counts:
+                out.write("Series([], Name: {}, dtype: int64)\n".format(col))
+                continue
+            # values are padded to the same number of characters, not bytes, like pandas pads them
+            width = max([_display_width(value) for value, _ in counts] + [0])
+            count_width = max([len(str(count)) for _, count in counts] + [0])
+            for value, count in counts:
+                out.write("{}{}    {}\n".format(value, " " * (width - _display_width(value)),
+                                                str(count).rjust(count_width)))
+            out.write("Name: {}, dtype: int64\n".format(col))
 
-all_columns = list(df.columns)
 
-for col in columns_to_summarize:
-    print sep
-    i = all_columns.index(col)
-    print "column {}: {}".format(i + 1, col)
-    print df[col].value_counts()
+if __name__ == '__main__':
+    alleles_name = sys.argv[1]
 
+    f = gzip.open(alleles_name) if alleles_name.endswith('.gz') else open(alleles_name)
+    stats = AlleleStats(next(f).rstrip('\n').split('\t'))
+    for line in f:
+        stats.add(line.rstrip('\n').split('\t'))
+    f.close()
+    stats.write(sys.stdout)
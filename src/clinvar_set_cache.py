@@ -0,0 +1,208 @@
+"""
+Persistent cache of the rows that parse_clinvar_xml.py extracted from each ClinVarSet in the previous release, keyed
+by RCV accession. Most ClinVarSets don't change from one monthly release to the next, so when a ClinVarSet's raw XML
+has the same hash as last time, its rows can be reused instead of being parsed again.
+
+The cache is a sqlite database. Each run writes a new database next to the old one with just the ClinVarSets in the
+current release, and renames it over the old one at the end, so an interrupted run leaves the previous cache intact.
+
+Each database gets a new random generation id. The list of changed RCVs is relative to the previous generation, so
+files derived from the cache, like master.py's cached normalized table, can be stamped with the generation they were
+made from, and only be updated incrementally if that's the previous generation. The stamp can also have a version of
+the code and other inputs the file was made with, so that it's made again in full when they change.
+"""
+
+import json
+import os
+import sqlite3
+import uuid
+
+CACHE_VERSION = 1
+
+# first line of the changed RCVs file: the previous generation of the cache, and the new one
+GENERATION_LINE = '#generation\t%s\t%s\n'
+
+# second line of the stamp of a file derived from the cache: the version of what else it was made from
+VERSION_LINE = '#version\t%s\n'
+
+
+class ClinVarSetCache(object):
+
+    def __init__(self, path, genome_builds, parser_version):
+        """
+        Args:
+            path: sqlite database file. It's created if it doesn't exist yet.
+            genome_builds: list of genome builds being extracted. The cache is only reused if these are the same as
+                in the previous run.
+            parser_version: a hash of the parsing code. The cache is only reused if this is the same as in the
+                previous run, since changes to the parser can change the rows of every ClinVarSet.
+        """
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.meta = json.dumps({'cache_version': CACHE_VERSION,
+                                'genome_builds': list(genome_builds),
+                                'parser_version': parser_version}, sort_keys=True)
+
+        self.changed_rcvs = set()
+        self.reused_count = 0
+        self.generation = uuid.uuid4().hex
+        self.previous_generation = None
+
+        if os.path.isfile(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.db = sqlite3.connect(self.tmp_path)
+        self.db.execute("CREATE TABLE meta (value TEXT)")
+        self.db.execute("INSERT INTO meta VALUES (?)", (self.meta,))
+        self.db.execute("CREATE TABLE generation (value TEXT)")
+        self.db.execute("INSERT INTO generation VALUES (?)", (self.generation,))
+        self.db.execute("CREATE TABLE clinvar_sets (rcv TEXT PRIMARY KEY, sha1 TEXT, rows TEXT)")
+
+        self.has_previous = False
+        if os.path.isfile(path):
+            self.db.execute("ATTACH DATABASE ? AS previous", (path,))
+            try:
+                previous_meta = self.db.execute("SELECT value FROM previous.meta").fetchone()
+            except sqlite3.DatabaseError:
+                previous_meta = None
+            self.has_previous = previous_meta is not None and previous_meta[0] == self.meta
+            if self.has_previous:
+                try:
+                    previous_generation = self.db.execute("SELECT value FROM previous.generation").fetchone()
+                except sqlite3.DatabaseError:
+                    previous_generation = None  # a cache from before generations were added
+                if previous_generation is not None:
+                    self.previous_generation = previous_generation[0]
+
+    def get(self, rcv, sha1):
+        """Returns the cached result for this ClinVarSet if its raw XML had the same sha1 hash in the previous
+        release, or None otherwise. The result is a dictionary with 'events' and 'skipped' keys - see put(..).
+        """
+        if not self.has_previous:
+            return None
+
+        row = self.db.execute("SELECT rows FROM previous.clinvar_sets WHERE rcv = ? AND sha1 = ?",
+                              (rcv, sha1)).fetchone()
+        if row is None:
+            return None
+
+        return _decode_result(row[0])
+
+    def put(self, rcv, sha1, result, reused=False):
+        """Record the result for this ClinVarSet in the new cache.
+
+        Args:
+            rcv: RCV accession
+            sha1: hash of the ClinVarSet's raw XML
+            result: dictionary with an 'events' list (log messages, and (genome_build, is_multi, line) tuples for
+                the rows) and a 'skipped' dictionary of skip counts by reason
+            reused: True if result came from get(..) rather than from parsing the ClinVarSet again
+        """
+        self.db.execute("INSERT OR REPLACE INTO clinvar_sets VALUES (?, ?, ?)", (rcv, sha1, _encode_result(result)))
+        if reused:
+            self.reused_count += 1
+        else:
+            self.changed_rcvs.add(rcv)
+
+    def commit(self):
+        """Replace the previous cache with the new one.
+
+        Returns:
+            sorted list of the RCVs that are new or changed since the previous release, or that were removed from it.
+            Without a usable previous cache, it's every RCV in the release, and previous_generation is None.
+        """
+        if self.has_previous:
+            self.changed_rcvs.update(rcv for (rcv,) in self.db.execute(
+                "SELECT rcv FROM previous.clinvar_sets WHERE rcv NOT IN (SELECT rcv FROM main.clinvar_sets)"))
+            self.db.commit()
+            self.db.execute("DETACH DATABASE previous")
+        self.db.commit()
+        self.db.close()
+        os.rename(self.tmp_path, self.path)
+
+        self.changed_rcvs = sorted(self.changed_rcvs)
+        return self.changed_rcvs
+
+    def write_changed_rcvs(self, path):
+        """Write the changed RCVs from commit(), one per line, after a line with the previous and new generations
+        (see read_changed_rcvs)
+        """
+        with open(path, 'w') as f:
+            f.write(GENERATION_LINE % (self.previous_generation or '', self.generation))
+            for rcv in self.changed_rcvs:
+                f.write(rcv + '\n')
+
+
+def read_generation(path):
+    """Returns the (previous generation or None, generation) of a file written by write_changed_rcvs, from its first
+    line, or None if the file doesn't exist or doesn't start with one
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        fields = f.readline().rstrip('\n').split('\t')
+    if len(fields) != 3 or fields[0] != GENERATION_LINE.split('\t')[0]:
+        return None
+    return fields[1] or None, fields[2]
+
+
+def read_stamp_version(path):
+    """Returns the version from the VERSION_LINE of a stamp, or None if the file doesn't exist or doesn't have one"""
+    if not os.path.isfile(path):
+        return None
+    prefix = VERSION_LINE.split('\t')[0] + '\t'
+    with open(path) as f:
+        for line in f:
+            if line.startswith(prefix):
+                return line[len(prefix):].rstrip('\n')
+    return None
+
+
+def read_changed_rcvs(path, table_generation_path=None, table_version=None):
+    """Read a file written by write_changed_rcvs.
+
+    Args:
+        path: the file
+        table_generation_path: Optional stamp of a table derived from the previous cache, which starts with a copy of
+            the first line of the changed RCVs file of the run that made the table. If given, the changed RCVs are only
+            returned if the table was made from the generation they're relative to.
+        table_version: Optional version of the code and inputs the table would be made with now. If given, the
+            changed RCVs are only returned if the stamp has the same version.
+
+    Returns:
+        set of the changed RCVs, or None if every RCV has to be treated as changed
+    """
+    with open(path) as f:
+        rcvs = set(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    if table_generation_path is None:
+        return rcvs
+    previous_generation, _ = read_generation(path) or (None, None)
+    table_generation = read_generation(table_generation_path)
+    if previous_generation is None or table_generation is None or table_generation[1] != previous_generation:
+        return None
+    if table_version is not None and read_stamp_version(table_generation_path) != table_version:
+        return None
+    return rcvs
+
+
+def _encode_result(result):
+    events = []
+    for event in result['events']:
+        if isinstance(event, tuple):
+            build, is_multi, line = event
+            event = [build, is_multi, line.decode('utf-8')]
+        events.append(event)
+
+    return json.dumps({'events': events, 'skipped': result['skipped']})
+
+
+def _decode_result(value):
+    result = json.loads(value)
+    events = []
+    for event in result['events']:
+        if isinstance(event, list):
+            build, is_multi, line = event
+            event = (str(build), is_multi, line.encode('utf-8'))
+        events.append(event)
+    result['events'] = events
+
+    return result
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+"""
+Download a file over HTTP(S) or FTP, in several segments at the same time when the server supports byte ranges (HTTP
+Range requests or FTP REST).
+
+The file is written to <path>.part, and the progress of each segment is saved in <path>.part.json, so that an
+interrupted download is resumed where it stopped, by the retries within a run or by running the download again. A
+partial file is only resumed if the remote file's size and ETag / Last-Modified time (or MDTM on FTP) haven't changed.
+Once all segments are complete, the size and, if given, the MD5 checksum are checked before the file is renamed to
+<path>.
+
+Usage:
+    python download.py https://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/ClinVarFullRelease_00-latest.xml.gz \
+        -o ClinVarFullRelease_00-latest.xml.gz --md5-url auto -n 4
+"""
+
+from __future__ import print_function
+
+import argparse
+import ftplib
+import hashlib
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+try:
+    from urllib2 import Request, urlopen
+    from urlparse import urlparse
+    from httplib import HTTPException
+except ImportError:
+    from urllib.request import Request, urlopen
+    from urllib.parse import urlparse
+    from http.client import HTTPException
+
+BLOCK_SIZE = 2**16
+
+# don't split files into segments smaller than this
+MIN_SEGMENT_SIZE = 2**23
+
+# save the progress of a segment after every this many bytes
+SAVE_INTERVAL = 2**24
+
+TRANSFER_ERRORS = (EnvironmentError, socket.error, HTTPException) + ftplib.all_errors
+
+
+class DownloadError(Exception):
+    pass
+
+
+class _StopTransfer(Exception):
+    pass
+
+
+def parse_md5(text):
+    """Returns the MD5 checksum in the contents of a .md5 file, like 'MD5 (file.gz) = <md5>' or '<md5>  file.gz'"""
+    match = re.search(r'\b([0-9a-fA-F]{32})\b', text)
+    if match is None:
+        raise DownloadError("No MD5 checksum found in: %r" % text[:200])
+    return match.group(1).lower()
+
+
+def md5_file(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(2**20)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _ftp_connect(url, timeout):
+    parsed = urlparse(url)
+    ftp = ftplib.FTP()
+    ftp.connect(parsed.hostname, parsed.port or 21, timeout=timeout)
+    ftp.login(parsed.username or 'anonymous', parsed.password or '')
+    ftp.voidcmd('TYPE I')
+    return ftp, parsed.path
+
+
+def get_remote_info(url, timeout=60):
+    """Returns a dictionary with the remote file's 'size' (None if unknown), whether it supports byte 'ranges', and a
+    'validator' string that changes when the file does (None if unknown)
+    """
+    if urlparse(url).scheme == 'ftp':
+        ftp, path = _ftp_connect(url, timeout)
+        try:
+            size = ftp.size(path)
+            try:
+                validator = ftp.sendcmd('MDTM ' + path)[4:].strip()
+            except ftplib.error_perm:
+                validator = None
+        finally:
+            ftp.close()
+        return {'size': size, 'ranges': size is not None, 'validator': validator}
+
+    request = Request(url)
+    request.get_method = lambda: 'HEAD'
+    response = urlopen(request, timeout=timeout)
+    headers = response.info()
+    size = headers.get('Content-Length')
+    response.close()
+    return {
+        'size': int(size) if size else None,
+        'ranges': headers.get('Accept-Ranges', '').lower() == 'bytes',
+        'validator': headers.get('ETag') or headers.get('Last-Modified'),
+    }
+
+
+def read_range(url, start, end, write, timeout=60):
+    """Pass the bytes of the remote file from start up to end (or the end of the file if end is None) to write(block)
+    in blocks. A non-zero start or an end requires the server to support byte ranges.
+    """
+    if urlparse(url).scheme == 'ftp':
+        ftp, path = _ftp_connect(url, timeout)
+        remaining = [end - start if end is not None else None]
+
+        def callback(block):
+            if remaining[0] is not None:
+                block = block[:remaining[0]]
+                remaining[0] -= len(block)
+            write(block)
+            if remaining[0] == 0:
+                raise _StopTransfer()
+
+        try:
+            ftp.retrbinary('RETR ' + path, callback, blocksize=BLOCK_SIZE, rest=start or None)
+        except _StopTransfer:
+            pass
+        finally:
+            ftp.close()  # not quit(), since an aborted transfer leaves the control connection waiting for a reply
+        return
+
+    request = Request(url)
+    is_range = start > 0 or end is not None
+    if is_range:
+        request.add_header('Range', 'bytes=%d-%s' % (start, end - 1 if end is not None else ''))
+    response = urlopen(request, timeout=timeout)
+    try:
+        if is_range and response.getcode() != 206:
+            raise DownloadError("%s: the server ignored the Range header" % url)
+        while True:
+            block = response.read(BLOCK_SIZE)
+            if not block:
+                break
+            write(block)
+    finally:
+        response.close()
+
+
+def read_text(url, timeout=60):
+    blocks = []
+    read_range(url, 0, None, blocks.append, timeout=timeout)
+    return b''.join(blocks).decode('utf-8', 'replace')
+
+
+def _split(size, segments, min_segment_size):
+    """Returns [start, end, bytes done] lists for up to the given number of segments of a file of this size"""
+    segments = max(1, min(segments, size // max(min_segment_size, 1)))
+    bounds = [size * i // segments for i in range(segments + 1)]
+    return [[bounds[i], bounds[i + 1], 0] for i in range(segments)]
+
+
+def download(url, path, segments=4, md5=None, md5_url=None, retries=5, timeout=60, min_segment_size=MIN_SEGMENT_SIZE,
+             log=None):
+    """Download url to path.
+
+    Args:
+        url: http://, https:// or ftp:// URL
+        path: Local path to write the file to. Any existing file is replaced once the download is complete.
+        segments: Maximum number of parts of the file to download at the same time
+        md5: Optional expected MD5 checksum of the file
+        md5_url: Optional URL of a .md5 file to get the expected checksum from
+        retries: Number of times to retry each segment after a transfer error, continuing from where it stopped
+        timeout: Socket timeout in seconds
+        min_segment_size: Minimum size in bytes of each segment
+        log: Optional function to call with a line of progress
+
+    Raises:
+        DownloadError: if a segment still fails after the retries (the partial file is kept to resume from), or the
+            downloaded file has the wrong size or checksum (it's removed)
+    """
+    log = log or (lambda message: None)
+    if md5_url:
+        md5 = parse_md5(read_text(md5_url, timeout=timeout))
+    info = get_remote_info(url, timeout=timeout)
+    part_path = path + '.part'
+    state_path = path + '.part.json'
+
+    state = None
+    if os.path.isfile(state_path) and os.path.isfile(part_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if [state['url'], state['size'], state['validator']] != [url, info['size'], info['validator']] or (
+                info['validator'] is None or not info['ranges']):
+            log("The remote file changed or can't be resumed, starting %s again" % path)
+            state = None
+        else:
+            log("Resuming %s with %d of %s bytes done" % (path, sum(s[2] for s in state['segments']), info['size']))
+    if state is None:
+        if info['size'] is not None and info['ranges']:
+            segment_list = _split(info['size'], segments, min_segment_size)
+        else:
+            segment_list = [[0, info['size'], 0]]
+        state = {'url': url, 'size': info['size'], 'validator': info['validator'], 'segments': segment_list}
+        with open(part_path, 'wb') as f:
+            if info['size'] is not None:
+                f.truncate(info['size'])
+
+    lock = threading.Lock()
+    failures = []
+
+    def save_state():
+        with lock:
+            with open(state_path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.rename(state_path + '.tmp', state_path)
+
+    def fetch_segment(segment):
+        start, end = segment[0], segment[1]
+        for attempt in range(retries + 1):
+            if end is not None and start + segment[2] >= end:
+                return
+            if segment[2] and not info['ranges']:
+                segment[2] = 0  # can only start again from the beginning
+            try:
+                with open(part_path, 'r+b') as f:
+                    f.seek(start + segment[2])
+                    last_saved = [segment[2]]
+
+                    def write(block):
+                        f.write(block)
+                        segment[2] += len(block)
+                        if segment[2] - last_saved[0] >= SAVE_INTERVAL:
+                            f.flush()
+                            save_state()
+                            last_saved[0] = segment[2]
+
+                    # without byte ranges, the only segment is the whole file, which is read to the end
+                    read_range(url, start + segment[2], end if info['ranges'] else None, write, timeout=timeout)
+                    if end is None:
+                        f.truncate(start + segment[2])
+                        return
+                if start + segment[2] >= end:
+                    return
+                error = "connection closed after %d of %d bytes" % (segment[2], end - start)
+            except TRANSFER_ERRORS as e:
+                error = str(e) or type(e).__name__
+            except DownloadError as e:
+                failures.append(str(e))
+                return
+            finally:
+                save_state()
+            if attempt < retries:
+                log("Retrying bytes %d-%s of %s after error: %s" % (start + segment[2], end if end is not None else '',
+                                                                   url, error))
+                time.sleep(min(2**attempt, 30))
+        failures.append("bytes %d-%s: %s" % (start + segment[2], end if end is not None else '', error))
+
+    def run_segment(segment):
+        # any other error would otherwise only end the thread, and the incomplete file would be checked as if it was
+        # complete
+        try:
+            fetch_segment(segment)
+        except Exception as e:
+            failures.append("bytes %d-%s: %s: %s" % (segment[0] + segment[2], segment[1] if segment[1] is not None
+                                                     else '', type(e).__name__, e))
+
+    log("Downloading %s to %s in %d segment(s)" % (url, path, len(state['segments'])))
+    start_time = time.time()
+    threads = [threading.Thread(target=run_segment, args=(segment,)) for segment in state['segments']]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise DownloadError("Download of %s failed, run again to resume:\n  %s" % (url, "\n  ".join(failures)))
+
+    size = os.path.getsize(part_path)
+    if info['size'] is not None and size != info['size']:
+        os.remove(part_path)
+        os.remove(state_path)
+        raise DownloadError("%s: downloaded %d bytes instead of %d" % (url, size, info['size']))
+    if md5 is not None:
+        actual_md5 = md5_file(part_path)
+        if actual_md5 != md5.lower():
+            os.remove(part_path)
+            os.remove(state_path)
+            raise DownloadError("%s: MD5 checksum is %s instead of %s" % (url, actual_md5, md5))
+    os.rename(part_path, path)
+    os.remove(state_path)
+    seconds = time.time() - start_time
+    log("Downloaded %d bytes in %.1f s (%.1f MB/s)" % (size, seconds, size / 2.0**20 / max(seconds, 1e-3)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download a file in parallel segments, resuming partial downloads')
+    parser.add_argument('url', help="http://, https:// or ftp:// URL of the file")
+    parser.add_argument('-o', '--output', help="Path to write the file to. Default: the file name from the URL")
+    parser.add_argument('-n', '--segments', type=int, default=4, help="Number of segments to download at the same time")
+    parser.add_argument('--md5', help="Expected MD5 checksum of the file")
+    parser.add_argument('--md5-url', help="URL of a .md5 file with the expected checksum, or 'auto' for <url>.md5")
+    parser.add_argument('--retries', type=int, default=5, help="Number of times to retry a segment after an error")
+    parser.add_argument('--timeout', type=float, default=60, help="Socket timeout in seconds")
+    args = parser.parse_args()
+
+    md5_url = args.url + '.md5' if args.md5_url == 'auto' else args.md5_url
+    try:
+        download(args.url, args.output or os.path.basename(urlparse(args.url).path), segments=args.segments,
+                 md5=args.md5, md5_url=md5_url, retries=args.retries, timeout=args.timeout,
+                 log=lambda message: sys.stderr.write(message + '\n'))
+    except DownloadError as e:
+        sys.exit("ERROR: %s" % e)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""
+Export a clinvar_allele_trait_pairs or clinvar_alleles table to a Parquet dataset, so that it can be read with typed
+columns instead of parsing the text and guessing the dtypes each time, eg. with
+pandas.read_parquet('clinvar_alleles.single.b37.parquet').
+
+The dataset is partitioned by chromosome, as a directory with one file per chromosome (like Hive and Spark do):
+    clinvar_alleles.single.b37.parquet/chrom=1/part-0.parquet
+    clinvar_alleles.single.b37.parquet/chrom=2/part-0.parquet
+    ...
+    clinvar_alleles.single.b37.parquet/_common_metadata
+
+Column types:
+    pos, the pathogenic .. benign counts, gold_stars and conflicted - 64-bit integers, empty if the table has '' or '-'
+    clinical_significance and review_status - dictionary-encoded strings (categoricals in pandas)
+    chrom, ref, alt and last_evaluated - strings
+    the other columns of parse_clinvar_xml.py's HEADER - lists of strings, split on ';' (any of them can have several
+        values in clinvar_alleles, where group_by_allele.py joins the values of the rows for each allele)
+    any other columns, eg. from add_gnomad_fields.py - strings
+
+Usage:
+    python export_parquet.py -i clinvar_alleles.single.b37.tsv.gz -o clinvar_alleles.single.b37.parquet
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import sys
+
+from parse_clinvar_xml import HEADER
+
+INT_COLUMNS = ['pos', 'pathogenic', 'likely_pathogenic', 'uncertain_significance', 'likely_benign', 'benign',
+               'gold_stars', 'conflicted']
+DICTIONARY_COLUMNS = ['clinical_significance', 'review_status']
+STRING_COLUMNS = ['chrom', 'ref', 'alt', 'last_evaluated']
+LIST_COLUMNS = [column for column in HEADER if column not in INT_COLUMNS + DICTIONARY_COLUMNS + STRING_COLUMNS]
+
+PARTITION_COLUMN = 'chrom'
+
+# values of the integer columns that mean the value is missing
+MISSING_VALUES = frozenset(['', '-', 'nan', 'NA'])
+
+
+def get_column_type(column_name):
+    """Returns 'int', 'dictionary', 'list' or 'string'"""
+    if column_name in INT_COLUMNS:
+        return 'int'
+    if column_name in DICTIONARY_COLUMNS:
+        return 'dictionary'
+    if column_name in LIST_COLUMNS:
+        return 'list'
+    return 'string'
+
+
+def parse_int(value):
+    if value in MISSING_VALUES:
+        return None
+    # pandas writes integer columns with missing values as floats, eg. 2.0
+    return int(float(value)) if '.' in value else int(value)
+
+
+def parse_list(value):
+    return [v for v in value.split(';') if v]
+
+
+PARSERS = {
+    'int': parse_int,
+    'dictionary': lambda value: value or None,
+    'list': parse_list,
+    'string': lambda value: value or None,
+}
+
+
+def parse_columns(rows, column_names):
+    """Returns a dictionary of column name -> list of the parsed values in the rows.
+
+    Args:
+        rows: list of lists of the values in each row, as strings
+        column_names: the table's column names
+    """
+    columns = {}
+    for i, column_name in enumerate(column_names):
+        parse = PARSERS[get_column_type(column_name)]
+        try:
+            columns[column_name] = [parse(row[i]) for row in rows]
+        except ValueError as e:
+            raise ValueError("Column %s: %s" % (column_name, e))
+    return columns
+
+
+def get_schema(column_names):
+    """Returns the pyarrow schema of the Parquet files, which don't include the partition column"""
+    import pyarrow as pa
+
+    types = {
+        'int': pa.int64(),
+        'dictionary': pa.dictionary(pa.int32(), pa.string()),
+        'list': pa.list_(pa.string()),
+        'string': pa.string(),
+    }
+    return pa.schema([pa.field(column_name, types[get_column_type(column_name)])
+                      for column_name in column_names if column_name != PARTITION_COLUMN])
+
+
+class ParquetExporter(object):
+    """Writes the rows of a table to a Parquet dataset partitioned by chromosome, as they're added.
+
+    The dataset is written to a temporary directory next to dataset_dir, which replaces dataset_dir when the exporter
+    is closed.
+    """
+
+    def __init__(self, dataset_dir, column_names, batch_size=100000, compression='snappy'):
+        """
+        Args:
+            dataset_dir: Output directory
+            column_names: The table's column names
+            batch_size: Number of rows to convert at a time. Each batch is written as a row group in the file of each
+                chromosome it contains, so the table doesn't need to be sorted, but sorted tables make fewer, larger
+                row groups.
+            compression: Parquet compression codec, eg. 'snappy', 'gzip' or 'zstd'
+        """
+        if PARTITION_COLUMN not in column_names:
+            raise ValueError("The table doesn't have a %s column" % PARTITION_COLUMN)
+        self.dataset_dir = dataset_dir
+        self.column_names = column_names
+        self.batch_size = batch_size
+        self.compression = compression
+        self.schema = get_schema(column_names)
+        self.rows = 0
+        self._batch = []
+        self._writers = {}
+        self._tmp_dir = '%s.tmp.%d' % (dataset_dir.rstrip('/'), os.getpid())
+        os.makedirs(self._tmp_dir)
+
+    def add(self, values):
+        """Add a row, given as a list of strings"""
+        if len(values) != len(self.column_names):
+            raise ValueError("Line %d has %d columns instead of %d" % (
+                self.rows + 2, len(values), len(self.column_names)))
+        self._batch.append(values)
+        self.rows += 1
+        if len(self._batch) >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        chrom_column = self.column_names.index(PARTITION_COLUMN)
+        rows_by_chrom = {}
+        for row in self._batch:
+            rows_by_chrom.setdefault(row[chrom_column], []).append(row)
+        self._batch = []
+
+        for chrom, chrom_rows in rows_by_chrom.items():
+            columns = parse_columns(chrom_rows, self.column_names)
+            arrays = []
+            for field in self.schema:
+                if pa.types.is_dictionary(field.type):
+                    arrays.append(pa.array(columns[field.name], type=pa.string()).dictionary_encode())
+                else:
+                    arrays.append(pa.array(columns[field.name], type=field.type))
+            table = pa.Table.from_arrays(arrays, schema=self.schema)
+            if chrom not in self._writers:
+                partition_dir = os.path.join(self._tmp_dir, '%s=%s' % (PARTITION_COLUMN, chrom))
+                os.makedirs(partition_dir)
+                self._writers[chrom] = pq.ParquetWriter(os.path.join(partition_dir, 'part-0.parquet'), self.schema,
+                                                        compression=self.compression)
+            self._writers[chrom].write_table(table)
+
+    def close(self):
+        """Write the rest of the rows, and move the dataset to dataset_dir"""
+        import pyarrow.parquet as pq
+
+        try:
+            if self._batch:
+                self._write_batch()
+            for writer in self._writers.values():
+                writer.close()
+            pq.write_metadata(self.schema, os.path.join(self._tmp_dir, '_common_metadata'))
+        except Exception:
+            self.abort()
+            raise
+        if os.path.isdir(self.dataset_dir):
+            shutil.rmtree(self.dataset_dir)
+        os.rename(self._tmp_dir, self.dataset_dir)
+
+    def abort(self):
+        """Stop writing, and remove the temporary directory"""
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        if os.path.isdir(self._tmp_dir):
+            shutil.rmtree(self._tmp_dir)
+
+
+def export_parquet(infile, dataset_dir, batch_size=100000, compression='snappy'):
+    """Write the table to a Parquet dataset partitioned by chromosome. See ParquetExporter.
+
+    Args:
+        infile: Input file stream of the table, starting with the header line
+
+    Returns:
+        the number of rows written
+    """
+    exporter = ParquetExporter(dataset_dir, next(infile).rstrip('\n').split('\t'), batch_size=batch_size,
+                               compression=compression)
+    try:
+        for line in infile:
+            line = line.rstrip('\n')
+            if line:
+                exporter.add(line.split('\t'))
+    except Exception:
+        exporter.abort()
+        raise
+    exporter.close()
+    return exporter.rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a clinvar_alleles or clinvar_allele_trait_pairs table to a '
+                                                 'Parquet dataset partitioned by chromosome')
+    parser.add_argument('-i', '--infile', required=True, help="Path of the table. Can be gzipped.")
+    parser.add_argument('-o', '--output-dir', required=True, help="Directory to write the dataset to")
+    parser.add_argument('-c', '--compression', default='snappy', help="Parquet compression codec, eg. snappy or zstd")
+    parser.add_argument('-b', '--batch-size', type=int, default=100000, help="Number of rows to convert at a time")
+    args = parser.parse_args()
+
+    try:
+        import pyarrow
+    except ImportError as e:
+        sys.exit("ERROR: Python module not installed. %s. Please run 'pip install -r requirements.txt' " % e)
+
+    infile = gzip.open(args.infile) if args.infile.endswith('.gz') else open(args.infile)
+    with infile:
+        rows = export_parquet(infile, args.output_dir, batch_size=args.batch_size, compression=args.compression)
+    sys.stderr.write("Wrote %d rows to %s\n" % (rows, args.output_dir))
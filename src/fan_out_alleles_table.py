@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""
+Make all the files that are derived from a clinvar_alleles table in one read through it: the VCF and its tabix index,
+the example_750_rows files, the Parquet dataset and the stats, and run the checks of check_allele_table.py. Each of
+them would otherwise read and decompress the whole table again.
+
+The table is read in batches of lines, which are passed to each output in turn or, with --parallel, to a separate
+process for each output, so that formatting the VCF, counting the stats and converting to Parquet run at the same time.
+
+Usage:
+    python fan_out_alleles_table.py -i clinvar_alleles.single.b37.tsv.gz -R b37.fa \\
+        --vcf clinvar_alleles.single.b37.vcf.gz \\
+        --vcf-example clinvar_alleles_example_750_rows.single.b37.vcf \\
+        --table-example clinvar_alleles_example_750_rows.single.b37.tsv \\
+        --stats clinvar_alleles_stats.single.b37.txt \\
+        --parquet clinvar_alleles.single.b37.parquet \\
+        --check
+"""
+
+import argparse
+import functools
+import gzip
+import multiprocessing
+import sys
+import traceback
+
+try:
+    from Queue import Full
+except ImportError:
+    from queue import Full
+
+from check_allele_table import AlleleTableChecker
+from clinvar_alleles_stats import AlleleStats
+from clinvar_table_to_vcf import get_vcf_header, table_row_to_vcf_line
+from export_parquet import ParquetExporter
+from tabix_writer import TabixWriter
+
+EXAMPLE_ROWS = 750
+
+# number of batches that can wait for each output process before reading the table pauses
+MAX_PENDING_BATCHES = 4
+
+
+class ExampleWriter(object):
+    """Writes the first lines given to it to a file, like head -n"""
+
+    def __init__(self, path, lines=EXAMPLE_ROWS):
+        self.remaining = lines
+        self.file = open(path, 'w')
+
+    def write(self, data):
+        end = 0
+        while self.remaining > 0 and end < len(data):
+            end = data.find('\n', end) + 1 or len(data)
+            self.remaining -= 1
+        if end:
+            self.file.write(data[:end])
+
+    def close(self):
+        self.file.close()
+
+
+class TableOutput(object):
+    """Base class of the outputs. Each is given the header, then batches of lines of the table."""
+
+    def __init__(self, header):
+        self.column_names = header.rstrip('\n').split('\t')
+
+    def add_lines(self, lines):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def abort(self):
+        """Called instead of close if add_lines failed"""
+        pass
+
+
+class VcfOutput(TableOutput):
+    def __init__(self, header, path, reference_genome, example_path=None, threads=1):
+        super(VcfOutput, self).__init__(header)
+        self.writer = TabixWriter(path, preset='vcf', threads=threads)
+        self.example = ExampleWriter(example_path) if example_path else None
+        self._write(get_vcf_header(reference_genome))
+
+    def _write(self, data):
+        self.writer.write(data)
+        if self.example is not None:
+            self.example.write(data)
+
+    def add_lines(self, lines):
+        column_names = self.column_names
+        self._write(''.join(table_row_to_vcf_line(dict(zip(column_names, line.rstrip('\n').split('\t'))))
+                            for line in lines))
+
+    def close(self):
+        self.writer.close()
+        if self.example is not None:
+            self.example.close()
+
+    def abort(self):
+        self.writer.abort()
+
+
+class TableExampleOutput(TableOutput):
+    def __init__(self, header, path):
+        super(TableExampleOutput, self).__init__(header)
+        self.example = ExampleWriter(path)
+        self.example.write(header)
+
+    def add_lines(self, lines):
+        self.example.write(''.join(lines[:self.example.remaining]))
+
+    def close(self):
+        self.example.close()
+
+
+class StatsOutput(TableOutput):
+    def __init__(self, header, path):
+        super(StatsOutput, self).__init__(header)
+        self.path = path
+        self.stats = AlleleStats(self.column_names)
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.stats.add(line.rstrip('\n').split('\t'))
+
+    def close(self):
+        with open(self.path, 'w') as f:
+            self.stats.write(f)
+
+
+class CheckOutput(TableOutput):
+    def __init__(self, header, alleles_table_path):
+        super(CheckOutput, self).__init__(header)
+        self.checker = AlleleTableChecker(alleles_table_path, self.column_names)
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.checker.add(line.strip('\n').split('\t'))
+
+    def close(self):
+        self.checker.finish()
+
+
+class ParquetOutput(TableOutput):
+    def __init__(self, header, path, compression='snappy'):
+        super(ParquetOutput, self).__init__(header)
+        self.exporter = ParquetExporter(path, self.column_names, compression=compression)
+
+    def add_lines(self, lines):
+        for line in lines:
+            self.exporter.add(line.rstrip('\n').split('\t'))
+
+    def close(self):
+        self.exporter.close()
+
+    def abort(self):
+        self.exporter.abort()
+
+
+def _run_output(make_output, header, queue, result_queue):
+    """Runs an output in a separate process, until it's sent None instead of a batch of lines"""
+    error = None
+    try:
+        output = make_output(header)
+    except Exception:
+        error = traceback.format_exc()
+    while True:
+        lines = queue.get()
+        if lines is None:
+            break
+        if error is not None:
+            continue  # keep taking the batches, so that the reader isn't blocked
+        try:
+            output.add_lines(lines)
+        except Exception:
+            error = traceback.format_exc()
+            output.abort()
+    if error is None:
+        try:
+            output.close()
+        except Exception:
+            error = traceback.format_exc()
+    result_queue.put(error)
+
+
+def fan_out(infile, output_factories, parallel=False, batch_size=10000):
+    """Read a table once, and pass it to each output.
+
+    Args:
+        infile: Input file stream of the table, starting with the header line
+        output_factories: List of functions that take the table's header line and return a TableOutput. With
+            parallel=True, each one is called in the process that runs the output, so they need to be picklable, eg.
+            functools.partial objects.
+        parallel: Whether to run each output in a separate process
+        batch_size: Number of lines to read at a time
+
+    Raises:
+        RuntimeError: if any of the outputs failed, after all of them were given the whole table
+    """
+    header = next(infile)
+
+    def read_batches():
+        batch = []
+        for line in infile:
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    errors = []
+    if not parallel:
+        outputs = [make_output(header) for make_output in output_factories]
+        for batch in read_batches():
+            for output in list(outputs):
+                try:
+                    output.add_lines(batch)
+                except Exception:
+                    errors.append(traceback.format_exc())
+                    output.abort()
+                    outputs.remove(output)
+        for output in outputs:
+            try:
+                output.close()
+            except Exception:
+                errors.append(traceback.format_exc())
+    else:
+        result_queue = multiprocessing.Queue()
+        workers = []
+        for make_output in output_factories:
+            queue = multiprocessing.Queue(MAX_PENDING_BATCHES)
+            process = multiprocessing.Process(target=_run_output, args=(make_output, header, queue, result_queue))
+            process.daemon = True
+            process.start()
+            workers.append((process, queue))
+
+        def put(process, queue, item):
+            while True:
+                try:
+                    queue.put(item, timeout=1)
+                    return
+                except Full:
+                    if not process.is_alive():
+                        raise RuntimeError("An output process exited with code %s" % process.exitcode)
+
+        for batch in read_batches():
+            for process, queue in workers:
+                put(process, queue, batch)
+        for process, queue in workers:
+            put(process, queue, None)
+        for _ in workers:
+            error = result_queue.get()
+            if error is not None:
+                errors.append(error)
+        for process, _ in workers:
+            process.join()
+
+    if errors:
+        raise RuntimeError("%d output(s) failed:\n%s" % (len(errors), "\n".join(errors)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make the files derived from a clinvar_alleles table in one read')
+    parser.add_argument('-i', '--infile', required=True, help="Path of the clinvar_alleles table. Can be gzipped.")
+    parser.add_argument('-R', '--reference-genome', help=".fa genome reference file, whose .fai is used for the VCF header")
+    parser.add_argument('--vcf', help="Path to write the VCF to, and its tabix index to <vcf>.tbi. Requires -R.")
+    parser.add_argument('--vcf-example', help="Path to write the first 750 lines of the VCF to. Requires --vcf.")
+    parser.add_argument('--table-example', help="Path to write the first 750 lines of the table to")
+    parser.add_argument('--stats', help="Path to write the output of clinvar_alleles_stats.py to")
+    parser.add_argument('--parquet', help="Directory to write the Parquet dataset to, see export_parquet.py")
+    parser.add_argument('--check', action='store_true', help="Run the checks of check_allele_table.py on the table, "
+                        "and exit with an error after writing the other files if they fail")
+    parser.add_argument('--parallel', action='store_true', help="Run each output in a separate process")
+    parser.add_argument('-@', '--threads', type=int, default=1, help="Number of threads to compress the VCF with")
+    args = parser.parse_args()
+
+    if args.vcf and not args.reference_genome:
+        parser.error("--vcf requires -R")
+    if args.vcf_example and not args.vcf:
+        parser.error("--vcf-example requires --vcf")
+
+    output_factories = []
+    if args.vcf:
+        output_factories.append(functools.partial(VcfOutput, path=args.vcf, reference_genome=args.reference_genome,
+                                                  example_path=args.vcf_example, threads=args.threads))
+    if args.table_example:
+        output_factories.append(functools.partial(TableExampleOutput, path=args.table_example))
+    if args.stats:
+        output_factories.append(functools.partial(StatsOutput, path=args.stats))
+    if args.parquet:
+        output_factories.append(functools.partial(ParquetOutput, path=args.parquet))
+    if args.check:
+        output_factories.append(functools.partial(CheckOutput, alleles_table_path=args.infile))
+    if not output_factories:
+        parser.error("No outputs given")
+
+    infile = gzip.open(args.infile) if args.infile.endswith('.gz') else open(args.infile)
+    try:
+        fan_out(infile, output_factories, parallel=args.parallel)
+    except RuntimeError as e:
+        sys.exit("ERROR: %s" % e)
+    finally:
+        infile.close()
@@ -1,7 +1,12 @@
+import os
 import sys
 import re
 import gzip
 
+from bgzf import BgzfReader
+from index_clinvar_xml import get_index_path
+from parse_clinvar_xml import clinvarset_start_regex
+
 """
 Helper script to grab some variations by their ID from the master XML for
 testing purposes.
@@ -10,54 +15,93 @@ Usage:
         <ClinVarFullRelease.xml.gz> \
         <comma-separated list of variation IDs> \
         <out.xml.gz>
-"""
 
-in_xml = sys.argv[1]  # e.g. ClinVarFullRelease.xml.gz
-interesting_variations = set(sys.argv[2].split(","))
-# ^ comma-separated list of interesting variation IDs, e.g. 187175,188901
-out_xml = sys.argv[3]  # where to write, e.g. interesting.xml.gz
+If the XML is a BGZF copy made by index_clinvar_xml.py, and its index is next
+to it, the ClinVarSets are read with one seek each instead of reading through
+the whole release. The list can then also contain RCV accessions.
+"""
 
 variations_id_regex = re.compile(r'ID="(\d+)"')
 
-# input file could be gzipped or not, output file will have same status
-if in_xml.endswith(".gz"):
-    in_f = gzip.open(in_xml)
-    if not out_xml.endswith(".gz"):
-        out_xml += ".gz"
-    out_f = gzip.open(out_xml, 'w')
-else:
-    in_f = open(in_xml)
-    assert not out_xml.endswith(".gz")
-    out_f = open(out_xml, 'w')
-
-in_clinvarset = False
-interesting = False
-clinvarset = []
-out_f.write(next(in_f))  # <?xml>
-out_f.write(next(in_f))  # <RelaseSet>
-out_f.write("\n")
-
-for line in in_f:
-    if line.startswith("<ClinVarSet"):
-        in_clinvarset = True
-    elif line.startswith("</ClinVarSet>"):
-        if interesting:
-            out_f.write("".join(clinvarset))
-            out_f.write(line)
-            out_f.write("\n")
-        clinvarset = []
-        in_clinvarset = False
-        interesting = False
-        continue
+
+def grab_by_scanning(in_f, out_f, interesting_variations):
+    """Read through the whole XML, copying the ClinVarSets with a MeasureSet whose ID is in interesting_variations"""
+    in_clinvarset = False
+    interesting = False
+    clinvarset = []
+    out_f.write(next(in_f))  # <?xml>
+    out_f.write(next(in_f))  # <RelaseSet>
+    out_f.write("\n")
+
+    for line in in_f:
+        if line.startswith("<ClinVarSet"):
+            in_clinvarset = True
+        elif line.startswith("</ClinVarSet>"):
+            if interesting:
+                out_f.write("".join(clinvarset))
+                out_f.write(line)
+                out_f.write("\n")
+            clinvarset = []
+            in_clinvarset = False
+            interesting = False
+            continue
+        else:
+            if line.startswith("    <MeasureSet"):
+                m = variations_id_regex.search(line)
+                interesting = (interesting or
+                               (m and m.group(1) in interesting_variations))
+        if in_clinvarset:
+            clinvarset.append(line)
+
+    out_f.write("</ReleaseSet>\n")
+
+
+def grab_with_index(bgzf_path, out_f, interesting_ids):
+    """Copy the ClinVarSets whose RCV or any of whose variation IDs is in interesting_ids, using the index made by
+    index_clinvar_xml.py to seek straight to each one.
+    """
+    with open(get_index_path(bgzf_path)) as index_file:
+        columns = next(index_file).rstrip('\n').split('\t')
+        locations = []
+        for line in index_file:
+            row = dict(zip(columns, line.rstrip('\n').split('\t')))
+            if row['rcv'] in interesting_ids or interesting_ids.intersection(row['variation_ids'].split(',')):
+                locations.append((int(row['virtual_offset']), int(row['length'])))
+
+    with BgzfReader(bgzf_path) as reader:
+        # everything before the first ClinVarSet: the <?xml> declaration and the <ReleaseSet> start tag
+        start = reader.read(2**16)
+        out_f.write(start[:clinvarset_start_regex.search(start).start()])
+        out_f.write("\n")
+
+        for virtual_offset, length in sorted(locations):
+            reader.seek(virtual_offset)
+            out_f.write(reader.read(length))
+            out_f.write("\n\n")
+
+    out_f.write("</ReleaseSet>\n")
+
+
+if __name__ == '__main__':
+    in_xml = sys.argv[1]  # e.g. ClinVarFullRelease.xml.gz
+    interesting_variations = set(sys.argv[2].split(","))
+    # ^ comma-separated list of interesting variation IDs, e.g. 187175,188901
+    out_xml = sys.argv[3]  # where to write, e.g. interesting.xml.gz
+
+    # input file could be gzipped or not, output file will have same status
+    if in_xml.endswith(".gz") or in_xml.endswith(".bgz"):
+        if not out_xml.endswith(".gz"):
+            out_xml += ".gz"
+        out_f = gzip.open(out_xml, 'w')
     else:
-        if line.startswith("    <MeasureSet"):
-            m = variations_id_regex.search(line)
-            interesting = (interesting or
-                           (m and m.group(1) in interesting_variations))
-    if in_clinvarset:
-        clinvarset.append(line)
+        assert not out_xml.endswith(".gz")
+        out_f = open(out_xml, 'w')
 
-out_f.write("</ReleaseSet>\n")
+    if os.path.isfile(get_index_path(in_xml)):
+        grab_with_index(in_xml, out_f, interesting_variations)
+    else:
+        in_f = gzip.open(in_xml) if in_xml.endswith(".gz") else open(in_xml)
+        grab_by_scanning(in_f, out_f, interesting_variations)
+        in_f.close()
 
-in_f.close()
-out_f.close()
+    out_f.close()
@@ -2,13 +2,91 @@
 
 import argparse
 import gzip
+import multiprocessing
+import os
+import shutil
 import sys
+import tempfile
+import zlib
 
+from bgzf import BgzfReader
 from parse_clinvar_xml import HEADER
+from sort_table import parse_size, LINE_OVERHEAD
+from table_io import TableWriter, read_lines
+from tabix_writer import read_index, LINEAR_SHIFT
 # recommended usage:
 # ./group_by_allele.py < clinvar_combined.tsv > clinvar_alleles.tsv
 
 
+LOC_COLUMNS = ['chrom', 'pos', 'ref', 'alt']
+NUM_COLUMNS = ['pathogenic', 'likely_pathogenic', 'uncertain_significance', 'likely_benign', 'benign']
+INFO_COLUMNS = [x for x in HEADER if x not in LOC_COLUMNS and x not in NUM_COLUMNS]
+
+# with --jobs, the number of regions to split the table into for each process, so that they finish at about the same time
+SHARDS_PER_JOB = 4
+
+# with --unsorted, the number of files that rows are spilled to when they don't fit in the buffer, and how many times
+# the rows of a spill file can be spilled again if they still don't fit. Beyond that, they're grouped in memory.
+SPILL_PARTITIONS = 16
+MAX_SPILL_DEPTH = 3
+
+
+class AlleleAccumulator(object):
+    """Collects the rows of one allele: the values of the info columns in insertion-ordered sets, and the sums of the
+    count columns, so that each row is only split and added once, and the combined values are joined once, by
+    get_values.
+    """
+
+    def __init__(self, values, info_indexes, num_indexes):
+        """
+        Args:
+            values: list of the values of the allele's first row
+            info_indexes: indexes of the columns whose ;-separated values are combined
+            num_indexes: indexes of the columns whose values are added up
+        """
+        self.values = values
+        self.info_indexes = info_indexes
+        self.num_indexes = num_indexes
+        self.info_values = None  # column index -> (list of values, set of the same values), once there are 2 rows
+        self.sums = None
+
+    def _start_grouping(self):
+        self.info_values = {}
+        for i in self.info_indexes:
+            ordered_values = []
+            seen = set()
+            for value in self.values[i].split(';'):
+                if value and value not in seen:
+                    seen.add(value)
+                    ordered_values.append(value)
+            self.info_values[i] = (ordered_values, seen)
+        self.sums = dict((i, int(self.values[i])) for i in self.num_indexes)
+
+    def add(self, values):
+        """Add another row of the same allele"""
+        if self.info_values is None:
+            self._start_grouping()
+        for i in self.info_indexes:
+            ordered_values, seen = self.info_values[i]
+            for value in values[i].split(';'):
+                if value and value not in seen:
+                    seen.add(value)
+                    ordered_values.append(value)
+        for i in self.num_indexes:
+            self.sums[i] += int(values[i])
+
+    def get_values(self):
+        """Returns the list of the combined values. An allele with one row keeps its values as they were."""
+        if self.info_values is None:
+            return self.values
+        values = list(self.values)  # the other columns keep the values of the first row
+        for i, (ordered_values, _) in self.info_values.items():
+            values[i] = ';'.join(ordered_values)
+        for i, total in self.sums.items():
+            values[i] = str(total)
+        return values
+
+
 def group_by_allele(infile, outfile):
     """Run through a sorted clinvar_table.tsv file from the parse_clinvar_xml script, and make it unique on CHROM POS REF ALT
 
@@ -19,30 +97,243 @@ def group_by_allele(infile, outfile):
 
     header = next(infile)
     outfile.write(header)
-    column_names = header.strip('\n').split('\t')
+    if not _group_lines(infile, header.strip('\n').split('\t'), outfile):
+        raise ValueError("%s has 0 records" % infile)
 
-    last_data = None
-    last_unique_id = None
+
+def _split_row(line, n_columns):
+    values = line.strip('\n').split('\t')
+    if len(values) != n_columns:
+        if len(values) < n_columns:
+            raise ValueError("Line has %d columns instead of %d: %s" % (len(values), n_columns, line[:100]))
+        values = values[:n_columns]
+    return values
+
+
+def _group_lines(lines, column_names, outfile):
+    """Writes the grouped lines to outfile, and returns the number of alleles"""
+    out = TableWriter(outfile)
     counter = 0
+    for values in iter_grouped_rows(lines, column_names):
+        out.write_row(values)
+        counter += 1
+    out.close()
+    return counter
+
+
+def iter_grouped_rows(lines, column_names):
+    """Groups sorted lines by allele as they're read.
+
+    Args:
+        lines: Iterable of the sorted lines after the header
+        column_names: Column names of the table
+
+    Yields:
+        the list of the combined values of each allele
+    """
+    n_columns = len(column_names)
+    chrom_i, pos_i, ref_i, alt_i = [column_names.index(c) for c in LOC_COLUMNS]
+    info_indexes = [column_names.index(c) for c in INFO_COLUMNS if c in column_names]
+    num_indexes = [column_names.index(c) for c in NUM_COLUMNS if c in column_names]
 
-    for line in infile:
-        data = dict(zip(column_names, line.strip('\n').split('\t')))
-        unique_id = '_'.join([data['chrom'], str(data['pos']), data['ref'], data['alt']])
+    accumulator = None
+    last_unique_id = None
+    for line in lines:
+        values = _split_row(line, n_columns)
+        unique_id = (values[chrom_i], values[pos_i], values[ref_i], values[alt_i])
         if unique_id == last_unique_id:
-            data = group_alleles(last_data, data)
-        elif last_data is not None:
-            # note that using a comprehension instead of just data.values() preserves column order
-            # the next line (data) is not duplicated as the current line(last_data) then just print last_data
-            outfile.write('\t'.join([last_data[colname] for colname in column_names])+'\n')
-        last_data = data
-        last_unique_id = unique_id
-        counter += 1
+            accumulator.add(values)
+        else:
+            if accumulator is not None:
+                # the next line is a different allele, so this one is complete
+                yield accumulator.get_values()
+            accumulator = AlleleAccumulator(values, info_indexes, num_indexes)
+            last_unique_id = unique_id
 
-    if last_data is not None:
-        outfile.write('\t'.join([last_data[colname] for colname in column_names])+'\n')
-    else:
+    if accumulator is not None:
+        yield accumulator.get_values()
+
+
+def get_shards(sequences, jobs):
+    """Splits a tabix-indexed table into regions of about the same compressed size, a few for each job, at the
+    boundaries of the 16kb windows of the index's linear index. Since all the rows of an allele have the same
+    position, they're always in the same region.
+
+    Args:
+        sequences: the tabix index, from tabix_writer.read_index
+        jobs: number of processes the regions will be grouped by
+
+    Returns:
+        list of (chrom, virtual offset to start reading from, 0-based start position, end position or None for the
+        end of the chromosome), in the order of the table
+    """
+    sizes = [(sequence['last_offset'] >> 16) - (sequence['first_offset'] >> 16) for sequence in sequences]
+    target_size = max(1, sum(sizes) // (jobs * SHARDS_PER_JOB))
+    shards = []
+    for sequence in sequences:
+        shard_start = 0
+        shard_offset = sequence['first_offset']
+        for window, offset in enumerate(sequence['linear']):
+            if offset > shard_offset and (offset >> 16) - (shard_offset >> 16) >= target_size:
+                shards.append((sequence['name'], shard_offset, shard_start, window << LINEAR_SHIFT))
+                shard_start = window << LINEAR_SHIFT
+                shard_offset = offset
+        shards.append((sequence['name'], shard_offset, shard_start, None))
+    return shards
+
+
+def _read_shard(path, chrom, offset, start, end):
+    """Yields the lines of the table in the region, as str"""
+    with BgzfReader(path) as reader:
+        reader.seek(offset)
+        for line in reader:
+            fields = line.split(b'\t', 2)
+            if fields[0] != chrom:
+                break
+            pos = int(fields[1]) - 1
+            if pos < start:
+                continue  # the linear index can point to rows before the region
+            if end is not None and pos >= end:
+                break
+            yield line if bytes is str else line.decode('utf-8')
+
+
+def _group_shard(args):
+    """Groups the rows of one region of the table into a temporary file, and returns its path"""
+    path, column_names, tmp_dir, shard = args
+    fd, shard_path = tempfile.mkstemp(suffix='.tsv', dir=tmp_dir)
+    with os.fdopen(fd, 'w') as outfile:
+        _group_lines(_read_shard(path, *shard), column_names, outfile)
+    return shard_path
+
+
+def group_by_allele_parallel(path, outfile, jobs, tmp_dir=None):
+    """Like group_by_allele, but splits the table into regions with its tabix index, and groups them in parallel.
+
+    Args:
+        path: Path of the sorted table, compressed with BGZF and indexed with tabix like the
+            clinvar_allele_trait_pairs tables
+        outfile: Output file stream to write to. The grouped regions are written to it in the order of the table.
+        jobs: Number of processes
+        tmp_dir: Directory for the grouped regions before they're written to outfile
+    """
+    sequences = read_index(path + '.tbi')
+    with BgzfReader(path) as reader:
+        header = reader.readline()
+    header = header if bytes is str else header.decode('utf-8')
+    outfile.write(header)
+    column_names = header.strip('\n').split('\t')
+
+    shards = get_shards(sequences, jobs)
+    shards_dir = tempfile.mkdtemp(dir=tmp_dir)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        # imap returns the regions in order while later ones are still being grouped
+        for shard_path in pool.imap(_group_shard, [(path, column_names, shards_dir, shard) for shard in shards]):
+            with open(shard_path) as f:
+                shutil.copyfileobj(f, outfile)
+            os.remove(shard_path)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(shards_dir)
+
+    if not any(sequence['first_offset'] is not None for sequence in sequences):
+        raise ValueError("%s has 0 records" % path)
+
+
+def group_unsorted(infile, outfile, buffer_size=2**30, tmp_dir=None):
+    """Like group_by_allele, but for a table that isn't sorted. The rows are collected by allele in a hash table, and
+    when they take more than buffer_size, they're spilled to temporary files by a hash of the allele, and each file is
+    grouped on its own afterwards.
+
+    The alleles are written in no particular order. The rows of each allele are combined in the order sort_table.py
+    would put them in, so each allele's line is the same as group_by_allele writes for the sorted table.
+
+    Args:
+        infile: Input file stream of the table, starting with the header line
+        outfile: Output file stream to write to
+        buffer_size: Approximate maximum number of bytes of memory to use for the rows
+        tmp_dir: Directory to create the temporary directory for the spilled rows in. Default: the system default.
+    """
+    header = next(infile)
+    outfile.write(header)
+    if not _group_unsorted_lines(infile, header.strip('\n').split('\t'), outfile, buffer_size, tmp_dir, 0):
         raise ValueError("%s has 0 records" % infile)
 
+
+def _partition(key, depth):
+    """Returns the number of the spill file for an allele, which is different at each depth of spilling"""
+    data = '\t'.join((str(depth),) + key)
+    return zlib.crc32(data if bytes is str else data.encode('utf-8')) % SPILL_PARTITIONS
+
+
+def _group_unsorted_lines(lines, column_names, outfile, buffer_size, tmp_dir, depth):
+    """Writes the grouped lines to outfile, and returns the number of alleles"""
+    n_columns = len(column_names)
+    key_indexes = [column_names.index(c) for c in LOC_COLUMNS]
+    max_split = max(key_indexes) + 1
+    info_indexes = [column_names.index(c) for c in INFO_COLUMNS if c in column_names]
+    num_indexes = [column_names.index(c) for c in NUM_COLUMNS if c in column_names]
+
+    alleles = {}
+    size = 0
+    spill_dir = None
+    spill_files = None
+    try:
+        for line in lines:
+            if not line.endswith('\n'):
+                line += '\n'
+            fields = line.split('\t', max_split)
+            if len(fields) < max_split:
+                raise ValueError("Line has %d columns instead of %d: %s" % (len(fields), n_columns, line[:100]))
+            key = tuple(fields[i] for i in key_indexes)
+            rows = alleles.get(key)
+            if rows is None:
+                alleles[key] = [line]
+            else:
+                rows.append(line)
+            size += len(line) + LINE_OVERHEAD
+            if size >= buffer_size and depth < MAX_SPILL_DEPTH:
+                if spill_dir is None:
+                    spill_dir = tempfile.mkdtemp(prefix='group_by_allele.', dir=tmp_dir)
+                    spill_files = [open(os.path.join(spill_dir, '%d.tsv' % i), 'w') for i in range(SPILL_PARTITIONS)]
+                for key, rows in alleles.items():
+                    spill_files[_partition(key, depth)].writelines(rows)
+                alleles = {}
+                size = 0
+
+        if spill_dir is None:
+            out = TableWriter(outfile)
+            for rows in alleles.values():
+                rows.sort()  # like the last-resort comparison of sort_table.py
+                accumulator = AlleleAccumulator(_split_row(rows[0], n_columns), info_indexes, num_indexes)
+                for line in rows[1:]:
+                    accumulator.add(_split_row(line, n_columns))
+                out.write_row(accumulator.get_values())
+            out.close()
+            return len(alleles)
+
+        for key, rows in alleles.items():
+            spill_files[_partition(key, depth)].writelines(rows)
+        del alleles
+        for f in spill_files:
+            f.close()
+        counter = 0
+        for f in spill_files:
+            with open(f.name) as spilled_lines:
+                counter += _group_unsorted_lines(spilled_lines, column_names, outfile, buffer_size, spill_dir,
+                                                 depth + 1)
+            os.remove(f.name)
+        return counter
+    finally:
+        if spill_dir is not None:
+            for f in spill_files:
+                f.close()
+            shutil.rmtree(spill_dir)
+
+
 def group_alleles(data1, data2):
     """Group two variants with same genomic coordinates.
 
@@ -58,11 +349,7 @@ def group_alleles(data1, data2):
 
     # 'pathogenic', 'benign', 'conflicted', 'gold_stars',
     # concatenate columns that may have lists of values
-    loc_column = ['chrom','pos','ref','alt']
-    num_field = ['pathogenic', 'likely_pathogenic','uncertain_significance','likely_benign', 'benign']
-    info_column = [x for x in HEADER if x not in loc_column and x not in num_field]
-
-    for column_name in info_column:
+    for column_name in INFO_COLUMNS:
         all_non_empty_values = filter(lambda s: s, data1[column_name].split(';') + data2[column_name].split(';'))
         # deduplicate values, while preserving order
         deduplicated_values = []
@@ -72,23 +359,41 @@ def group_alleles(data1, data2):
 
         combined_data[column_name] = ';'.join(deduplicated_values)
 
-    for column_name in num_field:
+    for column_name in NUM_COLUMNS:
         combined_data[column_name]=str(int(data1[column_name])+int(data2[column_name]))
 
     return combined_data
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='De-duplicate the output from parse_clinvar_xml.py')
-    parser.add_argument('-i', '--infile', type=argparse.FileType('r'), default=sys.stdin)
+    parser.add_argument('-i', '--infile', default='-', help="Path of the table, or - for stdin. Can be gzipped.")
     parser.add_argument('-o', '--outfile', type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of processes to group with. If more than 1, "
+                        "--infile must be compressed with bgzip and indexed with tabix, and is split into regions "
+                        "with the index.")
+    parser.add_argument('--unsorted', action='store_true', help="The table isn't sorted. The rows are grouped in a hash "
+                        "table, and spilled to temporary files if they don't fit in --buffer-size. The alleles are "
+                        "written in no particular order.")
+    parser.add_argument('-S', '--buffer-size', type=parse_size, default='1G', help="With --unsorted: approximate amount "
+                        "of memory to use for the rows, eg. 512M or 2G")
+    parser.add_argument('-T', '--tmp-dir', help="With --jobs: directory for the grouped regions. With --unsorted: "
+                        "directory for the spilled rows.")
     args = parser.parse_args()
 
-    if args.infile.name.endswith(".gz"):
-        args.infile.close()
-        args.infile = gzip.open(args.infile.name)
-    
+    if args.jobs > 1 and args.unsorted:
+        parser.error("--jobs can't be combined with --unsorted")
+    if args.jobs > 1:
+        if not os.path.isfile(args.infile + '.tbi'):
+            parser.error("--jobs requires an --infile with a tabix index")
+
     if args.outfile.name.endswith(".gz"):
         args.outfile.close()
         args.outfile = gzip.open(args.outfile.name, 'w')
     
-    group_by_allele(args.infile, args.outfile)
+    if args.jobs > 1:
+        group_by_allele_parallel(args.infile, args.outfile, args.jobs, tmp_dir=args.tmp_dir)
+    elif args.unsorted:
+        group_unsorted(read_lines(args.infile), args.outfile, buffer_size=args.buffer_size, tmp_dir=args.tmp_dir)
+    else:
+        group_by_allele(read_lines(args.infile), args.outfile)
+    args.outfile.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+Make a BGZF-compressed copy of the ClinVar XML release together with an index of where each ClinVarSet is in it, so
+that individual records can be pulled out with a seek instead of reading through the whole release. NCBI publishes the
+release as a plain gzip file, which can't be seeked into, hence the copy.
+
+The index (<bgzf copy>.idx) is a tab-delimited table with one row per ClinVarSet:
+    rcv, variation_ids, allele_ids, virtual_offset, length
+where variation_ids and allele_ids are the comma-separated IDs of the MeasureSets and Measures in the
+ReferenceClinVarAssertion, virtual_offset is the BGZF virtual offset of the <ClinVarSet> start tag, and length is the
+number of uncompressed bytes up to and including its </ClinVarSet> end tag.
+
+Usage:
+    python index_clinvar_xml.py -x ClinVarFullRelease.xml.gz -o ClinVarFullRelease.xml.bgz
+"""
+
+import argparse
+import re
+import sys
+
+from bgzf import BgzfWriter
+from parse_clinvar_xml import get_handle, clinvarset_start_regex, rcv_accession_regex, CLINVARSET_END_TAG
+
+INDEX_HEADER = ['rcv', 'variation_ids', 'allele_ids', 'virtual_offset', 'length']
+
+reference_clinvar_assertion_regex = re.compile(br'<ReferenceClinVarAssertion[\s>].*?</ReferenceClinVarAssertion>',
+                                               re.DOTALL)
+measureset_id_regex = re.compile(br'<MeasureSet\s[^>]*?\bID="([0-9]+)"')
+measure_id_regex = re.compile(br'<Measure\s[^>]*?\bID="([0-9]+)"')
+
+
+def get_index_path(bgzf_path):
+    return bgzf_path + '.idx'
+
+
+def get_index_row(clinvar_set):
+    """Returns the rcv, variation_ids and allele_ids columns of the index for the raw XML of a ClinVarSet"""
+    match = reference_clinvar_assertion_regex.search(clinvar_set)
+    reference_clinvar_assertion = match.group(0) if match is not None else b''
+
+    rcv = rcv_accession_regex.search(reference_clinvar_assertion)
+    return [
+        rcv.group(1).decode('ascii') if rcv is not None else '',
+        ','.join(i.decode('ascii') for i in measureset_id_regex.findall(reference_clinvar_assertion)),
+        ','.join(i.decode('ascii') for i in measure_id_regex.findall(reference_clinvar_assertion)),
+    ]
+
+
+def index_clinvar_xml(handle, writer, index_file, block_size=2**20):
+    """Copy the XML from handle to a BgzfWriter, and write an index row for each ClinVarSet to index_file.
+
+    Args:
+        handle: Open input file handle for reading the XML data
+        writer: bgzf.BgzfWriter for the copy
+        index_file: Open output file handle for the index
+
+    Returns:
+        the number of ClinVarSets indexed
+    """
+    index_file.write('\t'.join(INDEX_HEADER) + '\n')
+
+    counter = 0
+    buf = b''
+    while True:
+        block = handle.read(block_size)
+        buf += block
+
+        # copy everything up to the end of the last complete ClinVarSet, recording where each ClinVarSet starts
+        pos = 0
+        while True:
+            start_match = clinvarset_start_regex.search(buf, pos)
+            if start_match is None:
+                break
+            start = start_match.start()
+            end = buf.find(CLINVARSET_END_TAG, start)
+            if end == -1:
+                break
+            end += len(CLINVARSET_END_TAG)
+
+            writer.write(buf[pos:start])
+            index_row = get_index_row(buf[start:end]) + [str(writer.tell()), str(end - start)]
+            writer.write(buf[start:end])
+            index_file.write('\t'.join(index_row) + '\n')
+            counter += 1
+            pos = end
+
+        if not block:
+            writer.write(buf[pos:])
+            break
+
+        # keep any incomplete ClinVarSet, or what could be the beginning of a <ClinVarSet start tag, for the next block
+        if start_match is not None:
+            keep_from = start_match.start()
+        else:
+            keep_from = max(pos, len(buf) - len(b'<ClinVarSet '))
+        writer.write(buf[pos:keep_from])
+        buf = buf[keep_from:]
+
+    return counter
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make a BGZF copy of the ClinVar XML dump with an index of its '
+                                                 'ClinVarSets by RCV, variation ID and allele ID')
+    parser.add_argument('-x', '--xml', dest='xml_path', help='Path to the ClinVar XML dump', required=True)
+    parser.add_argument('-o', '--out', help="Path of the BGZF copy. The index is written to this path + .idx",
+                        required=True)
+    args = parser.parse_args()
+
+    handle = get_handle(args.xml_path, 'auto')
+    with BgzfWriter(args.out) as writer, open(get_index_path(args.out), 'w') as index_file:
+        counter = index_clinvar_xml(handle, writer, index_file)
+    handle.close()
+
+    sys.stderr.write("Indexed %d ClinVarSets\n" % counter)
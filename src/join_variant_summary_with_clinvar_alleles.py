@@ -1,86 +1,146 @@
 #!/usr/bin/env python
+
+"""
+Join the grouped alleles table from group_by_allele.py with NCBI's variant_summary.txt.gz on allele_id, to take the
+clinical_significance, review_status and last_evaluated of each allele from the variant summary, and add the
+gold_stars and conflicted columns.
+
+variant_summary.txt.gz has rows for both genome builds, with 30+ columns of which only 5 are needed, so it's read one
+block at a time, and only the allele id and those 3 values of the rows for the genome build are kept, in a dictionary.
+The alleles table is then streamed through it, and the joined rows are written as they're made, so neither table is
+held in memory.
+"""
+
+import gzip
 import sys
-import pandas as pd
 
 from parse_clinvar_xml import HEADER
+from table_io import TableReader, TableWriter
 
 FINAL_HEADER = HEADER + ['gold_stars', 'conflicted']
 
-
-def join_variant_summary_with_clinvar_alleles(
-        variant_summary_table, clinvar_alleles_table,
-        genome_build_id="GRCh37"):
-    variant_summary = pd.read_csv(variant_summary_table, sep="\t",
-                                  index_col=False, compression="gzip",low_memory=False)
-    print "variant_summary raw", variant_summary.shape
-
-    clinvar_alleles = pd.read_csv(clinvar_alleles_table, sep="\t",
-                                  index_col=False, compression="gzip",low_memory=False)
-    print "clinvar_alleles raw", clinvar_alleles.shape
-
-    # use lowercase names and replace . with _ in column names:
-    variant_summary = variant_summary.rename(columns=dict(
-        (col, col.lower().replace(".", "_"))
-        for col in variant_summary.columns))
-    # rename first column to allele_id:
-    variant_summary = variant_summary.rename(
-        columns={variant_summary.columns[0]: "allele_id"})
-
-    # extract relevant columns for the correct assembly and
-    # rename clinicalsignificance, reviewstatus, lastevaluated:
-    variant_summary = variant_summary[
-        variant_summary['assembly'] == genome_build_id]
-    variant_summary = variant_summary[
-        ['allele_id', 'clinicalsignificance', 'reviewstatus','lastevaluated']]
-    variant_summary = variant_summary.rename(
-        columns={'clinicalsignificance': 'clinical_significance',
-                 'reviewstatus': 'review_status',
-                 'lastevaluated':'last_evaluated'})
-
-    # remove the duplicated records in variant summary due to alternative loci such as PAR but would be problematic for rare cases like translocation
-    variant_summary=variant_summary.drop_duplicates()
-    print "variant_summary after filter", variant_summary.shape
-
-    # remove clinical_significance and review_status from clinvar_alleles:
-    clinvar_alleles = clinvar_alleles.drop(
-        ['clinical_significance', 'review_status','last_evaluated'], axis=1)
-
-    # pandas is sensitive to some rows having allele_id joined on ;, causing
-    # an object dtype, with some entries being ints and others strs
-    clinvar_alleles['allele_id'] = clinvar_alleles['allele_id'].astype(str)
-    variant_summary['allele_id'] = variant_summary['allele_id'].astype(str)
-
-    print "clinvar_alleles after filter", clinvar_alleles.shape
-
-    # join the two tables on allele_id:
-    df = pd.merge(clinvar_alleles, variant_summary,
-                  on='allele_id', how='inner')
-    print "merged raw", df.shape
-
-    # map review_status to gold starts:
-    gold_star_map = {
-        'no assertion provided': 0,
-        'no assertion for the individual variant': 0,
-        'no assertion criteria provided': 0,
-        'criteria provided, single submitter': 1,
-        'criteria provided, conflicting interpretations': 1,
-        'criteria provided, multiple submitters, no conflicts': 2,
-        'reviewed by expert panel': 3,
-        'practice guideline': 4,
-        '-':'-'
-    }
-    df['gold_stars'] = df.review_status.map(gold_star_map)
-
-    # The use of expressions on clinical significance on ClinVar aggregate records (RCV) https://www.ncbi.nlm.nih.gov/clinvar/docs/clinsig/#conflicts
-    # conflicted = 1 if using "conflicting"
-    df['conflicted'] = df['clinical_significance'].str.contains(
-        "onflicting", case=False).astype(int)
-
-    # reorder columns just in case
-    df = df.ix[:, FINAL_HEADER]
-    print "merged final", df.shape
-
-    return df
+# the columns taken from variant_summary.txt.gz, whose column names are lowercased and have . replaced with _. The first
+# column is the allele id.
+VARIANT_SUMMARY_COLUMNS = [('clinicalsignificance', 'clinical_significance'),
+                           ('reviewstatus', 'review_status'),
+                           ('lastevaluated', 'last_evaluated')]
+
+# map review_status to gold stars
+GOLD_STARS = {
+    'no assertion provided': '0',
+    'no assertion for the individual variant': '0',
+    'no assertion criteria provided': '0',
+    'criteria provided, single submitter': '1',
+    'criteria provided, conflicting interpretations': '1',
+    'criteria provided, multiple submitters, no conflicts': '2',
+    'reviewed by expert panel': '3',
+    'practice guideline': '4',
+    '-': '-',
+}
+
+
+def read_variant_summary(variant_summary_table, genome_build_id="GRCh37"):
+    """Returns a dictionary of allele_id -> tuple of the distinct (clinical_significance, review_status,
+    last_evaluated) of the allele's rows for the genome build, in the order of the file. An allele can have more than
+    one row for a genome build, eg. for alternate loci such as the PARs.
+
+    Args:
+        variant_summary_table: Path of variant_summary.txt.gz
+        genome_build_id: Value of the Assembly column of the rows to use, eg. GRCh37
+    """
+    summaries = {}
+    # most of the values are repeated in many rows, so each distinct value is only kept once
+    distinct_values = {}
+    with TableReader(variant_summary_table) as table:
+        index = dict((column_name.lower().replace('.', '_'), i) for i, column_name in enumerate(table.column_names))
+        try:
+            assembly_i = index['assembly']
+            value_indexes = [index[column_name] for column_name, _ in VARIANT_SUMMARY_COLUMNS]
+        except KeyError as e:
+            raise ValueError("%s doesn't have a %s column" % (variant_summary_table, e))
+
+        for values in table:
+            if values[assembly_i] != genome_build_id:
+                continue
+            summary = tuple(distinct_values.setdefault(values[i], values[i]) for i in value_indexes)
+            summary = distinct_values.setdefault(summary, summary)
+            allele_id = values[0]
+            allele_summaries = summaries.get(allele_id)
+            if allele_summaries is None:
+                summaries[allele_id] = (summary,)
+            elif summary not in allele_summaries:
+                summaries[allele_id] = allele_summaries + (summary,)
+    return summaries
+
+
+def iter_joined_rows(summaries, column_names, rows):
+    """Joins rows of the grouped alleles table with the variant summary. An allele with several distinct rows in the
+    variant summary is joined once for each of them, and the alleles that aren't in it are left out.
+
+    Args:
+        summaries: Dictionary from read_variant_summary
+        column_names: Column names of the alleles table
+        rows: Iterable of the lists of values of the alleles table's rows
+
+    Yields:
+        a new list of the values of each joined row, with the columns of FINAL_HEADER
+    """
+    index = dict((column_name, i) for i, column_name in enumerate(column_names))
+    if 'allele_id' not in index:
+        raise ValueError("The alleles table doesn't have an allele_id column")
+    allele_id_i = index['allele_id']
+    # the columns that the alleles table doesn't have are left empty
+    column_indexes = [index.get(column_name) for column_name in FINAL_HEADER]
+    summary_columns = [FINAL_HEADER.index(column_name) for _, column_name in VARIANT_SUMMARY_COLUMNS]
+    gold_stars_i = FINAL_HEADER.index('gold_stars')
+    conflicted_i = FINAL_HEADER.index('conflicted')
+
+    for values in rows:
+        allele_summaries = summaries.get(values[allele_id_i])
+        if allele_summaries is None:
+            continue  # including the alleles with several allele ids, joined with ;
+        allele_row = [values[i] if i is not None else '' for i in column_indexes]
+        for summary in allele_summaries:
+            row = list(allele_row)
+            for i, value in zip(summary_columns, summary):
+                row[i] = value
+            clinical_significance, review_status, _ = summary
+            row[gold_stars_i] = GOLD_STARS.get(review_status, '')
+            # The use of expressions on clinical significance on ClinVar aggregate records (RCV)
+            # https://www.ncbi.nlm.nih.gov/clinvar/docs/clinsig/#conflicts - conflicted = 1 if using "conflicting"
+            row[conflicted_i] = '1' if 'onflicting' in clinical_significance.lower() else '0'
+            yield row
+
+
+def join_variant_summary_with_clinvar_alleles(variant_summary_table, clinvar_alleles_table, outfile,
+                                              genome_build_id="GRCh37"):
+    """Writes the alleles that are in the variant summary, with the values from it, to outfile. An allele with several
+    distinct rows in the variant summary is written once for each of them.
+
+    Args:
+        variant_summary_table: Path of variant_summary.txt.gz
+        clinvar_alleles_table: Path of the grouped alleles table, which can be gzipped, or a file object with the
+            uncompressed table
+        outfile: Output file stream to write the joined table to, with the columns of FINAL_HEADER
+        genome_build_id: Genome build of the alleles table, eg. GRCh37
+
+    Returns:
+        the number of rows written
+    """
+    summaries = read_variant_summary(variant_summary_table, genome_build_id)
+    sys.stderr.write("variant_summary: %d alleles for %s\n" % (len(summaries), genome_build_id))
+
+    rows = 0
+    with TableReader(clinvar_alleles_table) as table:
+        out = TableWriter(outfile)
+        out.write_row(FINAL_HEADER)
+        for row in iter_joined_rows(summaries, table.column_names, table):
+            out.write_row(row)
+            rows += 1
+        out.close()
+
+    sys.stderr.write("clinvar_alleles: %d rows after the join\n" % rows)
+    return rows
 
 
 if __name__ == "__main__":
@@ -97,6 +157,9 @@ if __name__ == "__main__":
     genome_build_id = sys.argv[4]
     assert out_name.endswith('.gz'), ("Provide a filename with .gz extension "
                                       "as the output will be gzipped")
-    df = join_variant_summary_with_clinvar_alleles(
-        variant_summary_table, clinvar_alleles_table, genome_build_id)
-    df.to_csv(out_name, sep="\t", index=False, compression='gzip')
+    outfile = gzip.open(out_name, 'wb')
+    try:
+        join_variant_summary_with_clinvar_alleles(variant_summary_table, clinvar_alleles_table, outfile,
+                                                  genome_build_id)
+    finally:
+        outfile.close()
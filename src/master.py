@@ -7,18 +7,24 @@ Run with -h to see all options.
 import configargparse
 from datetime import datetime
 import ftplib
+import hashlib
+import json
 import os
 import sys
 from distutils import spawn
 
+from pipeline_runner import Pipeline, PipelineError, find_local_imports, format_report_summary
+from sort_table import parse_size
+from stage_cache import StageCache, hash_file
+
 try:
     import configargparse
     import pypez
     import pysam
-    import pandas   # make sure all dependencies are installed
+    import pyarrow
 except ImportError as e:
     sys.exit("ERROR: Python module not installed. %s. Please run 'pip install -r requirements.txt' " % e)
-for executable in ['wget', 'tabix', 'vt']:
+for executable in ['bgzip', 'vt']:
     assert spawn.find_executable(executable), "Command %s not found, see README" % executable
 
 p = configargparse.getArgParser()
@@ -32,6 +38,18 @@ g.add("-GE", "--gnomad-exome-sites-vcf",  help="gnomAD exome sites vcf file. If
 g.add("-GG", "--gnomad-genome-sites-vcf",  help="gnomAD genome sites vcf file. If specified, a clinvar table with extra gnomAD genome info fields will also be created.")
 g.add("--output-prefix", default="../output/", help="Final output files will have this prefix")
 g.add("--tmp-dir", default="./output_tmp", help="Temporary output files will have this prefix")
+g.add("--download-segments", type=int, default=4, help="Number of parts of each ClinVar release file to download at the same time")
+g.add("--parse-processes", type=int, default=1, help="Number of processes to use for parsing the ClinVar XML")
+g.add("--cache-dir", default=None, help="Directory for keeping results between runs. If set, only the ClinVar records that are new or have changed since the previous run are parsed and normalized.")
+g.add("--sort-buffer-size", default="1G", help="Approximate amount of memory to use for sorting each table, eg. 512M or 2G. Larger tables are sorted in runs that are merged from temporary files.")
+g.add("--sort-processes", type=int, default=1, help="Number of processes to use for sorting each table")
+g.add("--group-processes", type=int, default=1, help="Number of processes to use for grouping each table by allele. The table is split into regions with its tabix index.")
+g.add("--compression-threads", type=int, default=1, help="Number of threads to use for compressing each output table")
+g.add("--max-parallel", type=int, default=1, help="Maximum number of commands to run at the same time. Commands only wait for the commands that make their input files, so the genome builds and the single and multi tables are processed in parallel.")
+g.add("--max-memory", help="If set, commands that declare their approximate memory use (eg. the sort steps) are only started while the total for the running commands stays under this, eg. 32G")
+g.add("--stage-cache-dir", help="If set, the output files of each command are kept in this directory, keyed by a hash of the command and the contents of its input files. A command whose output files are older than its inputs (eg. because an input was touched or downloaded again) is then only run again if the contents of its inputs changed.")
+g.add("--stage-cache-size", default="50G", help="Maximum size of --stage-cache-dir. The least recently used outputs are removed when it's exceeded.")
+g.add("--streaming", action="store_true", help="Parse, normalize, sort, group and join in one process, passing rows between the steps in memory instead of through intermediate files. The rows are sorted within --sort-buffer-size, spilling to --tmp-dir beyond that. Can't be combined with --cache-dir.")
 g = p.add_mutually_exclusive_group()
 g.add("--single-only", dest="single_or_multi", action="store_const", const="single", help="Only generate the single-variant tables")
 g.add("--multi-only", dest="single_or_multi", action="store_const", const="multi", help="Only generate the multi-variant tables")
@@ -50,8 +68,25 @@ gnomad_exome_sites_vcf = args.gnomad_exome_sites_vcf
 gnomad_genome_sites_vcf = args.gnomad_genome_sites_vcf
 clinvar_variant_summary_table = args.clinvar_variant_summary_table
 output_prefix = args.output_prefix
+parse_processes = args.parse_processes
+cache_dir = args.cache_dir
+streaming = args.streaming
+if cache_dir and streaming:
+    p.error("--streaming can't be combined with --cache-dir")
+if cache_dir:
+    os.system("mkdir -p " + cache_dir)
 
 tmp_dir = args.tmp_dir
+# sort_table.py spills runs that don't fit in the buffer to the tmp dir
+compression_args = "-@ %s" % args.compression_threads
+sort_args = "-S %s -p %s -T %s %s" % (args.sort_buffer_size, args.sort_processes, tmp_dir, compression_args)
+sort_memory = parse_size(args.sort_buffer_size)
+group_args = " -j %s -T %s" % (args.group_processes, tmp_dir) if args.group_processes > 1 else ""
+# when commands can run in parallel, the rows are grouped by allele from the unsorted normalized table (see
+# group_by_allele.py --unsorted), so that the clinvar_alleles steps don't wait for the allele-trait pairs to be sorted
+group_unsorted = args.group_processes == 1 and args.max_parallel > 1
+# when commands can run in parallel, fan_out_alleles_table.py also runs each of its outputs in a separate process
+fan_out_args = compression_args + (" --parallel" if args.max_parallel > 1 else "")
 os.system("mkdir -p " + tmp_dir)
 
 if reference_genomes['b37'] is None and reference_genomes['b38'] is None:
@@ -92,11 +127,27 @@ def download_if_changed(job_runner, local_path, ftp_host, ftp_path):
     ftp_address = "ftp://%s/%s" % (ftp_host, ftp_path)
     if remote_changed_time > local_changed_time:
         print("Local copy of %s is out of date. The remote version changed on %s" % (ftp_address, datetime.fromtimestamp(remote_changed_time)))
-        job_runner.add_parallel(pypez.Job("wget %s -O OUT:%s" % (ftp_address, local_path)))
+        # NCBI's FTP site is also served over HTTPS, which allows downloading in parallel byte ranges. Interrupted
+        # downloads are resumed, and the file is checked against the .md5 file published next to it.
+        https_address = "https://%s%s" % (ftp_host, ftp_path)
+        job_runner.add_parallel(pypez.Job("python -u download.py %s -o OUT:%s --md5-url auto -n %d" % (https_address, local_path, args.download_segments)))
     else:
         print("Local copy of %s is up to date. The remote version hasn't changed since %s" % (ftp_address, datetime.fromtimestamp(remote_changed_time)))
         #ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/ClinVarFullRelease_00-latest.xml.gz
 
+def get_normalize_version(reference_genome):
+    """Returns a hash of normalize_variants.py and the modules it imports, and of the path, size and modification
+    time of the reference genome, so that the cached normalized table is only reused with the same normalizer and
+    reference genome
+    """
+    sha1 = hashlib.sha1()
+    for path in ["normalize_variants.py"] + find_local_imports("normalize_variants.py"):
+        sha1.update(hash_file(path))
+    stat = os.stat(reference_genome)
+    sha1.update("%s\t%d\t%d" % (os.path.abspath(reference_genome), stat.st_size, int(stat.st_mtime)))
+    return sha1.hexdigest()
+
+
 jr = pypez.JobRunner()
 
 if clinvar_xml:
@@ -123,26 +174,54 @@ else:
 
 jr.run()
 
-job = pypez.Job()
-
-# normalize (convert to minimal representation and left-align)
-# the normalization code is in a different repo (useful for more than just clinvar) so here I just wget it:
-job.add("wget -N https://raw.githubusercontent.com/ericminikel/minimal_representation/master/normalize.py")
+# commands are run in dependency order (according to their IN: and OUT: files), as many at a time as --max-parallel allows
+stage_cache = StageCache(args.stage_cache_dir, max_size=parse_size(args.stage_cache_size)) if args.stage_cache_dir else None
+job = Pipeline(max_parallel=args.max_parallel, max_memory=parse_size(args.max_memory) if args.max_memory else None, stage_cache=stage_cache)
+
+# extract the GRCh37 and/or GRCh38 coordinates, mutant allele, MeasureSet ID and PubMed IDs from it. This currently
+# takes about 20 minutes. When both reference genomes are given, the tables for both builds come from one pass through the XML.
+genome_builds = [genome_build for genome_build in ('b37', 'b38') if reference_genomes[genome_build] is not None]
+genome_build_ids = " ".join(genome_build.replace('b', 'GRCh') for genome_build in genome_builds)
+raw_single_tables = " ".join("OUT:%s/clinvar_table_raw.single.%s.tsv.gz" % (tmp_dir, genome_build) for genome_build in genome_builds)
+raw_multi_tables = " ".join("OUT:%s/clinvar_table_raw.multi.%s.tsv.gz" % (tmp_dir, genome_build) for genome_build in genome_builds)
+# with --cache-dir, the rows of ClinVarSets that haven't changed since the previous run are reused, and the RCVs that did change are listed in changed_rcvs.txt
+cache_args = ("--cache-dir %(cache_dir)s --changed-rcvs OUT:%(tmp_dir)s/changed_rcvs.txt " % locals()) if cache_dir else ""
+if streaming:
+    # with --streaming, the parse, normalize, sort, group, join and sort steps below are done by streaming_pipeline.py,
+    # which writes just the sorted clinvar_allele_trait_pairs and clinvar_alleles tables
+    tables = [args.single_or_multi] if args.single_or_multi else ['single', 'multi']
+    reference_genome_args = " ".join("--%s-genome IN:%s" % (genome_build, reference_genomes[genome_build]) for genome_build in genome_builds)
+    job.add(("python -u IN:streaming_pipeline.py "
+            "-x IN:%(clinvar_xml)s "
+            "-S IN:%(variant_summary_table)s "
+            "%(reference_genome_args)s "
+            "-t %(tables)s "
+            "-p %(parse_processes)s "
+            "%(compression_args)s "
+            "--buffer-size %(sort_buffer_size)s -T %(tmp_dir)s "
+            "-o %(output_prefix)s{genome_build}/{table}") % dict(locals(), tables=" ".join(tables), sort_buffer_size=args.sort_buffer_size),
+            output_filenames=["%s%s/%s/%s.%s.%s.tsv.gz%s" % (output_prefix, genome_build, table, table_name, table, genome_build, suffix)
+                              for table_name in ('clinvar_allele_trait_pairs', 'clinvar_alleles')
+                              for table in tables for genome_build in genome_builds for suffix in ('', '.tbi')],
+            memory=sort_memory)
+else:
+    job.add(("python -u IN:parse_clinvar_xml.py "
+            "-x IN:%(clinvar_xml)s "
+            "-g %(genome_build_ids)s "
+            "-p %(parse_processes)s "
+            "-d auto "  # decompress in a pigz subprocess or a background thread, in parallel with parsing
+            "--streaming --report-memory "
+            "%(cache_args)s"
+            "-o %(raw_single_tables)s "
+            "-m %(raw_multi_tables)s") % locals())
 
 for genome_build in ('b37', 'b38'):
-    # extract the GRCh37 coordinates, mutant allele, MeasureSet ID and PubMed IDs from it. This currently takes about 20 minutes.
     genome_build_id = genome_build.replace('b', 'GRCh')
     reference_genome = reference_genomes[genome_build]
     if reference_genome is None:
         print("Skippping steps to generate %s tables since reference genome not given." % genome_build)
         continue
 
-    job.add(("python -u IN:parse_clinvar_xml.py "
-            "-x IN:%(clinvar_xml)s "
-            "-g %(genome_build_id)s "
-            "-o OUT:%(tmp_dir)s/clinvar_table_raw.single.%(genome_build)s.tsv "
-            "-m OUT:%(tmp_dir)s/clinvar_table_raw.multi.%(genome_build)s.tsv") % locals())
-
     for is_multi in (True, False):  # multi = clinvar submission that describes multiple alleles (eg. compound het, haplotypes, etc.)
         single_or_multi = 'multi' if is_multi else 'single'
         if args.single_or_multi and single_or_multi != args.single_or_multi:
@@ -153,59 +232,85 @@ for genome_build in ('b37', 'b38'):
         output_dir = '%(output_prefix)s%(genome_build)s/%(single_or_multi)s' % locals()
         os.system('mkdir -p ' + output_dir)
 
-        # normalize variants  (use grep -v '^$' to remove empty rows)
-        job.add("python -u normalize.py -R IN:%(reference_genome)s < IN:%(tmp_dir)s/clinvar_table_raw.%(fsuffix)s.tsv | grep -v ^$ | bgzip -c > OUT:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz" % locals())
-
-        # sort
-        job.add(("cat " +
-            "<(gunzip -c IN:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz | head -1) "  # header row
-            "<(gunzip -c IN:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz | tail -n +2 | egrep -v \"^[XYM]\" | sort -k1,1n -k2,2n -k3,3 -k4,4 ) " + # numerically sort chroms 1-22
-            "<(gunzip -c IN:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz | tail -n +2 | egrep \"^[XYM]\" | sort -k1,1 -k2,2n -k3,3 -k4,4 ) " +  #sort chroms X,Y,M 
-            " | bgzip -c > OUT:%(tmp_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz") % locals())   # lexicogaraphically sort non-numerical chroms at end
-
-        # tabix and copy to output dir
-        job.add("tabix -S 1 -s 1 -b 2 -e 2 IN:%(tmp_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz" % locals(), output_filenames=["%(tmp_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz.tbi" % locals()])
-        job.add("cp IN:%(tmp_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz IN:%(tmp_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz.tbi %(output_dir)s" % locals(), output_filenames=[
-            "%(output_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz" % locals(),
-            "%(output_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz.tbi" % locals()
-            ])
-
-        # group by allele, since clinvar_allele_trait_pairs.*.tsv will have more than 1 record for some alleles
-        job.add("python -u IN:group_by_allele.py -i IN:%(tmp_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz | bgzip -c > OUT:%(tmp_dir)s/clinvar_alleles_grouped.%(fsuffix)s.tsv.gz" % locals())
-
-        # join information from the tab-delimited summary to the normalized genomic coordinates
-        job.add("python IN:join_variant_summary_with_clinvar_alleles.py "
-                "IN:%(variant_summary_table)s "
-                "IN:%(tmp_dir)s/clinvar_alleles_grouped.%(fsuffix)s.tsv.gz "
-                "OUT:%(tmp_dir)s/clinvar_alleles_combined.%(fsuffix)s.tsv.gz "
-                "%(genome_build_id)s" % locals())
-
-        # sort again by genomic coordinates
-        job.add(("cat " +
-            "<(gunzip -c IN:%(tmp_dir)s/clinvar_alleles_combined.%(fsuffix)s.tsv.gz | head -1) "  # header row
-            "<(gunzip -c IN:%(tmp_dir)s/clinvar_alleles_combined.%(fsuffix)s.tsv.gz | tail -n +2 | egrep -v \"^[XYM]\" | sort -k1,1n -k2,2n -k3,3 -k4,4 ) " + # numerically sort chroms 1-22
-            "<(gunzip -c IN:%(tmp_dir)s/clinvar_alleles_combined.%(fsuffix)s.tsv.gz | tail -n +2 | egrep \"^[XYM]\" | sort -k1,1 -k2,2n -k3,3 -k4,4 ) " +  #sort chroms X,Y,M 
-            " | bgzip -c > OUT:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz") % locals())   # lexicogaraphically sort non-numerical chroms at end
-
-        # tabix and copy to output dir
-        job.add("tabix -S 1 -s 1 -b 2 -e 2 IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz" % locals(), output_filenames=["%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz.tbi" % locals()])
-        job.add("cp IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz.tbi %(output_dir)s/"  % locals(),
-                output_filenames=[
-                    "%(output_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz" % locals(),
-                    "%(output_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz.tbi" % locals()
-                ])
-
-        # create vcf
-        job.add(("python -u IN:clinvar_table_to_vcf.py IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz IN:%(reference_genome)s | bgzip -c > OUT:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz") % locals())  # create compressed version
-        job.add("tabix IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz" % locals(), output_filenames=["%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz.tbi" % locals()])
-        job.add("cp IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz.tbi %(output_dir)s/" % locals(), output_filenames=[
-            "%(output_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz" % locals(),
-            "%(output_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz.tbi" % locals()])
-
-        # create uncompressed example files that contain the 1st 750 lines of the compressed tsvs so people can easily see typical values online on github
-        job.add("gunzip -c IN:%(tmp_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz | head -n 750 > OUT:%(output_dir)s/clinvar_allele_trait_pairs_example_750_rows.%(fsuffix)s.tsv" % locals())
-        job.add("gunzip -c IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz | head -n 750 > OUT:%(output_dir)s/clinvar_alleles_example_750_rows.%(fsuffix)s.tsv" % locals())
-        job.add("gunzip -c IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz | head -n 750 > OUT:%(output_dir)s/clinvar_alleles_example_750_rows.%(fsuffix)s.vcf" % locals())
+        # the published tables are written straight to the output dir, with their tabix index built while they're
+        # written (see tabix_writer.py), instead of running bgzip, then tabix, then cp
+        trait_pairs_table = "%(output_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.tsv.gz" % locals()
+        alleles_table = "%(output_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz" % locals()
+        alleles_vcf = "%(output_dir)s/clinvar_alleles.%(fsuffix)s.vcf.gz" % locals()
+
+        if not streaming:  # otherwise the sorted tables were made by streaming_pipeline.py
+            # normalize variants (convert to minimal representation and left-align)
+            previous_normalized_table = "%s/clinvar_table_normalized.%s.%s.tsv.gz" % (cache_dir, fsuffix, os.path.basename(reference_genome)) if cache_dir else None
+            # the previous normalized table is stamped with the first line of changed_rcvs.txt from the run that made it, which has the
+            # generation of the parse cache it matches, and with the version of the normalizer and reference genome it was made with.
+            # If a run was interrupted after the parse cache was updated, or the parse stage was restored from the stage cache,
+            # changed_rcvs.txt isn't relative to that generation, and if normalize_variants.py or the reference genome changed, the
+            # unchanged RCVs' rows would be different now. In both cases select_rows_by_rcv.py treats every RCV as changed, so the
+            # whole table is normalized again.
+            previous_normalized_generation = "%s.generation" % previous_normalized_table if cache_dir else None
+            normalize_version = get_normalize_version(reference_genome) if cache_dir else None
+            if previous_normalized_table and os.path.isfile(previous_normalized_table):
+                # only normalize the rows of RCVs that changed since the previous run, and take the rest from the previous run's normalized table
+                table_generation_args = "--table-generation %(previous_normalized_generation)s --table-version %(normalize_version)s" % locals()
+                job.add(("cat "
+                    "<(python -u IN:select_rows_by_rcv.py -i IN:%(tmp_dir)s/clinvar_table_raw.%(fsuffix)s.tsv.gz --rcvs IN:%(tmp_dir)s/changed_rcvs.txt %(table_generation_args)s "
+                    "| python -u IN:normalize_variants.py -R IN:%(reference_genome)s) "
+                    "<(python -u IN:select_rows_by_rcv.py -i %(previous_normalized_table)s --rcvs-from-table IN:%(tmp_dir)s/clinvar_table_raw.%(fsuffix)s.tsv.gz --exclude-rcvs IN:%(tmp_dir)s/changed_rcvs.txt "
+                    "%(table_generation_args)s --no-header) "
+                    "| bgzip -c > OUT:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz") % locals())
+            elif previous_normalized_table or group_unsorted:
+                job.add("python -u IN:normalize_variants.py -i IN:%(tmp_dir)s/clinvar_table_raw.%(fsuffix)s.tsv.gz -R IN:%(reference_genome)s -o OUT:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz" % locals())
+            if previous_normalized_table:
+                # the stamp is removed first and written last, so a partly copied table is never stamped
+                job.add(("rm -f %(previous_normalized_generation)s && "
+                    "cp IN:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz OUT:%(previous_normalized_table)s && "
+                    "(head -n 1 IN:%(tmp_dir)s/changed_rcvs.txt && printf '#version\\t%%s\\n' %(normalize_version)s) > OUT:%(previous_normalized_generation)s") % locals())
+            if previous_normalized_table or group_unsorted:
+                # sort: chroms 1-22 numerically, then X, Y, MT
+                job.add("python -u IN:sort_table.py -i IN:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz -o OUT:%(trait_pairs_table)s --tabix %(sort_args)s" % locals(),
+                        output_filenames=[trait_pairs_table + ".tbi"], memory=sort_memory)
+            else:
+                # without --cache-dir, the normalized rows go straight into the sort, without writing the normalized table
+                job.add("python -u IN:normalize_variants.py -i IN:%(tmp_dir)s/clinvar_table_raw.%(fsuffix)s.tsv.gz -R IN:%(reference_genome)s --sort --tabix %(sort_args)s -o OUT:%(trait_pairs_table)s" % locals(),
+                        output_filenames=[trait_pairs_table + ".tbi"], memory=sort_memory)
+
+            # group by allele, since clinvar_allele_trait_pairs.*.tsv will have more than 1 record for some alleles
+            if group_unsorted:
+                # from the unsorted normalized table, so that this runs at the same time as the sort above
+                job.add("python -u IN:group_by_allele.py -i IN:%(tmp_dir)s/clinvar_table_normalized.%(fsuffix)s.tsv.gz --unsorted -S %(sort_buffer_size)s -T %(tmp_dir)s | bgzip -c > OUT:%(tmp_dir)s/clinvar_alleles_grouped.%(fsuffix)s.tsv.gz" % dict(locals(), sort_buffer_size=args.sort_buffer_size),
+                        memory=sort_memory)
+            else:
+                job.add("python -u IN:group_by_allele.py -i IN:%(trait_pairs_table)s%(group_args)s | bgzip -c > OUT:%(tmp_dir)s/clinvar_alleles_grouped.%(fsuffix)s.tsv.gz" % locals(),
+                        input_filenames=[trait_pairs_table + ".tbi"])
+
+            # join information from the tab-delimited summary to the normalized genomic coordinates
+            job.add("python IN:join_variant_summary_with_clinvar_alleles.py "
+                    "IN:%(variant_summary_table)s "
+                    "IN:%(tmp_dir)s/clinvar_alleles_grouped.%(fsuffix)s.tsv.gz "
+                    "OUT:%(tmp_dir)s/clinvar_alleles_combined.%(fsuffix)s.tsv.gz "
+                    "%(genome_build_id)s" % locals())
+
+            # sort again by genomic coordinates
+            job.add("python -u IN:sort_table.py -i IN:%(tmp_dir)s/clinvar_alleles_combined.%(fsuffix)s.tsv.gz -o OUT:%(alleles_table)s --tabix %(sort_args)s" % locals(),
+                    output_filenames=[alleles_table + ".tbi"], memory=sort_memory)
+
+        # make the vcf, the example files, the Parquet dataset and the stats, and run basic checks, in one read through
+        # the table (see fan_out_alleles_table.py). The example files contain the 1st 750 lines of the compressed
+        # tsvs so people can easily see typical values online on github
+        job.add(("python -u IN:fan_out_alleles_table.py -i IN:%(alleles_table)s -R IN:%(reference_genome)s "
+                 "--vcf OUT:%(alleles_vcf)s "
+                 "--vcf-example OUT:%(output_dir)s/clinvar_alleles_example_750_rows.%(fsuffix)s.vcf "
+                 "--table-example OUT:%(output_dir)s/clinvar_alleles_example_750_rows.%(fsuffix)s.tsv "
+                 "--parquet OUT:%(output_dir)s/clinvar_alleles.%(fsuffix)s.parquet "
+                 "--stats OUT:%(output_dir)s/clinvar_alleles_stats.%(fsuffix)s.txt "
+                 "--check %(fan_out_args)s") % locals(),
+                output_filenames=[alleles_vcf + ".tbi"])
+
+        # export the allele-trait pairs to a Parquet dataset partitioned by chromosome, with typed columns (see export_parquet.py)
+        job.add("python -u IN:export_parquet.py -i IN:%(trait_pairs_table)s -o OUT:%(output_dir)s/clinvar_allele_trait_pairs.%(fsuffix)s.parquet" % locals())
+
+        # the trait pairs example only reads the start of the table
+        job.add("gunzip -c IN:%(trait_pairs_table)s | head -n 750 > OUT:%(output_dir)s/clinvar_allele_trait_pairs_example_750_rows.%(fsuffix)s.tsv" % locals())
 
         # create tsv table with extra fields from ExAC: filter, ac_adj, an_adj, popmax_ac, popmax_an, popmax
         if genome_build == "b37":
@@ -214,32 +319,31 @@ for genome_build in ('b37', 'b38'):
                     continue
                 script_name = "add_exac_fields.py" if label == "exac_v1" else "add_gnomad_fields.py"
                 normalized_vcf = os.path.basename(vcf_path).split('.vcf')[0] + ".normalized.vcf.gz" % locals()
+                with_label_table = "%(output_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz" % locals()
                 job.add(("vt decompose -s IN:%(vcf_path)s | "
                          "vt normalize -r IN:%(reference_genome)s - | "
-                         "bgzip -c > OUT:%(tmp_dir)s/%(normalized_vcf)s") % locals())
-                job.add("tabix IN:%(tmp_dir)s/%(normalized_vcf)s" % locals(), output_filenames=["%(tmp_dir)s/%(normalized_vcf)s.tbi" % locals()])
-                job.add(("python -u IN:%(script_name)s -i IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz %(vcf_arg)s IN:%(tmp_dir)s/%(normalized_vcf)s | "
-                         "bgzip -c > OUT:%(tmp_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz") % locals())
-                job.add("tabix -S 1 -s 1 -b 2 -e 2 IN:%(tmp_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz" % locals(), output_filenames=["%(tmp_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz.tbi" % locals()])
-                job.add("cp IN:%(tmp_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz IN:%(tmp_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz.tbi %(output_dir)s/" % locals(), output_filenames=[
-                    "%(output_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz" % locals(),
-                    "%(output_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz.tbi" % locals()])
-
-                job.add("gunzip -c IN:%(tmp_dir)s/clinvar_alleles_with_%(label)s.%(fsuffix)s.tsv.gz | head -n 750 > OUT:%(output_dir)s/clinvar_alleles_with_%(label)s_example_750_rows.%(fsuffix)s.tsv" % locals())
-
-        job.add(
-            "python clinvar_alleles_stats.py "
-            "IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz "
-            "> OUT:%(tmp_dir)s/clinvar_alleles_stats.%(fsuffix)s.txt" %
-            locals(),
-            input_filenames=[
-                "%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz" % locals(),
-                "clinvar_alleles_stats.py"])
-
-        job.add("cp IN:%(tmp_dir)s/clinvar_alleles_stats.%(fsuffix)s.txt OUT:%(output_dir)s/clinvar_alleles_stats.%(fsuffix)s.txt" % locals())
-
-        # run basic checks
-        job.add("python IN:check_allele_table.py IN:%(tmp_dir)s/clinvar_alleles.%(fsuffix)s.tsv.gz" % locals())
-
-# run the above commands
-jr.run(job)
+                         "python -u IN:tabix_writer.py -p vcf %(compression_args)s -o OUT:%(tmp_dir)s/%(normalized_vcf)s") % locals(),
+                        output_filenames=["%(tmp_dir)s/%(normalized_vcf)s.tbi" % locals()])
+                job.add(("python -u IN:%(script_name)s -i IN:%(alleles_table)s %(vcf_arg)s IN:%(tmp_dir)s/%(normalized_vcf)s | "
+                         "python -u IN:tabix_writer.py -p tsv %(compression_args)s -o OUT:%(with_label_table)s") % locals(),
+                        input_filenames=["%(tmp_dir)s/%(normalized_vcf)s.tbi" % locals()], output_filenames=[with_label_table + ".tbi"])
+
+                job.add("gunzip -c IN:%(with_label_table)s | head -n 750 > OUT:%(output_dir)s/clinvar_alleles_with_%(label)s_example_750_rows.%(fsuffix)s.tsv" % locals())
+
+
+# run the above commands, and write a report of the time, CPU and memory used by each of them, and the sizes of their
+# input and output files, to <output-prefix>run_report.json
+try:
+    job.run()
+except PipelineError as e:
+    sys.exit("ERROR: %s" % e)
+finally:
+    report = job.get_report()
+    report['args'] = vars(args)
+    report_path = output_prefix + "run_report.json"
+    if os.path.dirname(report_path):
+        os.system("mkdir -p " + os.path.dirname(report_path))
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(format_report_summary(report))
+    print("Wrote run report to " + report_path)
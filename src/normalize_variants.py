@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+"""
+Normalize the variants in a table from parse_clinvar_xml.py: trim the bases that REF and ALT share, and left-align
+indels, as described in Tan et al. 2015 (https://doi.org/10.1093/bioinformatics/btv112) and done by vt normalize. This
+replaces normalize.py from https://github.com/ericminikel/minimal_representation, and drops the same rows: those whose
+REF and ALT are the same, whose REF doesn't match the reference genome, or that contain other letters than A, C, G, T
+and N.
+
+Rows are read in batches, and each batch is normalized one chromosome at a time in order of position, so that the
+reference sequence can be read from the genome .fa in windows instead of a few bases at a time.
+
+Usage:
+    python normalize_variants.py -i clinvar_table_raw.single.b37.tsv.gz -R b37.fa -o clinvar_table_normalized.tsv.gz
+
+With --sort, the normalized rows are passed straight to sort_table.py's sort, and the output is the sorted table.
+"""
+
+import argparse
+import gzip
+import sys
+from collections import defaultdict
+
+from sort_table import sort_lines, parse_size, open_output
+
+VALID_BASES = frozenset('ACGTN')
+
+
+class NormalizationError(ValueError):
+    pass
+
+
+class RefEqualsAltError(NormalizationError):
+    pass
+
+
+class WrongRefError(NormalizationError):
+    pass
+
+
+class InvalidNucleotideSequenceError(NormalizationError):
+    pass
+
+
+class ReferenceCache(object):
+    """Reads the reference sequence through a window that's moved as needed, so that nearby fetches don't each read
+    from the .fa file
+    """
+
+    def __init__(self, fasta, window_size=2**16):
+        """
+        Args:
+            fasta: pysam.FastaFile, or another object with a fetch(chrom, start, end) method that takes 0-based
+                half-open coordinates
+            window_size: Number of bases to read at a time
+        """
+        self.fasta = fasta
+        self.window_size = window_size
+        self._chrom = None
+        self._start = 0
+        self._sequence = ''
+        self.reads = 0
+
+    def fetch(self, chrom, start, end):
+        """Returns the reference bases from the 0-based start up to end, in upper case"""
+        if chrom != self._chrom or start < self._start or end > self._start + len(self._sequence):
+            # leave some room before start, since left-aligning an indel reads the bases before it
+            window_start = max(0, start - self.window_size // 4)
+            window_end = max(end, window_start + self.window_size)
+            try:
+                sequence = self.fasta.fetch(chrom, window_start, window_end)
+            except (KeyError, ValueError) as e:
+                raise WrongRefError("Chromosome %s not found in the reference genome: %s" % (chrom, e))
+            self._chrom = chrom
+            self._start = window_start
+            self._sequence = sequence.upper()
+            self.reads += 1
+        # past the end of the chromosome, this returns the bases there are, like pysam does
+        return self._sequence[start - self._start:end - self._start]
+
+
+def normalize(reference, chrom, pos, ref, alt):
+    """Returns the minimal, left-aligned representation of a variant as (chrom, pos, ref, alt).
+
+    Args:
+        reference: ReferenceCache for the reference genome
+        chrom, pos, ref, alt: the variant, with pos 1-based. A REF or ALT of '-' means an empty allele.
+
+    Raises:
+        InvalidNucleotideSequenceError, WrongRefError or RefEqualsAltError
+    """
+    pos = int(pos)
+    ref = ref.upper()
+    alt = alt.upper()
+    if not VALID_BASES.issuperset(ref.replace('-', '')) or not VALID_BASES.issuperset(alt.replace('-', '')):
+        raise InvalidNucleotideSequenceError("Invalid nucleotide sequence: %s %s %s %s" % (chrom, pos, ref, alt))
+    if ref == '-':
+        ref = ''
+    if alt == '-':
+        alt = ''
+
+    true_ref = reference.fetch(chrom, pos - 1, pos - 1 + len(ref))
+    if ref != true_ref:
+        raise WrongRefError("Incorrect REF value: %s %s %s %s (actual REF should be %s)" % (
+            chrom, pos, ref, alt, true_ref))
+    if ref == alt:
+        raise RefEqualsAltError("The REF and ALT allele are the same: %s %s %s %s" % (chrom, pos, ref, alt))
+
+    # SNVs are already minimal
+    if len(ref) == 1 and len(alt) == 1:
+        return chrom, pos, ref, alt
+
+    # trim the last base while REF and ALT end the same way, extending both to the left by a reference base whenever
+    # one of them becomes empty. This moves indels in repeats to their leftmost position, or to the start of the
+    # chromosome, where the last base is kept instead.
+    while True:
+        if (not ref or not alt) and pos > 1:
+            pos -= 1
+            preceding_base = reference.fetch(chrom, pos - 1, pos)
+            ref = preceding_base + ref
+            alt = preceding_base + alt
+        elif ref and alt and ref[-1] == alt[-1] and (pos > 1 or min(len(ref), len(alt)) > 1):
+            ref = ref[:-1]
+            alt = alt[:-1]
+        else:
+            break
+
+    # trim the bases they start with
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref = ref[1:]
+        alt = alt[1:]
+        pos += 1
+
+    return chrom, pos, ref, alt
+
+
+def normalize_lines(lines, column_names, reference, batch_size=100000, dropped_counter=None, log=None):
+    """Normalize the variants in table rows.
+
+    Args:
+        lines: Iterable of the table's lines, not including the header
+        column_names: The table's column names, which must include chrom, pos, ref and alt
+        reference: ReferenceCache for the reference genome
+        batch_size: Number of rows to read before normalizing them in order of chromosome and position
+        dropped_counter: Optional defaultdict(int) that's incremented for each dropped row, by the name of the error
+        log: Optional function to call with a message for each dropped row
+
+    Yields:
+        the normalized lines. Within each batch, they're in order of chromosome and position rather than in the
+        order they were read.
+    """
+    chrom_column, pos_column, ref_column, alt_column = [column_names.index(column)
+                                                        for column in ('chrom', 'pos', 'ref', 'alt')]
+    batch = defaultdict(list)
+    batch_rows = 0
+    lines = iter(lines)
+    while True:
+        for line in lines:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            values = line.split('\t')
+            values += [''] * (len(column_names) - len(values))
+            try:
+                pos = int(values[pos_column])
+            except ValueError:
+                pos = 0
+            batch[values[chrom_column]].append((pos, values))
+            batch_rows += 1
+            if batch_rows >= batch_size:
+                break
+
+        if not batch_rows:
+            return
+
+        for batch_chrom in sorted(batch):
+            rows = batch[batch_chrom]
+            rows.sort(key=lambda row: row[0])
+            for _, values in rows:
+                try:
+                    chrom, pos, ref, alt = normalize(reference, values[chrom_column], values[pos_column],
+                                                     values[ref_column], values[alt_column])
+                except (NormalizationError, ValueError) as e:
+                    if dropped_counter is not None:
+                        dropped_counter[type(e).__name__] += 1
+                    if log is not None:
+                        log(str(e))
+                    continue
+                values[chrom_column] = chrom
+                values[pos_column] = str(pos)
+                values[ref_column] = ref
+                values[alt_column] = alt
+                yield '\t'.join(values) + '\n'
+
+        batch = defaultdict(list)
+        batch_rows = 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Normalize the variants in a table from parse_clinvar_xml.py')
+    parser.add_argument('-i', '--infile', default='-', help="Path of the table. Can be gzipped. Default: stdin")
+    parser.add_argument('-R', '--reference-genome', required=True, help=".fa genome reference file")
+    parser.add_argument('-o', '--outfile', default='-',
+                        help="Path to write the normalized table to. Written as BGZF if it ends in .gz. Default: stdout")
+    parser.add_argument('--sort', action='store_true', help="Sort the normalized table by genomic coordinates")
+    parser.add_argument('-S', '--buffer-size', type=parse_size, default='1G', help="With --sort: see sort_table.py")
+    parser.add_argument('-p', '--processes', type=int, default=1, help="With --sort: see sort_table.py")
+    parser.add_argument('-T', '--tmp-dir', help="With --sort: see sort_table.py")
+    parser.add_argument('--tabix', action='store_true', help="With --sort: see sort_table.py")
+    parser.add_argument('-@', '--threads', type=int, default=1, help="Number of threads to compress the output with")
+    args = parser.parse_args()
+
+    import pysam
+
+    if args.infile == '-':
+        infile = sys.stdin
+    else:
+        infile = gzip.open(args.infile) if args.infile.endswith('.gz') else open(args.infile)
+    if args.outfile == '-':
+        outfile = sys.stdout
+    else:
+        outfile = open_output(args.outfile, args.sort and args.tabix, args.threads)
+
+    header = next(infile)
+    outfile.write(header)
+    reference = ReferenceCache(pysam.FastaFile(args.reference_genome))
+    dropped_counter = defaultdict(int)
+    lines = normalize_lines(infile, header.rstrip('\n').split('\t'), reference, dropped_counter=dropped_counter,
+                            log=lambda message: sys.stderr.write(message + '\n'))
+    if args.sort:
+        lines = sort_lines(lines, buffer_size=args.buffer_size, processes=args.processes, tmp_dir=args.tmp_dir)
+    counter = 0
+    with outfile:
+        for line in lines:
+            outfile.write(line)
+            counter += 1
+    infile.close()
+    sys.stderr.write("Wrote %d rows. Dropped: %s. Reference reads: %d\n" % (
+        counter, ", ".join("%d %s" % (count, name) for name, count in sorted(dropped_counter.items())) or "none",
+        reference.reads))
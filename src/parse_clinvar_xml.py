@@ -1,18 +1,45 @@
 #!/usr/bin/env python
 
+from __future__ import print_function
+
+import io
+import os
 import re
 import sys
+import time
 import gzip
+import hashlib
 import argparse
-from collections import defaultdict
+import threading
+import subprocess
+import multiprocessing
+import resource
+from collections import defaultdict, deque
+from distutils import spawn
 import xml.etree.ElementTree as ET
 
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from bgzf import BgzfWriter
+from table_io import TableWriter, read_blocks
+
 # then sort it: cat clinvar_table.tsv | head -1 > clinvar_table_sorted.tsv; cat clinvar_table.tsv | tail -n +2 | sort  -k1,1 -k2,2n -k3,3 -k4,4 >> clinvar_table_sorted.tsv Reference on clinvar XML tag:
 # ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/clinvar_submission.xsd Reference on clinvar XML tag:
 # ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/tab_delimited/README
 
-mentions_pubmed_regex = '(?:PubMed|PMID)(.*)'  # group(1) will be all the text after the word PubMed or PMID
-extract_pubmed_id_regex = '[^0-9]+([0-9]+)[^0-9](.*)'  # group(1) will be the first PubMed ID, group(2) will be all remaining text
+mentions_pubmed_regex = re.compile('(?:PubMed|PMID)(.*)')  # group(1) will be all the text after the word PubMed or PMID
+extract_pubmed_id_regex = re.compile('[^0-9]([0-9]+)[^0-9]')  # group(1) will be a PubMed ID - see extract_comment_pmids
+
+# used to split the decompressed XML stream into chunks of whole ClinVarSets for parallel parsing
+clinvarset_start_regex = re.compile(br'<ClinVarSet[\s>]')
+CLINVARSET_END_TAG = b'</ClinVarSet>'
+RELEASESET_END_TAG = b'</ReleaseSet>'
+
+# used to find the cache key of a ClinVarSet in incremental mode without parsing it
+rcv_accession_regex = re.compile(br'<ClinVarAccession [^>]*Acc="(RCV[0-9]+)"')
 
 HEADER = ['chrom', 'pos', 'ref', 'alt', 'start', 'stop', 'strand', 'variation_type', 'variation_id', 'rcv', 'scv',
           'allele_id', 'symbol',
@@ -33,7 +60,8 @@ def remove_newlines_and_tabs(s):
     return re.sub("[\t\n\r]", " ", s)
 
 
-def parse_clinvar_tree(handle, dest=sys.stdout, multi=None, verbose=True, genome_build='GRCh37'):
+def parse_clinvar_tree(handle, dest=sys.stdout, multi=None, verbose=True, genome_build='GRCh37', processes=1,
+                       chunk_size=2**23, streaming=False, cache=None, buffer_size=2**16):
     """Parse clinvar XML
     Args:
         handle: Open input file handle for reading the XML data
@@ -41,208 +69,785 @@ def parse_clinvar_tree(handle, dest=sys.stdout, multi=None, verbose=True, genome
         multi: Open output file handle or stream for complex non-single-variant clinvar records
             (eg. compound het, haplotypes, etc.)
         verbose: Whether to write extra stats to stderr
-        genome_build: Either 'GRCh37' or 'GRCh38'
+        genome_build: Either 'GRCh37' or 'GRCh38', or a list of genome builds to extract from the same traversal of
+            the XML. If a list is given, dest and multi must be dictionaries that map each genome build to its output
+            file handle.
+        processes: Number of worker processes. If > 1, the decompressed XML is split into chunks of whole
+            ClinVarSets which are parsed in parallel, and the rows are written in the original order.
+        chunk_size: Approximate number of bytes of XML per chunk when processes > 1
+        streaming: If True, each ClinVarSet is removed from the <ReleaseSet> root element once it's been processed,
+            so that memory use stays constant instead of growing with the size of the release.
+        cache: Optional clinvar_set_cache.ClinVarSetCache. If given, only ClinVarSets that are new or have changed
+            since the previous release are parsed, and the cached rows are written for the others. The output is the
+            same as without the cache. The cache is committed at the end.
+        buffer_size: Rows are collected and written to each output in batches of about this many bytes. The outputs
+            are flushed at the end, but not closed.
+
+    Returns:
+        dictionary with the number of ClinVarSets processed ('clinvar_sets'), how many of them were taken from the
+        cache ('cached_clinvar_sets'), the number of rows written ('rows'), and the time taken in seconds ('seconds')
     """
+    start_time = time.time()
 
     # variation -> rcv (one to many)
 
-    dest.write(('\t'.join(HEADER) + '\n').encode('utf-8'))
-    if multi is not None:
-        multi.write(('\t'.join(HEADER) + '\n').encode('utf-8'))
+    if isinstance(genome_build, (list, tuple)):
+        genome_builds = tuple(genome_build)
+        multi = multi or {}
+    else:
+        genome_builds = (genome_build,)
+        dest = {genome_build: dest}
+        multi = {genome_build: multi}
+
+    dest = dict((build, TableWriter(dest[build], buffer_size)) for build in genome_builds)
+    multi = dict((build, TableWriter(multi[build], buffer_size)) for build in genome_builds
+                 if multi.get(build) is not None)
+
+    for build in genome_builds:
+        dest[build].write(('\t'.join(HEADER) + '\n').encode('utf-8'))
+        if build in multi:
+            multi[build].write(('\t'.join(HEADER) + '\n').encode('utf-8'))
 
     scounter = 0
     mcounter = 0
     skipped_counter = defaultdict(int)
-    for event, elem in ET.iterparse(handle):
+    clinvar_set_counter = defaultdict(int)
+    if cache is not None:
+        rows = _iter_rows_incremental(handle, genome_builds, skipped_counter, clinvar_set_counter, cache, processes,
+                                      chunk_size)
+    elif processes > 1:
+        rows = _iter_rows_parallel(handle, genome_builds, skipped_counter, clinvar_set_counter, processes, chunk_size,
+                                   streaming)
+    else:
+        rows = _iter_rows(handle, genome_builds, skipped_counter, clinvar_set_counter, streaming)
+
+    for row in rows:
+        if row is None:
+            break  # the XML contained a non-RCV record
+
+        build, is_multi, line = row
+        if not is_multi:
+            dest[build].write(line)
+            scounter += 1
+        else:
+            if build in multi:
+                multi[build].write(line)
+                mcounter += 1
+
+        counter = scounter + mcounter
+        if verbose and counter % 100 == 0:
+            sys.stderr.write("{0} entries completed, {1}, {2} total \r".format(
+                counter,
+                ', '.join('%s skipped due to %s' % (v, k) for k, v in skipped_counter.items()),
+                counter + sum(skipped_counter.values())
+            ))
+            sys.stderr.flush()
+
+    for f in list(dest.values()) + list(multi.values()):
+        f.flush()
+
+    sys.stderr.write("Done\n")
+
+    if cache is not None:
+        cache.commit()
+
+    return {
+        'clinvar_sets': clinvar_set_counter['ClinVarSet'],
+        'cached_clinvar_sets': clinvar_set_counter['cached'],
+        'rows': scounter + mcounter,
+        'seconds': time.time() - start_time,
+    }
+
+
+def _iter_rows(handle, genome_builds, skipped_counter, clinvar_set_counter, streaming=False, log=print):
+    """Parse the XML serially, yielding (genome_build, is_multi, line) tuples in file order, followed by None if
+    parsing stopped early because of a non-RCV record.
+    """
+
+    if streaming:
+        # the first event is the start of the <ReleaseSet> root, which iterparse would otherwise keep (cleared)
+        # references to every ClinVarSet under
+        context = ET.iterparse(handle, events=('start', 'end'))
+        event, root = next(context)
+    else:
+        context = ET.iterparse(handle)
+        root = None
+
+    for event, elem in context:
         if elem.tag != 'ClinVarSet' or event != 'end':
             continue
 
-        # initialize all the fields
-        current_row = {}
-        current_row['rcv'] = ''
-        current_row['variation_type'] = ''
-        current_row['variation_id'] = ''
-        current_row['allele_id'] = ''
+        clinvar_set_counter['ClinVarSet'] += 1
 
-        rcv = elem.find('./ReferenceClinVarAssertion/ClinVarAccession')
-        if rcv.attrib.get('Type') != 'RCV':
-            print("Error, not RCV record")
+        rows = parse_clinvar_set(elem, genome_build=genome_builds, skipped_counter=skipped_counter, log=log)
+        if rows is None:
+            yield None
             break
-        else:
-            current_row['rcv'] = rcv.attrib.get('Acc')
 
-        ReferenceClinVarAssertion = elem.findall(".//ReferenceClinVarAssertion")
-        measureset = ReferenceClinVarAssertion[0].findall(".//MeasureSet")
+        for build, is_multi, row in rows:
+            yield build, is_multi, ('\t'.join(row) + '\n').encode('utf-8')
+
+        # done parsing the xml for this one clinvar set.
+        elem.clear()
+        if root is not None:
+            del root[:]  # the ClinVarSet that just ended is the only child that's been added since the last one
 
-        # only the ones with just one measure set can be recorded
-        if len(measureset) > 1:
-            print("A submission has more than one measure set." + elem.find('./Title').text)
-            elem.clear()
-            continue
-        elif len(measureset) == 0:
-            print("A submission has no measure set type" + measureset.attrib.get('ID'))
-            elem.clear()
-            continue
 
-        measureset = measureset[0]
+def _iter_release_chunks(handle, chunk_size):
+    """Split the decompressed XML stream at ClinVarSet boundaries.
 
-        measure = measureset.findall('.//Measure')
+    Yields:
+        (prolog, chunk) tuples, where prolog is everything before the first ClinVarSet (the <?xml> declaration and
+        the <ReleaseSet> start tag) and chunk is a run of one or more complete <ClinVarSet> elements.
+    """
+    prolog = None
+    buf = b''
+    while True:
+        block = handle.read(chunk_size)
+        buf += block
+        if prolog is None:
+            match = clinvarset_start_regex.search(buf)
+            if match is None:
+                if not block:
+                    return
+                continue
+            prolog = buf[:match.start()]
+            buf = buf[match.start():]
+
+        end = buf.rfind(CLINVARSET_END_TAG)
+        if end != -1:
+            end += len(CLINVARSET_END_TAG)
+            yield prolog, buf[:end]
+            buf = buf[end:]
+
+        if not block:
+            break
 
-        current_row['variation_id'] = measureset.attrib.get('ID')
-        current_row['variation_type'] = measureset.get('Type')
+    # a truncated ClinVarSet at the end of the stream - pass it on so that parsing fails the same way it would serially
+    if clinvarset_start_regex.search(buf):
+        yield prolog, buf
 
-        # find all scv accession number
-        scv_number = []
-        for scv in elem.findall('.//ClinVarAssertion/ClinVarAccession'):
-            if scv.attrib.get('Type') == "SCV":
-                scv_number.append(scv.attrib.get('Acc'))
 
-        current_row['scv'] = ';'.join(set(scv_number))
+def _parse_release_chunk(args):
+    """Worker function for parallel parsing.
 
-        # find all the Citation nodes, and get the PMIDs out of them
-        pmids = []
-        for citation in elem.findall('.//Citation'):
-            pmids += [id_node.text for id_node in citation.findall('.//ID') if id_node.attrib.get('Source') == 'PubMed']
+    Args:
+        args: (prolog, chunk, genome_builds, streaming) tuple - see _iter_release_chunks
 
-        # now find the Comment nodes, regex your way through the comments and extract anything that appears to be a PMID
-        comment_pmids = []
-        for comment in elem.findall('.//Comment'):
-            mentions_pubmed = re.search(mentions_pubmed_regex, comment.text)
-            if mentions_pubmed is not None and mentions_pubmed.group(1) is not None:
-                remaining_text = mentions_pubmed.group(1)
-                while True:
-                    pubmed_id_extraction = re.search(extract_pubmed_id_regex, remaining_text)
-                    if pubmed_id_extraction is None:
-                        break
-                    elif pubmed_id_extraction.group(1) is not None:
-                        comment_pmids.append(pubmed_id_extraction.group(1))
-                        if pubmed_id_extraction.group(2) is not None:
-                            remaining_text = pubmed_id_extraction.group(2)
-
-        current_row['all_pmids'] = ';'.join(sorted(set(pmids + comment_pmids)))
-
-        # now find any/all submitters
-        submitters_ordered = []
-        for submitter_node in elem.findall('.//ClinVarSubmissionID'):
-            if submitter_node.attrib is not None and submitter_node.attrib.has_key('submitter'):
-                submitters_ordered.append(submitter_node.attrib['submitter'].replace(';', ','))
-
-        # all_submitters will get deduplicated while submitters_ordered won't
-        current_row['submitters_ordered'] = ';'.join(submitters_ordered)
-        current_row['all_submitters'] = ";".join(set(submitters_ordered))
-
-        # find the clincial significance and review status reported in RCV(aggregated from SCV)
-        current_row['clinical_significance'] = []
-        current_row['review_status'] = []
-
-        clinical_significance = elem.find('.//ReferenceClinVarAssertion/ClinicalSignificance')
-        if clinical_significance.find('.//ReviewStatus') is not None:
-            current_row['review_status'] = clinical_significance.find('.//ReviewStatus').text;
-        if clinical_significance.find('.//Description') is not None:
-            current_row['clinical_significance'] = clinical_significance.find('.//Description').text
-
-        current_row['last_evaluated'] = '0000-00-00'
-        if clinical_significance.attrib.get('DateLastEvaluated') is not None:
-            current_row['last_evaluated'] = clinical_significance.attrib.get('DateLastEvaluated', '0000-00-00')
-
-        # match the order of the submitter list - edit 2/22/17
-        current_row['review_status_ordered'] = ';'.join([
-            x.text for x in elem.findall('.//ClinVarAssertion/ClinicalSignificance/ReviewStatus') if x is not None
-        ])
-
-        list_significance= [
-            x.text.lower() for x in elem.findall('.//ClinVarAssertion/ClinicalSignificance/Description') if x is not None
-        ]
-
-        current_row['pathogenic'] = str(list_significance.count("pathogenic"))
-        current_row['likely_pathogenic'] = str(list_significance.count("likely pathogenic"))
-        current_row['uncertain_significance']=str(list_significance.count("uncertain significance"))
-        current_row['benign']=str(list_significance.count("benign"))
-        current_row['likely_benign']=str(list_significance.count("likely benign"))
-
-        current_row['clinical_significance_ordered'] = ";".join(list_significance)
-
-        current_row['dates_ordered'] = ';'.join([
-            x.attrib.get('DateLastEvaluated', '0000-00-00')
-            for x in elem.findall('.//ClinVarAssertion/ClinicalSignificance')
-            if x is not None
-        ])
-
-        # init new fields
-        for list_column in ('inheritance_modes', 'age_of_onset', 'prevalence', 'disease_mechanism', 'xrefs'):
-            current_row[list_column] = set()
-
-        # now find the disease(s) this variant is associated with
-        current_row['all_traits'] = []
-        for traitset in elem.findall('.//TraitSet'):
-            disease_name_nodes = traitset.findall('.//Name/ElementValue')
-            trait_values = []
-            for disease_name_node in disease_name_nodes:
-                if disease_name_node.attrib is not None and disease_name_node.attrib.get('Type') == 'Preferred':
-                    trait_values.append(disease_name_node.text)
-            current_row['all_traits'] += trait_values
-
-            for attribute_node in traitset.findall('.//AttributeSet/Attribute'):
-                attribute_type = attribute_node.attrib.get('Type')
-                if attribute_type in {'ModeOfInheritance', 'age of onset', 'prevalence', 'disease mechanism'}:
-                    column_name = 'inheritance_modes' if attribute_type == 'ModeOfInheritance' else attribute_type.replace(
-                        ' ', '_')
-                    column_value = attribute_node.text.strip()
-                    if column_value:
-                        current_row[column_name].add(column_value)
-
-                        # put all the cross references one column, it may contains NCBI gene ID, conditions ID in disease databases.
-            for xref_node in traitset.findall('.//XRef'):
-                xref_db = xref_node.attrib.get('DB')
-                xref_id = xref_node.attrib.get('ID')
-                current_row['xrefs'].add("%s:%s" % (xref_db, xref_id))
-
-        current_row['origin'] = set()
-        for origin in elem.findall('.//ReferenceClinVarAssertion/ObservedIn/Sample/Origin'):
-            current_row['origin'].add(origin.text)
-
-        for column_name in (
-                'all_traits', 'inheritance_modes', 'age_of_onset', 'prevalence', 'disease_mechanism', 'origin',
-                'xrefs'):
-            column_value = current_row[column_name] if type(current_row[column_name]) == list else sorted(
-                current_row[column_name])  # sort columns of type 'set' to get deterministic order
-            current_row[column_name] = remove_newlines_and_tabs(';'.join(map(replace_semicolons, column_value)))
-
-        current_row['symbol'] = ''
-        var_name = measureset.find(".//Name/ElementValue").text
-        if var_name is not None:
-            match = re.search(r"\(([A-Za-z0-9]+)\)", var_name)
-            if match is not None:
-                genesymbol = match.group(1)
-                current_row['symbol'] = genesymbol
-
-        for i in range(len(measure)):
-
-            if current_row['symbol'] is None:
-                genesymbol = measure[i].findall('.//Symbol')
-                if genesymbol is not None:
-                    for symbol in genesymbol:
-                        if (symbol.find('ElementValue').attrib.get('Type') == 'Preferred'):
-                            current_row['symbol'] = symbol.find('ElementValue').text;
-                            break
+    Returns:
+        (events, skipped_counter, clinvar_set_counter) tuple where events is a list of log messages and the items
+        yielded by _iter_rows, in file order.
+    """
+    prolog, chunk, genome_builds, streaming = args
 
-            # find the allele ID (//Measure/@ID)
-            current_row['allele_id'] = measure[i].attrib.get('ID')
-            # find the GRCh37 or GRCh38 VCF representation
-            genomic_location = None
+    events = []
+    skipped_counter = defaultdict(int)
+    clinvar_set_counter = defaultdict(int)
+    for row in _iter_rows(io.BytesIO(prolog + chunk + RELEASESET_END_TAG), genome_builds, skipped_counter,
+                          clinvar_set_counter, streaming, log=events.append):
+        events.append(row)
+
+    return events, dict(skipped_counter), dict(clinvar_set_counter)
+
+
+def _iter_rows_parallel(handle, genome_builds, skipped_counter, clinvar_set_counter, processes, chunk_size,
+                        streaming=False, log=print):
+    """Parse chunks of the XML in a process pool, yielding the same items as _iter_rows in file order"""
+
+    pool = multiprocessing.Pool(processes)
+    pending = deque()  # only keep a few chunks in flight so memory use doesn't grow with the size of the release
+    try:
+        chunks = _iter_release_chunks(handle, chunk_size)
+        while True:
+            for prolog, chunk in chunks:
+                pending.append(pool.apply_async(_parse_release_chunk, ((prolog, chunk, genome_builds, streaming),)))
+                if len(pending) >= 2 * processes:
+                    break
+
+            if not pending:
+                break
+
+            events, chunk_skipped_counter, chunk_clinvar_set_counter = pending.popleft().get()
+            for key, value in chunk_skipped_counter.items():
+                skipped_counter[key] += value
+            for key, value in chunk_clinvar_set_counter.items():
+                clinvar_set_counter[key] += value
+            for event in events:
+                if event is None or isinstance(event, tuple):
+                    yield event
+                else:
+                    log(event)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _split_clinvar_sets(chunk):
+    """Split a chunk from _iter_release_chunks into the raw XML of each of its ClinVarSets"""
+    clinvar_sets = []
+    start_match = clinvarset_start_regex.search(chunk)
+    while start_match is not None:
+        end = chunk.find(CLINVARSET_END_TAG, start_match.start())
+        if end == -1:
+            clinvar_sets.append(chunk[start_match.start():])  # truncated - parsing it will raise the usual error
+            break
+        end += len(CLINVARSET_END_TAG)
+        clinvar_sets.append(chunk[start_match.start():end])
+        start_match = clinvarset_start_regex.search(chunk, end)
 
-            for sequence_location in measure[i].findall(".//SequenceLocation"):
-                if sequence_location.attrib.get('Assembly') == genome_build:
-                    if all(sequence_location.attrib.get(key) is not None for key in
-                           ('Chr', 'start', 'referenceAllele', 'alternateAllele')):
-                        genomic_location = sequence_location
-                        break
-            # break after finding the first non-empty GRCh37 or GRCh38 location
+    return clinvar_sets
 
+
+def _parse_clinvar_sets(args):
+    """Worker function for incremental parsing.
+
+    Args:
+        args: (prolog, clinvar_sets, genome_builds) tuple where clinvar_sets is a list of the raw XML of ClinVarSets
+
+    Returns:
+        list with a dictionary for each ClinVarSet, with the 'events' of _parse_release_chunk and the 'skipped'
+        counts for that ClinVarSet
+    """
+    prolog, clinvar_sets, genome_builds = args
+
+    results = []
+    for clinvar_set in clinvar_sets:
+        events, skipped, _ = _parse_release_chunk((prolog, clinvar_set, genome_builds, False))
+        results.append({'events': events, 'skipped': skipped})
+
+    return results
+
+
+class _SerialResult(object):
+    """Stands in for multiprocessing's AsyncResult when there's only 1 process"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def _iter_rows_incremental(handle, genome_builds, skipped_counter, clinvar_set_counter, cache, processes, chunk_size,
+                           log=print):
+    """Yield the same items as _iter_rows in file order, only parsing the ClinVarSets that aren't in the cache"""
+
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    pending = deque()
+    try:
+        chunks = _iter_release_chunks(handle, chunk_size)
+        while True:
+            for prolog, chunk in chunks:
+                clinvar_sets = []
+                for clinvar_set in _split_clinvar_sets(chunk):
+                    match = rcv_accession_regex.search(clinvar_set)
+                    rcv = match.group(1).decode('ascii') if match is not None else None
+                    sha1 = hashlib.sha1(clinvar_set).hexdigest()
+                    cached = cache.get(rcv, sha1) if rcv is not None else None
+                    clinvar_sets.append((rcv, sha1, clinvar_set, cached))
+
+                args = (prolog, [clinvar_set for _, _, clinvar_set, cached in clinvar_sets if cached is None],
+                        genome_builds)
+                if pool is not None:
+                    pending.append((clinvar_sets, pool.apply_async(_parse_clinvar_sets, (args,))))
+                else:
+                    pending.append((clinvar_sets, _SerialResult(_parse_clinvar_sets(args))))
+                if len(pending) >= 2 * processes:
+                    break
+
+            if not pending:
+                break
+
+            clinvar_sets, parsed = pending.popleft()
+            parsed = iter(parsed.get())
+            for rcv, sha1, clinvar_set, cached in clinvar_sets:
+                result = cached if cached is not None else next(parsed)
+                if rcv is not None and None not in result['events']:
+                    cache.put(rcv, sha1, result, reused=cached is not None)
+
+                clinvar_set_counter['ClinVarSet'] += 1
+                if cached is not None:
+                    clinvar_set_counter['cached'] += 1
+                for key, value in result['skipped'].items():
+                    skipped_counter[key] += value
+                for event in result['events']:
+                    if event is None:
+                        yield None
+                        return
+                    elif isinstance(event, tuple):
+                        yield event
+                    else:
+                        log(event)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def get_parser_version():
+    """Returns a hash of this file, so that cached rows from an older version of the parser aren't reused"""
+    with open(os.path.splitext(os.path.abspath(__file__))[0] + '.py', 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ClinVarSetNodes(object):
+    """Collects every node of a ClinVarSet that parse_clinvar_set needs in a single walk of the subtree.
+
+    Each list holds the nodes that the equivalent .findall('.//...') query would return, in the same (document) order,
+    so the columns can be filled without re-scanning the subtree once per column.
+    """
+
+    def __init__(self, elem):
+        self.reference_clinvar_assertions = []
+        self.measuresets = []  # MeasureSetNodes for the MeasureSets under the first ReferenceClinVarAssertion
+        self.scv_accessions = []  # .//ClinVarAssertion/ClinVarAccession
+        self.pubmed_ids = []  # text of the PubMed .//ID nodes within each .//Citation
+        self.comments = []  # .//Comment
+        self.submitters = []  # .//ClinVarSubmissionID
+        self.rcv_clinical_significance = None  # first .//ReferenceClinVarAssertion/ClinicalSignificance
+        self.rcv_review_status = None  # first .//ReviewStatus within rcv_clinical_significance
+        self.rcv_description = None  # first .//Description within rcv_clinical_significance
+        self.scv_clinical_significances = []  # .//ClinVarAssertion/ClinicalSignificance
+        self.scv_review_statuses = []  # .//ClinVarAssertion/ClinicalSignificance/ReviewStatus
+        self.scv_descriptions = []  # .//ClinVarAssertion/ClinicalSignificance/Description
+        self.trait_names = []  # .//Name/ElementValue within each .//TraitSet
+        self.trait_attributes = []  # .//AttributeSet/Attribute within each .//TraitSet
+        self.trait_xrefs = []  # .//XRef within each .//TraitSet
+        self.origins = []  # .//ReferenceClinVarAssertion/ObservedIn/Sample/Origin
+
+        self._path = []  # tags of the ancestors of the node being visited
+        self._in_first_rca = False
+        self._in_rcv_clinical_significance = False
+        self._citation_depth = 0
+        self._traitset_depth = 0
+        self._measureset = None
+        self._measure = None
+        self._measure_relationship = None
+        self._measure_attributeset = None
+
+        self._visit(elem)
+
+    def _visit(self, node):
+        handler = self._handlers.get(node.tag)
+        if handler is None:
+            self._visit_children(node)
+        else:
+            handler(self, node)
+
+    def _visit_children(self, node):
+        self._path.append(node.tag)
+        for child in node:
+            self._visit(child)
+        self._path.pop()
+
+    def _parent_tag(self, generation=1):
+        return self._path[-generation] if len(self._path) >= generation else None
+
+    def _reference_clinvar_assertion(self, node):
+        self.reference_clinvar_assertions.append(node)
+        is_first = len(self.reference_clinvar_assertions) == 1
+        if is_first:
+            self._in_first_rca = True
+        self._visit_children(node)
+        if is_first:
+            self._in_first_rca = False
+
+    def _measureset_node(self, node):
+        outer_measureset = self._measureset
+        if self._in_first_rca:
+            self._measureset = MeasureSetNodes(node)
+            self.measuresets.append(self._measureset)
+        self._visit_children(node)
+        self._measureset = outer_measureset
+
+    def _measure_node(self, node):
+        outer_measure = self._measure
+        if self._measureset is not None:
+            self._measure = MeasureNodes(node)
+            self._measureset.measures.append(self._measure)
+        self._visit_children(node)
+        self._measure = outer_measure
+
+    def _measure_relationship_node(self, node):
+        outer_measure_relationship = self._measure_relationship
+        if self._measure is not None:
+            self._measure_relationship = MeasureRelationshipNodes(node)
+            self._measure.measure_relationships.append(self._measure_relationship)
+        self._visit_children(node)
+        self._measure_relationship = outer_measure_relationship
+
+    def _sequence_location_node(self, node):
+        if self._measure is not None:
+            self._measure.sequence_locations.append(node)
+        if self._measure_relationship is not None:
+            self._measure_relationship.sequence_locations.append(node)
+        self._visit_children(node)
+
+    def _element_value_node(self, node):
+        parent_tag = self._parent_tag()
+        if parent_tag == 'Name':
+            if self._traitset_depth:
+                self.trait_names.append(node)
+            if self._measureset is not None and self._measureset.name is None:
+                self._measureset.name = node
+        elif parent_tag == 'Symbol':
+            if self._measure_relationship is not None and self._measure_relationship.symbol is None:
+                self._measure_relationship.symbol = node
+        self._visit_children(node)
+
+    def _attributeset_node(self, node):
+        outer_attributeset = self._measure_attributeset
+        if self._measure is not None and self._parent_tag() == 'Measure':
+            self._measure_attributeset = AttributeSetNodes(node)
+            self._measure.attributesets.append(self._measure_attributeset)
+        self._visit_children(node)
+        self._measure_attributeset = outer_attributeset
+
+    def _attribute_node(self, node):
+        if self._parent_tag() == 'AttributeSet':
+            if self._traitset_depth:
+                self.trait_attributes.append(node)
+            if self._measure_attributeset is not None and self._measure_attributeset.attribute is None:
+                self._measure_attributeset.attribute = node
+        self._visit_children(node)
+
+    def _xref_node(self, node):
+        if self._traitset_depth:
+            self.trait_xrefs.append(node)
+        if self._measure_attributeset is not None:
+            self._measure_attributeset.xrefs.append(node)
+        self._visit_children(node)
+
+    def _clinvar_accession_node(self, node):
+        if self._parent_tag() == 'ClinVarAssertion':
+            self.scv_accessions.append(node)
+        self._visit_children(node)
+
+    def _citation_node(self, node):
+        self._citation_depth += 1
+        self._visit_children(node)
+        self._citation_depth -= 1
+
+    def _id_node(self, node):
+        if self._citation_depth and node.attrib.get('Source') == 'PubMed':
+            self.pubmed_ids.append(node.text)
+        self._visit_children(node)
+
+    def _comment_node(self, node):
+        self.comments.append(node)
+        self._visit_children(node)
+
+    def _clinvar_submission_id_node(self, node):
+        self.submitters.append(node)
+        self._visit_children(node)
+
+    def _clinical_significance_node(self, node):
+        parent_tag = self._parent_tag()
+        if parent_tag == 'ClinVarAssertion':
+            self.scv_clinical_significances.append(node)
+        elif parent_tag == 'ReferenceClinVarAssertion' and self.rcv_clinical_significance is None:
+            self.rcv_clinical_significance = node
+            self._in_rcv_clinical_significance = True
+            self._visit_children(node)
+            self._in_rcv_clinical_significance = False
+            return
+        self._visit_children(node)
+
+    def _review_status_node(self, node):
+        if self._in_rcv_clinical_significance and self.rcv_review_status is None:
+            self.rcv_review_status = node
+        if self._parent_tag() == 'ClinicalSignificance' and self._parent_tag(2) == 'ClinVarAssertion':
+            self.scv_review_statuses.append(node)
+        self._visit_children(node)
+
+    def _description_node(self, node):
+        if self._in_rcv_clinical_significance and self.rcv_description is None:
+            self.rcv_description = node
+        if self._parent_tag() == 'ClinicalSignificance' and self._parent_tag(2) == 'ClinVarAssertion':
+            self.scv_descriptions.append(node)
+        self._visit_children(node)
+
+    def _traitset_node(self, node):
+        self._traitset_depth += 1
+        self._visit_children(node)
+        self._traitset_depth -= 1
+
+    def _origin_node(self, node):
+        if self._path[-3:] == ['ReferenceClinVarAssertion', 'ObservedIn', 'Sample']:
+            self.origins.append(node)
+        self._visit_children(node)
+
+    _handlers = {
+        'ReferenceClinVarAssertion': _reference_clinvar_assertion,
+        'MeasureSet': _measureset_node,
+        'Measure': _measure_node,
+        'MeasureRelationship': _measure_relationship_node,
+        'SequenceLocation': _sequence_location_node,
+        'ElementValue': _element_value_node,
+        'AttributeSet': _attributeset_node,
+        'Attribute': _attribute_node,
+        'XRef': _xref_node,
+        'ClinVarAccession': _clinvar_accession_node,
+        'Citation': _citation_node,
+        'ID': _id_node,
+        'Comment': _comment_node,
+        'ClinVarSubmissionID': _clinvar_submission_id_node,
+        'ClinicalSignificance': _clinical_significance_node,
+        'ReviewStatus': _review_status_node,
+        'Description': _description_node,
+        'TraitSet': _traitset_node,
+        'Origin': _origin_node,
+    }
+
+
+class MeasureSetNodes(object):
+    def __init__(self, node):
+        self.node = node
+        self.measures = []  # MeasureNodes for .//Measure
+        self.name = None  # first .//Name/ElementValue
+
+
+class MeasureNodes(object):
+    def __init__(self, node):
+        self.node = node
+        self.sequence_locations = []  # .//SequenceLocation
+        self.measure_relationships = []  # MeasureRelationshipNodes for .//MeasureRelationship
+        self.attributesets = []  # AttributeSetNodes for ./AttributeSet
+
+
+class MeasureRelationshipNodes(object):
+    def __init__(self, node):
+        self.node = node
+        self.symbol = None  # first .//Symbol/ElementValue
+        self.sequence_locations = []  # .//SequenceLocation
+
+
+class AttributeSetNodes(object):
+    def __init__(self, node):
+        self.node = node
+        self.attribute = None  # ./Attribute
+        self.xrefs = []  # .//XRef
+
+
+def parse_clinvar_set(elem, genome_build='GRCh37', skipped_counter=None, log=print):
+    """Extract the table rows for one ClinVarSet element.
+
+    Args:
+        elem: ClinVarSet element
+        genome_build: Either 'GRCh37' or 'GRCh38', or a list of genome builds
+        skipped_counter: defaultdict(int) that counts the alleles that were skipped, keyed by reason
+        log: function used to report records that can't be parsed
+
+    Returns:
+        A list of (genome_build, is_multi, row) tuples where row is a list of column values in HEADER order, or None
+        if elem is not an RCV record and parsing should stop.
+    """
+    if skipped_counter is None:
+        skipped_counter = defaultdict(int)
+
+    genome_builds = genome_build if isinstance(genome_build, (list, tuple)) else (genome_build,)
+
+    rows = []
+
+    # initialize all the fields
+    current_row = {}
+    current_row['rcv'] = ''
+    current_row['variation_type'] = ''
+    current_row['variation_id'] = ''
+    current_row['allele_id'] = ''
+
+    rcv = elem.find('./ReferenceClinVarAssertion/ClinVarAccession')
+    if rcv.attrib.get('Type') != 'RCV':
+        log("Error, not RCV record")
+        return None
+    else:
+        current_row['rcv'] = rcv.attrib.get('Acc')
+
+    nodes = ClinVarSetNodes(elem)
+
+    measureset = nodes.measuresets
+
+    # only the ones with just one measure set can be recorded
+    if len(measureset) > 1:
+        log("A submission has more than one measure set." + elem.find('./Title').text)
+        return rows
+    elif len(measureset) == 0:
+        log("A submission has no measure set type" + measureset.attrib.get('ID'))
+        return rows
+
+    measureset = measureset[0]
+
+    measure = measureset.measures
+
+    current_row['variation_id'] = measureset.node.attrib.get('ID')
+    current_row['variation_type'] = measureset.node.get('Type')
+
+    # find all scv accession number
+    scv_number = []
+    for scv in nodes.scv_accessions:
+        if scv.attrib.get('Type') == "SCV":
+            scv_number.append(scv.attrib.get('Acc'))
+
+    current_row['scv'] = ';'.join(set(scv_number))
+
+    # find all the Citation nodes, and get the PMIDs out of them
+    pmids = nodes.pubmed_ids
+
+    # now find the Comment nodes, regex your way through the comments and extract anything that appears to be a PMID
+    comment_pmids = []
+    for comment in nodes.comments:
+        comment_pmids.extend(extract_comment_pmids(comment.text))
+
+    current_row['all_pmids'] = ';'.join(sorted(set(pmids + comment_pmids)))
+
+    # now find any/all submitters
+    submitters_ordered = []
+    for submitter_node in nodes.submitters:
+        if submitter_node.attrib is not None and submitter_node.attrib.has_key('submitter'):
+            submitters_ordered.append(submitter_node.attrib['submitter'].replace(';', ','))
+
+    # all_submitters will get deduplicated while submitters_ordered won't
+    current_row['submitters_ordered'] = ';'.join(submitters_ordered)
+    current_row['all_submitters'] = ";".join(set(submitters_ordered))
+
+    # find the clincial significance and review status reported in RCV(aggregated from SCV)
+    current_row['clinical_significance'] = []
+    current_row['review_status'] = []
+
+    clinical_significance = nodes.rcv_clinical_significance
+    if nodes.rcv_review_status is not None:
+        current_row['review_status'] = nodes.rcv_review_status.text;
+    if nodes.rcv_description is not None:
+        current_row['clinical_significance'] = nodes.rcv_description.text
+
+    current_row['last_evaluated'] = '0000-00-00'
+    if clinical_significance.attrib.get('DateLastEvaluated') is not None:
+        current_row['last_evaluated'] = clinical_significance.attrib.get('DateLastEvaluated', '0000-00-00')
+
+    # match the order of the submitter list - edit 2/22/17
+    current_row['review_status_ordered'] = ';'.join([
+        x.text for x in nodes.scv_review_statuses if x is not None
+    ])
+
+    list_significance= [
+        x.text.lower() for x in nodes.scv_descriptions if x is not None
+    ]
+
+    current_row['pathogenic'] = str(list_significance.count("pathogenic"))
+    current_row['likely_pathogenic'] = str(list_significance.count("likely pathogenic"))
+    current_row['uncertain_significance']=str(list_significance.count("uncertain significance"))
+    current_row['benign']=str(list_significance.count("benign"))
+    current_row['likely_benign']=str(list_significance.count("likely benign"))
+
+    current_row['clinical_significance_ordered'] = ";".join(list_significance)
+
+    current_row['dates_ordered'] = ';'.join([
+        x.attrib.get('DateLastEvaluated', '0000-00-00')
+        for x in nodes.scv_clinical_significances
+        if x is not None
+    ])
+
+    # init new fields
+    for list_column in ('inheritance_modes', 'age_of_onset', 'prevalence', 'disease_mechanism', 'xrefs'):
+        current_row[list_column] = set()
+
+    # now find the disease(s) this variant is associated with
+    current_row['all_traits'] = []
+    for disease_name_node in nodes.trait_names:
+        if disease_name_node.attrib is not None and disease_name_node.attrib.get('Type') == 'Preferred':
+            current_row['all_traits'].append(disease_name_node.text)
+
+    for attribute_node in nodes.trait_attributes:
+        attribute_type = attribute_node.attrib.get('Type')
+        if attribute_type in {'ModeOfInheritance', 'age of onset', 'prevalence', 'disease mechanism'}:
+            column_name = 'inheritance_modes' if attribute_type == 'ModeOfInheritance' else attribute_type.replace(
+                ' ', '_')
+            column_value = attribute_node.text.strip()
+            if column_value:
+                current_row[column_name].add(column_value)
+
+    # put all the cross references one column, it may contains NCBI gene ID, conditions ID in disease databases.
+    for xref_node in nodes.trait_xrefs:
+        xref_db = xref_node.attrib.get('DB')
+        xref_id = xref_node.attrib.get('ID')
+        current_row['xrefs'].add("%s:%s" % (xref_db, xref_id))
+
+    current_row['origin'] = set()
+    for origin in nodes.origins:
+        current_row['origin'].add(origin.text)
+
+    for column_name in (
+            'all_traits', 'inheritance_modes', 'age_of_onset', 'prevalence', 'disease_mechanism', 'origin',
+            'xrefs'):
+        column_value = current_row[column_name] if type(current_row[column_name]) == list else sorted(
+            current_row[column_name])  # sort columns of type 'set' to get deterministic order
+        current_row[column_name] = remove_newlines_and_tabs(';'.join(map(replace_semicolons, column_value)))
+
+    current_row['symbol'] = ''
+    var_name = measureset.name.text
+    if var_name is not None:
+        match = re.search(r"\(([A-Za-z0-9]+)\)", var_name)
+        if match is not None:
+            genesymbol = match.group(1)
+            current_row['symbol'] = genesymbol
+
+    for i in range(len(measure)):
+
+        # find the allele ID (//Measure/@ID)
+        current_row['allele_id'] = measure[i].node.attrib.get('ID')
+        # find the GRCh37 and/or GRCh38 VCF representation
+        genomic_locations = {}
+
+        for sequence_location in measure[i].sequence_locations:
+            build = sequence_location.attrib.get('Assembly')
+            if build in genome_builds and build not in genomic_locations:
+                if all(sequence_location.attrib.get(key) is not None for key in
+                       ('Chr', 'start', 'referenceAllele', 'alternateAllele')):
+                    genomic_locations[build] = sequence_location
+                    if len(genomic_locations) == len(genome_builds):
+                        break
+        # break after finding the first non-empty location for each genome build
+
+        for build in genome_builds:
+            if build not in genomic_locations:
+                skipped_counter['missing SequenceLocation' if len(genome_builds) == 1 else
+                                'missing %s SequenceLocation' % build] += 1
+
+        if not genomic_locations:
+            continue  # don't bother with variants that don't have a VCF location
+
+        current_row['molecular_consequence'] = set()
+        current_row['hgvs_c'] = ''
+        current_row['hgvs_p'] = ''
+
+        for attributeset in measure[i].attributesets:
+            attribute_type = attributeset.attribute.attrib.get('Type')
+            attribute_value = attributeset.attribute.text;
+
+            # find hgvs_c
+            if (attribute_type == 'HGVS, coding, RefSeq' and "c." in attribute_value):
+                current_row['hgvs_c'] = attribute_value
+
+            # find hgvs_p
+            if (attribute_type == 'HGVS, protein, RefSeq' and "p." in attribute_value):
+                current_row['hgvs_p'] = attribute_value
+
+            # aggregate all molecular consequences
+            if (attribute_type == 'MolecularConsequence'):
+                for xref in attributeset.xrefs:
+                    if xref.attrib.get('DB') == "RefSeq":
+                        # print xref.attrib.get('ID'), attribute_value
+                        current_row['molecular_consequence'].add(":".join([xref.attrib.get('ID'), attribute_value]))
+
+        column_name = 'molecular_consequence'
+        column_value = current_row[column_name] if type(current_row[column_name]) == list else sorted(
+            current_row[column_name])  # sort columns of type 'set' to get deterministic order
+        current_row[column_name] = remove_newlines_and_tabs(';'.join(map(replace_semicolons, column_value)))
+
+        for build in genome_builds:
+            genomic_location = genomic_locations.get(build)
             if genomic_location is None:
-                skipped_counter['missing SequenceLocation'] += 1
-                elem.clear()
-                continue  # don't bother with variants that don't have a VCF location
+                continue
 
             current_row['chrom'] = genomic_location.attrib['Chr']
             current_row['pos'] = genomic_location.attrib['start']
@@ -251,92 +856,238 @@ def parse_clinvar_tree(handle, dest=sys.stdout, multi=None, verbose=True, genome
             current_row['start'] = genomic_location.attrib['start']
             current_row['stop'] = genomic_location.attrib['stop']
             current_row['strand'] = ''
-            for measure_relationship in measure[i].findall(".//MeasureRelationship"):
-                if current_row['symbol'] == measure_relationship.find(".//Symbol/ElementValue").text:
-                    for sequence_location in measure_relationship.findall(".//SequenceLocation"):
+            for measure_relationship in measure[i].measure_relationships:
+                if current_row['symbol'] == measure_relationship.symbol.text:
+                    for sequence_location in measure_relationship.sequence_locations:
                         if 'Strand' in sequence_location.attrib and genomic_location.attrib['Accession'] == sequence_location.attrib['Accession']:
                             current_row['strand'] = sequence_location.attrib['Strand']
                             break
 
-            current_row['molecular_consequence'] = set()
-            current_row['hgvs_c'] = ''
-            current_row['hgvs_p'] = ''
-
-            attributeset = measure[i].findall('./AttributeSet')
-            for attribute_node in attributeset:
-                attribute_type = attribute_node.find('./Attribute').attrib.get('Type')
-                attribute_value = attribute_node.find('./Attribute').text;
-
-                # find hgvs_c
-                if (attribute_type == 'HGVS, coding, RefSeq' and "c." in attribute_value):
-                    current_row['hgvs_c'] = attribute_value
-
-                # find hgvs_p
-                if (attribute_type == 'HGVS, protein, RefSeq' and "p." in attribute_value):
-                    current_row['hgvs_p'] = attribute_value
-
-                # aggregate all molecular consequences
-                if (attribute_type == 'MolecularConsequence'):
-                    for xref in attribute_node.findall('.//XRef'):
-                        if xref.attrib.get('DB') == "RefSeq":
-                            # print xref.attrib.get('ID'), attribute_value
-                            current_row['molecular_consequence'].add(":".join([xref.attrib.get('ID'), attribute_value]))
-
-            column_name = 'molecular_consequence'
-            column_value = current_row[column_name] if type(current_row[column_name]) == list else sorted(
-                current_row[column_name])  # sort columns of type 'set' to get deterministic order
-            current_row[column_name] = remove_newlines_and_tabs(';'.join(map(replace_semicolons, column_value)))
-
-            if len(measure) == 1:
-                dest.write(('\t'.join([current_row[column] for column in HEADER]) + '\n').encode('utf-8'))
-                scounter += 1
-            else:
-                if multi is not None:
-                    multi.write(('\t'.join([current_row[column] for column in HEADER]) + '\n').encode('utf-8'))
-                    mcounter += 1
-
-            if scounter % 100 == 0:
-                dest.flush()
-            if mcounter % 100 == 0:
-                if multi is not None:
-                    multi.flush()
-
-            counter = scounter + mcounter
-            if verbose and counter % 100 == 0:
-                sys.stderr.write("{0} entries completed, {1}, {2} total \r".format(
-                    counter,
-                    ', '.join('%s skipped due to %s' % (v, k) for k, v in skipped_counter.items()),
-                    counter + sum(skipped_counter.values())
-                ))
-                sys.stderr.flush()
+            rows.append((build, len(measure) > 1, [current_row[column] for column in HEADER]))
 
-        # done parsing the xml for this one clinvar set.
-        elem.clear()
+    return rows
 
-    sys.stderr.write("Done\n")
+
+def extract_comment_pmids(text):
+    """Returns the PubMed IDs mentioned in the text of a Comment node.
+
+    IDs are only looked for in the rest of the line after the first 'PubMed' or 'PMID'. An ID is a run of digits with
+    a non-digit character on either side, and the character after one ID can't also count as the one before the next.
+    So 'PMID: 123, 456.' gives ['123', '456'], but 'PMID: 123,456.' gives ['123'].
+    """
+    mentions_pubmed = mentions_pubmed_regex.search(text)
+    if mentions_pubmed is None:
+        return []
+
+    # a single scan over the same span of text, rather than searching again in a copy of what's left after each ID
+    return extract_pubmed_id_regex.findall(text, mentions_pubmed.start(1), mentions_pubmed.end(1))
+
+
+def get_peak_rss():
+    """Returns the peak resident set size in bytes of this process, and of the largest of its terminated child
+    processes (eg. the parallel parsing workers)
+    """
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
 
 
-def get_handle(path):
-    if path[-3:] == '.gz':
-        handle = gzip.open(path)
+def get_handle(path, decompression='inline'):
+    """Open the ClinVar XML for reading.
+
+    Args:
+        path: Path of the XML file, which is decompressed if it ends in .gz
+        decompression: How .gz files are decompressed:
+            'inline' - by gzip.open, in the thread that parses the XML
+            'thread' - by zlib in a background thread, so inflating overlaps with parsing
+            'pigz' - by a `pigz -dc` subprocess, read by a background thread
+            'auto' - 'pigz' if pigz is on the PATH, and 'thread' otherwise
+    """
+    if path[-3:] != '.gz':
+        return open(path)
+
+    if decompression == 'auto':
+        decompression = 'pigz' if spawn.find_executable('pigz') else 'thread'
+
+    if decompression == 'inline':
+        return gzip.open(path)
+    elif decompression == 'thread':
+        return BackgroundReader(read_blocks(path))
+    elif decompression == 'pigz':
+        return BackgroundReader(_iter_command_output_blocks(['pigz', '-dc', path]))
     else:
-        handle = open(path)
-    return handle
+        raise ValueError("Unexpected decompression mode: %s" % decompression)
+
+
+def _iter_command_output_blocks(args, block_size=2**20):
+    """Run a command, yielding blocks of its stdout. Raises IOError if it fails."""
+    process = subprocess.Popen(args, stdout=subprocess.PIPE)
+    block = None
+    try:
+        while True:
+            block = process.stdout.read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        process.stdout.close()
+        if block and process.poll() is None:
+            process.kill()  # stopped before the end of the output
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise IOError("%s exited with code %d" % (' '.join(args), returncode))
+
+
+class BackgroundReader(object):
+    """Read-only file-like object whose data comes from an iterator of byte blocks that's run in a background thread.
+    A bounded queue of blocks lets the background thread (eg. decompression) work ahead of the reader by up to
+    queue_size blocks. Exceptions raised by the iterator are re-raised by read().
+    """
+
+    def __init__(self, blocks, queue_size=8):
+        self._queue = Queue(queue_size)
+        self._block = b''
+        self._offset = 0
+        self._eof = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._fill_queue, args=(blocks,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _fill_queue(self, blocks):
+        try:
+            for block in blocks:
+                if self._closed:
+                    break
+                self._queue.put(block)
+            else:
+                self._queue.put(None)
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            if hasattr(blocks, 'close'):
+                blocks.close()
+
+    def read(self, size=-1):
+        parts = []
+        while size != 0:
+            if self._offset >= len(self._block):
+                if self._eof:
+                    break
+                block = self._queue.get()
+                if block is None or isinstance(block, Exception):
+                    self._eof = True
+                    if block is None:
+                        break
+                    raise block
+                self._block = block
+                self._offset = 0
+
+            end = len(self._block) if size < 0 else min(len(self._block), self._offset + size)
+            parts.append(self._block[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+
+        return b''.join(parts)
+
+    def close(self):
+        self._closed = True
+        # unblock the background thread if it's waiting for space in the queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except Empty:
+                pass
+
+
+def get_output_handle(path):
+    """Opens path for writing - as BGZF if it ends in .gz, so that it can be read by gunzip and indexed by tabix"""
+    if path == '-':
+        return sys.stdout
+    elif path[-3:] == '.gz':
+        return BgzfWriter(path)
+    else:
+        return open(path, 'wb')
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Extract PMIDs from the ClinVar XML dump')
-    parser.add_argument('-g', '--genome-build', choices=['GRCh37', 'GRCh38'],
-                        help='Genome version (either GRCh37 or GRCh38)', required=True)
+    parser.add_argument('-g', '--genome-build', choices=['GRCh37', 'GRCh38'], nargs='+',
+                        help='Genome version (either GRCh37 or GRCh38). If both are given, the tables for both genome '
+                             'builds are generated from one pass through the XML.', required=True)
     parser.add_argument('-x', '--xml', dest='xml_path',
                         type=str, help='Path to the ClinVar XML dump', required=True)
-    parser.add_argument('-o', '--out', nargs='?', type=argparse.FileType('w'), default=sys.stdout)
-    parser.add_argument('-m', '--multi', help="Output file name for complex alleles")
+    parser.add_argument('-o', '--out', nargs='+',
+                        help="Output file name(s) for simple alleles - one per genome build. Defaults to stdout. "
+                             "Files ending in .gz are BGZF-compressed.")
+    parser.add_argument('-m', '--multi', nargs='+', help="Output file name(s) for complex alleles - one per genome "
+                        "build. Files ending in .gz are BGZF-compressed.")
+    parser.add_argument('--buffer-size', type=int, default=2**16,
+                        help="Rows are written to each output in batches of about this many bytes")
+    parser.add_argument('-d', '--decompression', choices=['inline', 'thread', 'pigz', 'auto'], default='inline',
+                        help="How to decompress a .gz XML file: 'inline' in the parsing thread, 'thread' in a background "
+                             "thread, 'pigz' in a pigz subprocess, or 'auto' to use pigz if it's installed and a "
+                             "background thread otherwise")
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help="Number of processes to use for parsing. The output is the same as for 1 process.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Drop each ClinVarSet from the XML tree once it's processed, so memory use stays flat")
+    parser.add_argument('--report-memory', action='store_true',
+                        help="At the end, print peak memory use and the number of records processed per second")
+    parser.add_argument('--cache-dir', help="Directory for the incremental cache. If given, the rows extracted from "
+                        "each ClinVarSet are cached by RCV accession, and only ClinVarSets that are new or have "
+                        "changed since the previous run are parsed again.")
+    parser.add_argument('--changed-rcvs', help="With --cache-dir, write the RCV accessions that are new, changed or "
+                        "removed since the previous run to this file, one per line, after a line with the previous "
+                        "and new generations of the cache")
 
     args = parser.parse_args()
+    if args.out is None and len(args.genome_build) == 1:
+        args.out = ['-']
+    if args.out is None or len(args.out) != len(args.genome_build):
+        parser.error("-o must be given once for each genome build")
+    if args.multi is not None and len(args.multi) != len(args.genome_build):
+        parser.error("-m must be given once for each genome build")
+    if args.changed_rcvs and not args.cache_dir:
+        parser.error("--changed-rcvs requires --cache-dir")
+
+    dest = dict((genome_build, get_output_handle(path)) for genome_build, path in zip(args.genome_build, args.out))
+    multi = {}
     if args.multi is not None:
-        f = open(args.multi, 'w')
-        parse_clinvar_tree(get_handle(args.xml_path), dest=args.out, multi=f, genome_build=args.genome_build)
-        f.close()
-    else:
-        parse_clinvar_tree(get_handle(args.xml_path), dest=args.out, genome_build=args.genome_build)
+        multi = dict((genome_build, get_output_handle(path)) for genome_build, path in zip(args.genome_build, args.multi))
+
+    cache = None
+    if args.cache_dir:
+        from clinvar_set_cache import ClinVarSetCache
+        if not os.path.isdir(args.cache_dir):
+            os.makedirs(args.cache_dir)
+        cache = ClinVarSetCache(os.path.join(args.cache_dir, 'clinvar_sets.sqlite'), args.genome_build,
+                                get_parser_version())
+
+    handle = get_handle(args.xml_path, args.decompression)
+    stats = parse_clinvar_tree(handle, dest=dest, multi=multi, genome_build=args.genome_build,
+                               processes=args.processes, streaming=args.streaming, cache=cache,
+                               buffer_size=args.buffer_size)
+    handle.close()
+
+    for f in list(dest.values()) + list(multi.values()):
+        if f is not sys.stdout:
+            f.close()
+
+    if cache is not None:
+        sys.stderr.write("Reused the cached rows for %d of %d ClinVarSets\n" % (
+            stats['cached_clinvar_sets'], stats['clinvar_sets']))
+        if args.changed_rcvs:
+            cache.write_changed_rcvs(args.changed_rcvs)
+
+    if args.report_memory:
+        peak_rss, peak_child_rss = get_peak_rss()
+        seconds = max(stats['seconds'], 1e-9)
+        sys.stderr.write("Peak RSS: %0.1f MB (largest worker process: %0.1f MB)\n" % (
+            peak_rss / 2.0**20, peak_child_rss / 2.0**20))
+        sys.stderr.write("Processed %d ClinVarSets and wrote %d rows in %0.1f seconds "
+                         "(%0.1f ClinVarSets/sec, %0.1f rows/sec)\n" % (
+            stats['clinvar_sets'], stats['rows'], stats['seconds'],
+            stats['clinvar_sets'] / seconds, stats['rows'] / seconds))
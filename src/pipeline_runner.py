@@ -0,0 +1,393 @@
+"""
+Runs the shell commands of a pipeline in dependency order, with independent commands running at the same time.
+
+Like pypez, commands mark the files they read with IN: and the files they write with OUT: (the prefixes are removed
+before running them), and a command is skipped if all its output files exist and are newer than all its input files.
+A command depends on the commands that write its input files, so the order the commands are added in only decides
+which of the commands that are ready to run is started first. The modules next to an input python script that it
+imports, directly or through each other, are inputs too, so a command is run again when one of them changes.
+
+The wall time, CPU time and peak memory of each command, and the sizes of its files, are recorded for a run report.
+The row counts of its output tables are added when the report is made, after the run, so that counting them doesn't
+hold up the stages that depend on them.
+
+Example:
+    pipeline = Pipeline(max_parallel=4)
+    pipeline.add("gunzip -c IN:table.tsv.gz | python -u IN:normalize_variants.py -R IN:b37.fa | bgzip -c > OUT:normalized.tsv.gz")
+    pipeline.run()
+    print(format_report_summary(pipeline.get_report()))
+"""
+
+from __future__ import print_function
+
+import ast
+import gzip
+import os
+import re
+import struct
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from tabix_writer import read_index
+
+file_token_regex = re.compile(r'\b(IN|OUT):([^\s)\'";|&<>]+)')
+
+# ru_maxrss is in bytes on macOS and in kilobytes on Linux
+RU_MAXRSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+
+
+def count_indexed_rows(path):
+    """Returns the number of records in a file's tabix index, or None if it doesn't have an up to date index that
+    records them
+    """
+    index_path = path + '.tbi'
+    if not os.path.isfile(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+        return None
+    try:
+        sequences = read_index(index_path)
+    except (IOError, ValueError, struct.error):
+        return None
+    if any(sequence['records'] is None for sequence in sequences):
+        return None
+    return sum(sequence['records'] for sequence in sequences)
+
+
+def count_rows(path, max_size=2**31):
+    """Returns the number of data rows in a .tsv or .vcf file (optionally gzipped), not counting the header, or None
+    for other files. The count is taken from the file's tabix index if it has one, and otherwise by reading the file,
+    unless it's bigger than max_size bytes.
+    """
+    is_vcf = re.search(r'\.vcf(\.gz)?$', path) is not None
+    if not is_vcf and re.search(r'\.tsv(\.gz)?$', path) is None:
+        return None
+    rows = count_indexed_rows(path)
+    if rows is not None:
+        return rows
+    if os.path.getsize(path) > max_size:
+        return None
+
+    lines = 0
+    header_lines = 0
+    previous_char = b'\n'
+    with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as f:
+        while True:
+            block = f.read(2**20)
+            if not block:
+                break
+            lines += block.count(b'\n')
+            if is_vcf:
+                header_lines += (previous_char + block).count(b'\n#')
+            previous_char = block[-1:]
+    if previous_char != b'\n':
+        lines += 1  # no newline at the end of the last line
+    return lines - header_lines if is_vcf else max(lines - 1, 0)
+
+
+class PipelineError(Exception):
+    pass
+
+
+def find_local_imports(script_path):
+    """Returns the sorted paths of the modules in the same directory as a python script that it imports, directly or
+    through other modules in the directory. Imports inside functions and try blocks count too, so a module that's only
+    imported with some options is included.
+    """
+    script_dir = os.path.dirname(script_path)
+    found = set()
+    pending = [script_path]
+    while pending:
+        path = pending.pop()
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module_path = os.path.join(script_dir, name.split('.')[0] + '.py')
+                if module_path not in found and module_path != script_path and os.path.isfile(module_path):
+                    found.add(module_path)
+                    pending.append(module_path)
+    return sorted(found)
+
+
+class Stage(object):
+    """One shell command of the pipeline"""
+
+    def __init__(self, command, input_filenames=(), output_filenames=(), memory=0, skip_if_up_to_date=True):
+        self.command = file_token_regex.sub(r'\2', command)
+        self.input_filenames = []
+        self.output_filenames = []
+        for prefix, path in file_token_regex.findall(command):
+            (self.input_filenames if prefix == 'IN' else self.output_filenames).append(path)
+        self.input_filenames += [path for path in input_filenames if path not in self.input_filenames]
+        for script_path in [path for path in self.input_filenames if path.endswith('.py') and os.path.isfile(path)]:
+            self.input_filenames += [path for path in find_local_imports(script_path)
+                                     if path not in self.input_filenames]
+        self.output_filenames += [path for path in output_filenames if path not in self.output_filenames]
+        self.memory = memory
+        self.skip_if_up_to_date = skip_if_up_to_date
+        self.dependencies = set()
+        self.cache_key = None
+        self.status = None  # 'skipped', 'restored', 'ran' or 'failed', or None if it wasn't reached
+        self.stats = {}
+
+    def is_up_to_date(self):
+        """Returns True if the stage has outputs, they all exist, and none of them is older than any input"""
+        if not self.skip_if_up_to_date or not self.output_filenames:
+            return False
+        if not all(os.path.exists(path) for path in self.output_filenames):
+            return False
+        if not all(os.path.exists(path) for path in self.input_filenames):
+            return False
+        oldest_output = min(os.path.getmtime(path) for path in self.output_filenames)
+        return all(os.path.getmtime(path) <= oldest_output for path in self.input_filenames)
+
+    def remove_outputs(self):
+        for path in self.output_filenames:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def record_stats(self, rusage=None):
+        """Record the resources used by the command, and the sizes of its input and output files"""
+        if rusage is not None:
+            self.stats.update({
+                'wall_seconds': time.time() - self.start_time,
+                'user_seconds': rusage.ru_utime,
+                'system_seconds': rusage.ru_stime,
+                'peak_rss_mb': rusage.ru_maxrss * RU_MAXRSS_SCALE / 2.0**20,
+            })
+        self.stats['input_bytes'] = sum(os.path.getsize(path) for path in self.input_filenames if os.path.isfile(path))
+        self.stats['output_bytes'] = sum(os.path.getsize(path) for path in self.output_filenames
+                                         if os.path.isfile(path))
+
+    def record_row_counts(self):
+        """Record the number of rows of the output tables of a stage that was run or restored, see count_rows"""
+        if self.status not in ('ran', 'restored') or 'output_rows' in self.stats:
+            return
+        self.stats['output_rows'] = {}
+        for path in self.output_filenames:
+            rows = count_rows(path) if os.path.isfile(path) else None
+            if rows is not None:
+                self.stats['output_rows'][path] = rows
+
+    def __repr__(self):
+        return "Stage(%r)" % self.command
+
+
+class Pipeline(object):
+    """Collects the stages of a pipeline, and runs them"""
+
+    def __init__(self, max_parallel=1, max_memory=None, stage_cache=None, log=print):
+        """
+        Args:
+            max_parallel: Maximum number of stages to run at the same time
+            max_memory: If given, stages are only started while the total memory declared by the running stages,
+                including the new one, is at most this many bytes. A stage is always started if nothing else is running.
+            stage_cache: Optional stage_cache.StageCache. If given, the outputs of stages that aren't up to date are
+                restored from the cache when the stage was run before with the same command and input file contents,
+                and the outputs of the stages that are run are added to the cache.
+            log: Function to call with each line of progress
+        """
+        self.max_parallel = max_parallel
+        self.max_memory = max_memory
+        self.stage_cache = stage_cache
+        self.log = log
+        self.stages = []
+        self._stages_by_output = {}
+        self.start_time = None
+        self.end_time = None
+
+    def add(self, command, input_filenames=(), output_filenames=(), memory=0, skip_if_up_to_date=True):
+        """Add a stage to the pipeline.
+
+        Args:
+            command: Shell command, run with bash. Paths of files it reads can be marked with IN: and paths of files
+                it writes with OUT:
+            input_filenames: Paths of files the command reads that aren't marked with IN:. The modules that its
+                python scripts import from their directory are added to them.
+            output_filenames: Paths of files the command writes that aren't marked with OUT:
+            memory: Approximate peak memory use of the command in bytes, for max_memory
+            skip_if_up_to_date: Whether to skip the command if its outputs are newer than its inputs. If False, it's
+                always run, but stages that depend on it are still skipped if their outputs are newer than their
+                inputs after it's run.
+
+        Returns:
+            the Stage. If a stage with the same command and outputs was already added, that stage is returned instead.
+        """
+        stage = Stage(command, input_filenames, output_filenames, memory, skip_if_up_to_date)
+        for path in stage.output_filenames:
+            other = self._stages_by_output.get(path)
+            if other is None:
+                continue
+            if other.command == stage.command and other.output_filenames == stage.output_filenames:
+                return other
+            raise PipelineError("%s is written by two different commands:\n  %s\n  %s" % (
+                path, other.command, stage.command))
+
+        for path in stage.output_filenames:
+            self._stages_by_output[path] = stage
+        self.stages.append(stage)
+        return stage
+
+    def _resolve_dependencies(self):
+        for stage in self.stages:
+            stage.dependencies = set(self._stages_by_output[path] for path in stage.input_filenames
+                                     if path in self._stages_by_output) - set([stage])
+
+        # check for cycles
+        visited = set()
+        in_progress = set()
+
+        def visit(stage):
+            if stage in in_progress:
+                raise PipelineError("Circular dependency involving: %s" % stage.command)
+            if stage in visited:
+                return
+            in_progress.add(stage)
+            for dependency in stage.dependencies:
+                visit(dependency)
+            in_progress.remove(stage)
+            visited.add(stage)
+
+        for stage in self.stages:
+            visit(stage)
+
+    def _can_start(self, stage, running):
+        if not running:
+            return True
+        if len(running) >= self.max_parallel:
+            return False
+        if self.max_memory is not None:
+            return sum(s.memory for s in running) + stage.memory <= self.max_memory
+        return True
+
+    def _restore_from_cache(self, stage):
+        """Returns True if the stage's outputs were restored from the stage cache. Otherwise, sets stage.cache_key if
+        they should be stored in the cache after it's run.
+        """
+        if self.stage_cache is None or not stage.skip_if_up_to_date or not stage.output_filenames:
+            return False
+        stage.cache_key = self.stage_cache.get_key(stage)
+        if stage.cache_key is None or not self.stage_cache.restore(stage.cache_key, stage):
+            return False
+        self.log("Restored outputs from the stage cache: %s" % stage.command)
+        stage.status = 'restored'
+        stage.record_stats()
+        return True
+
+    def _start(self, stage):
+        self.log("Running: %s" % stage.command)
+        for path in stage.output_filenames:
+            output_dir = os.path.dirname(path)
+            if output_dir and not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+        stage.start_time = time.time()
+        stage.process = subprocess.Popen(['bash', '-c', stage.command])
+
+    def run(self, poll_interval=0.05):
+        """Run the stages, starting each one as soon as the stages it depends on have finished.
+
+        Raises:
+            PipelineError: if any stage fails. The stages that were already running are allowed to finish, but no
+                others are started. The outputs of the failed stages are removed.
+        """
+        self._resolve_dependencies()
+        self.start_time = time.time()
+        waiting = list(self.stages)
+        running = []
+        finished = set()
+        failed = []
+
+        while waiting or running:
+            # start the stages that are ready, in the order they were added
+            if not failed:
+                for stage in list(waiting):
+                    if not stage.dependencies.issubset(finished):
+                        continue
+                    if stage.is_up_to_date():
+                        self.log("Skipping, outputs are up to date: %s" % stage.command)
+                        stage.status = 'skipped'
+                        stage.record_stats()
+                        waiting.remove(stage)
+                        finished.add(stage)
+                        continue
+                    if not self._can_start(stage, running):
+                        continue
+                    if self._restore_from_cache(stage):
+                        waiting.remove(stage)
+                        finished.add(stage)
+                        continue
+                    self._start(stage)
+                    waiting.remove(stage)
+                    running.append(stage)
+            elif not running:
+                break
+
+            if not running:
+                if waiting:
+                    # only possible if a stage was skipped and unblocked others: go round again
+                    continue
+                break
+
+            time.sleep(poll_interval)
+            for stage in list(running):
+                # like Popen.poll(), but also gets the resources used by the command and the processes it waited for
+                pid, status, rusage = os.wait4(stage.process.pid, os.WNOHANG)
+                if pid == 0:
+                    continue
+                returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+                stage.process.returncode = returncode
+                running.remove(stage)
+                stage.status = 'ran' if returncode == 0 else 'failed'
+                stage.record_stats(rusage)
+                if returncode == 0:
+                    finished.add(stage)
+                    if stage.cache_key is not None:
+                        self.stage_cache.store(stage.cache_key, stage)
+                else:
+                    self.log("Failed with exit code %d: %s" % (returncode, stage.command))
+                    stage.remove_outputs()
+                    failed.append(stage)
+
+        self.end_time = time.time()
+        if failed:
+            raise PipelineError("%d command(s) failed:\n%s" % (len(failed), "\n".join(
+                "  " + stage.command for stage in failed)))
+
+    def get_report(self):
+        """Returns a JSON-serialisable dictionary with the status and stats of each stage of the last run. The rows of the
+        output tables are counted the first time it's called.
+        """
+        for stage in self.stages:
+            stage.record_row_counts()
+        return {
+            'started': datetime.fromtimestamp(self.start_time).isoformat() if self.start_time else None,
+            'wall_seconds': self.end_time - self.start_time if self.start_time and self.end_time else None,
+            'max_parallel': self.max_parallel,
+            'stages': [dict(stage.stats, command=stage.command, status=stage.status) for stage in self.stages],
+        }
+
+
+def format_report_summary(report):
+    """Returns a table of the stages that were run or restored in a run report, slowest first"""
+    lines = ["%-9s %9s %9s %9s %9s %10s  %s" % (
+        'status', 'wall (s)', 'user (s)', 'sys (s)', 'RSS (MB)', 'out (MB)', 'command')]
+    stages = [stage for stage in report['stages'] if stage['status'] not in ('skipped', None)]
+    for stage in sorted(stages, key=lambda stage: -stage.get('wall_seconds', 0)):
+        def column(key, scale=1):
+            return ('%9.1f' % (stage[key] / scale)) if key in stage else '%9s' % '-'
+        lines.append("%-9s %s %s %s %s %s  %s" % (
+            stage['status'], column('wall_seconds'), column('user_seconds'), column('system_seconds'),
+            column('peak_rss_mb'), ' ' + column('output_bytes', 2.0**20), stage['command'][:100]))
+    skipped = len(report['stages']) - len(stages)
+    if skipped:
+        lines.append("%d stage(s) skipped or not reached" % skipped)
+    if report['wall_seconds'] is not None:
+        lines.append("Total wall time: %.1f s" % report['wall_seconds'])
+    return "\n".join(lines)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import argparse
+import gzip
+import sys
+
+from clinvar_set_cache import read_changed_rcvs
+
+# used by master.py in incremental mode to only normalize the rows of ClinVarSets that changed since the previous run:
+# ./select_rows_by_rcv.py -i clinvar_table_raw.tsv --rcvs changed_rcvs.txt | normalize_variants.py ...
+# and to take the rest from the previous run's normalized table:
+# ./select_rows_by_rcv.py -i previous_normalized.tsv.gz --rcvs-from-table clinvar_table_raw.tsv \
+#   --exclude-rcvs changed_rcvs.txt --no-header
+# With --table-generation, the previous normalized table's generation stamp, every RCV is treated as changed if the
+# table wasn't made from the cache generation that changed_rcvs.txt is relative to, so the first command selects every
+# row and the second none, and the whole table is normalized again. The same happens with --table-version if the table
+# was made with a different version of normalize_variants.py or reference genome.
+
+
+def open_file(path):
+    return gzip.open(path) if path.endswith('.gz') else open(path)
+
+
+def read_rcvs_from_table(path):
+    """Read the RCV accessions in the 'rcv' column of a table from parse_clinvar_xml.py"""
+    with open_file(path) as f:
+        rcv_column = next(f).rstrip('\n').split('\t').index('rcv')
+        return set(line.rstrip('\n').split('\t')[rcv_column] for line in f)
+
+
+def select_rows_by_rcv(infile, outfile, include=None, exclude=None, write_header=True):
+    """Copy the rows of a table from parse_clinvar_xml.py whose RCV accession is in include (if given) and isn't in
+    exclude (if given).
+
+    Args:
+        infile: Input file stream
+        outfile: Output file stream
+        include: set of RCV accessions to keep, or None to keep all of them
+        exclude: set of RCV accessions to drop, or None
+        write_header: Whether to copy the header line too
+    """
+    header = next(infile)
+    if write_header:
+        outfile.write(header)
+    rcv_column = header.rstrip('\n').split('\t').index('rcv')
+
+    for line in infile:
+        rcv = line.rstrip('\n').split('\t')[rcv_column]
+        if include is not None and rcv not in include:
+            continue
+        if exclude is not None and rcv in exclude:
+            continue
+        outfile.write(line)
+
+
+def get_rcv_filters(rcvs=None, rcvs_from_table=None, exclude_rcvs=None, table_generation=None, table_version=None):
+    """Returns the include and exclude sets for select_rows_by_rcv from the command line options of the same names.
+    If the changed RCVs in rcvs or exclude_rcvs can't be used with the table (see clinvar_set_cache.read_changed_rcvs),
+    every RCV is treated as changed: with rcvs every row is kept, and with exclude_rcvs none are.
+    """
+    include = None
+    exclude = None
+    all_changed = False
+    if rcvs:
+        include = read_changed_rcvs(rcvs, table_generation, table_version)
+        all_changed = include is None  # then every row is kept
+    if exclude_rcvs:
+        exclude = read_changed_rcvs(exclude_rcvs, table_generation, table_version)
+        if exclude is None:
+            all_changed = True
+            include = set()  # every row would be excluded
+    if all_changed:
+        sys.stderr.write("The table in %s wasn't made from the cache generation that the changed RCVs are relative "
+                         "to, or with the same normalizer and reference genome. Treating every RCV as changed.\n"
+                         % table_generation)
+    if rcvs_from_table and include != set():
+        table_rcvs = read_rcvs_from_table(rcvs_from_table)
+        include = table_rcvs if include is None else include & table_rcvs
+    return include, exclude
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Select rows from the output of parse_clinvar_xml.py by RCV accession')
+    parser.add_argument('-i', '--infile', required=True)
+    parser.add_argument('-o', '--outfile', type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('--rcvs', help="Only keep rows whose RCV is in this file (one RCV per line, as written by "
+                        "parse_clinvar_xml.py --changed-rcvs)")
+    parser.add_argument('--rcvs-from-table', help="Only keep rows whose RCV is in the rcv column of this table")
+    parser.add_argument('--exclude-rcvs', help="Drop rows whose RCV is in this file (one RCV per line, as written by "
+                        "parse_clinvar_xml.py --changed-rcvs)")
+    parser.add_argument('--table-generation', help="Generation stamp of the previous normalized table. If it isn't the "
+                        "generation that the --rcvs or --exclude-rcvs file is relative to, or doesn't exist, every RCV "
+                        "is treated as changed.")
+    parser.add_argument('--table-version', help="With --table-generation, the version of the normalizer and reference "
+                        "genome that the table would be made with now. If the stamp has a different version, every RCV "
+                        "is treated as changed.")
+    parser.add_argument('--no-header', dest='write_header', action='store_false', help="Don't output the header line")
+    args = parser.parse_args()
+
+    include, exclude = get_rcv_filters(args.rcvs, args.rcvs_from_table, args.exclude_rcvs, args.table_generation,
+                                       args.table_version)
+    with open_file(args.infile) as infile:
+        select_rows_by_rcv(infile, args.outfile, include=include, exclude=exclude, write_header=args.write_header)
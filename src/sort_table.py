@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""
+Sort a tab-delimited table with a header row (like the clinvar_allele_trait_pairs and clinvar_alleles tables) by
+genomic coordinates: chromosomes 1-22 numerically, then X, Y and MT, then any others lexicographically, then by
+position, ref and alt. Rows that are equal on all of those are ordered by the whole line, like sort's last-resort
+comparison in the C locale.
+
+Tables that don't fit in the memory budget are sorted in runs that are spilled to temporary files and then merged. The
+runs can be sorted in parallel. If the output path ends in .gz, it's written as BGZF, so it can be indexed with tabix,
+and with --tabix, the .tbi index is built while it's written (see tabix_writer.py).
+
+Usage:
+    python sort_table.py -i clinvar_table_normalized.tsv.gz -o clinvar_allele_trait_pairs.tsv.gz [-S 2G] [-p 4] [--tabix]
+"""
+
+import argparse
+import gzip
+import heapq
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from bgzf import BgzfWriter
+from tabix_writer import TabixWriter
+
+leading_number_regex = re.compile(r'\s*([0-9]+)')
+
+# rough number of bytes of memory used by each line in a run, in addition to the line itself: the list entry, the
+# string object, and its sort key
+LINE_OVERHEAD = 200
+
+# the chromosomes that are sorted after 1-22, in this order
+CHROM_RANKS = {'X': 23, 'Y': 24, 'M': 25, 'MT': 25}
+
+
+def _leading_number(s):
+    match = leading_number_regex.match(s)
+    return int(match.group(1)) if match is not None else 0
+
+
+def genomic_sort_key(line):
+    """Returns the key to sort a table row by. The line itself is the last element of the key."""
+    fields = line.split('\t', 4)
+    if len(fields) < 4:
+        fields += [''] * (4 - len(fields))
+    chrom, pos = fields[0], fields[1]
+    pos = int(pos) if pos.isdigit() else _leading_number(pos)
+    # the first element keeps numeric and non-numeric chromosome names from being compared with each other
+    if chrom.isdigit():
+        return 0, int(chrom), pos, fields[2], fields[3], line
+    rank = CHROM_RANKS.get(chrom)
+    if rank is not None:
+        return 0, rank, pos, fields[2], fields[3], line
+    return 1, chrom, pos, fields[2], fields[3], line
+
+
+def parse_size(size):
+    """Returns the number of bytes for a size like 500000, 64K, 512M or 2G"""
+    match = re.match(r'^([0-9]+)([KMG]?)B?$', size.strip().upper())
+    if match is None:
+        raise ValueError("Invalid size: %s" % size)
+    return int(match.group(1)) * {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30}[match.group(2)]
+
+
+def _sort_run(args):
+    """Sort the lines of a run and write them to a new file in tmp_dir. Returns the path of the file."""
+    lines, tmp_dir = args
+    lines.sort(key=genomic_sort_key)
+    fd, path = tempfile.mkstemp(suffix='.tsv', dir=tmp_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.writelines(lines)
+    return path
+
+
+def _iter_run(path):
+    with open(path, 'rb') as f:
+        for line in f:
+            yield genomic_sort_key(line)
+
+
+class LineSorter(object):
+    """Sorts table rows by genomic_sort_key as they're added, for code that produces the rows as it goes rather than as
+    an iterable. When the rows don't fit in buffer_size, they're sorted in runs that are spilled to temporary files, and
+    merged by sorted_lines.
+
+    Example:
+        sorter = LineSorter(buffer_size=2**30, tmp_dir='/tmp')
+        try:
+            for line in lines:
+                sorter.add(line)
+            for line in sorter.sorted_lines():
+                ...
+        finally:
+            sorter.close()
+    """
+
+    def __init__(self, buffer_size=2**30, processes=1, tmp_dir=None, log=None):
+        """
+        Args:
+            buffer_size: Approximate maximum number of bytes of memory to use for the lines being sorted
+            processes: Number of processes to sort runs with
+            tmp_dir: Directory to create the temporary directory for the runs in. Default: the system default.
+            log: Optional function to call with a line of progress
+        """
+        # with several processes, each of them and the main process can hold a run at the same time
+        self.run_size = buffer_size // (processes + 1) if processes > 1 else buffer_size
+        self.processes = processes
+        self.tmp_dir = tmp_dir
+        self.log = log
+        self.count = 0
+        self._pool = multiprocessing.Pool(processes) if processes > 1 else None
+        self._run_tmp_dir = None
+        self._run_paths = []
+        self._pending = []
+        self._run = []
+        self._size = 0
+
+    def add(self, line):
+        """Add a line, ending in a newline"""
+        self._run.append(line)
+        self._size += len(line) + LINE_OVERHEAD
+        self.count += 1
+        if self._size >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        if self._run_tmp_dir is None:
+            self._run_tmp_dir = tempfile.mkdtemp(prefix='sort_table.', dir=self.tmp_dir)
+        if self._pool is None:
+            self._run_paths.append(_sort_run((self._run, self._run_tmp_dir)))
+        else:
+            if len(self._pending) >= self.processes:
+                self._run_paths.append(self._pending.pop(0).get())
+            self._pending.append(self._pool.apply_async(_sort_run, ((self._run, self._run_tmp_dir),)))
+        if self.log is not None:
+            self.log("Sorting run %d" % (len(self._run_paths) + len(self._pending)))
+        self._run = []
+        self._size = 0
+
+    def sorted_lines(self):
+        """Yields the lines that were added, in sorted order. The temporary files are removed at the end."""
+        try:
+            self._run_paths += [result.get() for result in self._pending]
+            self._pending = []
+            if not self._run_paths:
+                # everything fit in memory
+                run = self._run
+                self._run = []
+                run.sort(key=genomic_sort_key)
+                for line in run:
+                    yield line
+                return
+
+            if self._run:
+                self._run_paths.append(_sort_run((self._run, self._run_tmp_dir)))
+                self._run = []
+            if self.log is not None:
+                self.log("Merging %d runs" % len(self._run_paths))
+            for key in heapq.merge(*[_iter_run(path) for path in self._run_paths]):
+                yield key[-1]
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the processes, and remove the temporary files"""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._run_tmp_dir is not None:
+            shutil.rmtree(self._run_tmp_dir)
+            self._run_tmp_dir = None
+
+
+def sort_lines(lines, buffer_size=2**30, processes=1, tmp_dir=None, log=None):
+    """Sort table rows by genomic_sort_key, spilling to disk if they don't fit in buffer_size.
+
+    Args:
+        lines: Iterable of the lines to sort, each ending in a newline
+        buffer_size, processes, tmp_dir, log: see LineSorter
+
+    Yields:
+        the lines in sorted order
+    """
+    sorter = LineSorter(buffer_size=buffer_size, processes=processes, tmp_dir=tmp_dir, log=log)
+    try:
+        for line in lines:
+            sorter.add(line)
+        for line in sorter.sorted_lines():
+            yield line
+    finally:
+        sorter.close()
+
+
+def sort_table(infile, outfile, buffer_size=2**30, processes=1, tmp_dir=None, log=None):
+    """Sort a table with a header row by genomic coordinates.
+
+    Args:
+        infile: Open input file handle for reading the table
+        outfile: Open output file handle to write the sorted table to
+        buffer_size, processes, tmp_dir, log: see sort_lines
+
+    Returns:
+        the number of rows sorted
+    """
+    header = next(infile, None)
+    if header is None:
+        return 0
+    outfile.write(header)
+
+    counter = 0
+    for line in sort_lines(infile, buffer_size=buffer_size, processes=processes, tmp_dir=tmp_dir, log=log):
+        outfile.write(line)
+        counter += 1
+    return counter
+
+
+def open_output(path, tabix=False, threads=1):
+    """Opens a sorted table for writing: as BGZF if path ends in .gz, and with a tabix index if tabix is True"""
+    if tabix:
+        return TabixWriter(path, preset='tsv', threads=threads)
+    return BgzfWriter(path, threads=threads) if path.endswith('.gz') else open(path, 'wb')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sort a table by genomic coordinates')
+    parser.add_argument('-i', '--infile', required=True, help="Path of the table to sort. Can be gzipped.")
+    parser.add_argument('-o', '--outfile', required=True,
+                        help="Path to write the sorted table to. Written as BGZF if it ends in .gz")
+    parser.add_argument('-S', '--buffer-size', type=parse_size, default='1G',
+                        help="Approximate amount of memory to use, eg. 512M or 2G. Tables that don't fit are sorted in "
+                             "runs that are merged from temporary files. Default: 1G")
+    parser.add_argument('-p', '--processes', type=int, default=1, help="Number of processes to sort runs with")
+    parser.add_argument('-T', '--tmp-dir', help="Directory for the temporary files")
+    parser.add_argument('--tabix', action='store_true',
+                        help="Also write a tabix index to <outfile>.tbi, like tabix -S 1 -s 1 -b 2 -e 2")
+    parser.add_argument('-@', '--threads', type=int, default=1, help="Number of threads to compress the output with")
+    args = parser.parse_args()
+
+    infile = gzip.open(args.infile) if args.infile.endswith('.gz') else open(args.infile, 'rb')
+    with open_output(args.outfile, args.tabix, args.threads) as outfile:
+        counter = sort_table(infile, outfile, buffer_size=args.buffer_size, processes=args.processes,
+                             tmp_dir=args.tmp_dir, log=lambda line: sys.stderr.write(line + '\n'))
+    infile.close()
+    sys.stderr.write("Sorted %d rows\n" % counter)
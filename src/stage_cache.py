@@ -0,0 +1,150 @@
+"""
+Cache of the output files of pipeline stages, keyed by a hash of the stage's command and the contents of its input
+files (which include the scripts it runs). When a stage isn't up to date by file modification times - because an input
+was touched, re-downloaded without changing, or copied from another machine - but was run before on the same command
+and inputs, its outputs are copied from the cache instead of being made again.
+
+Each entry is a directory named by the key, holding a copy of each output file and a stage.json file describing the
+stage. The entries that were used least recently are removed when the cache grows beyond its maximum size.
+
+The hashes of input files are remembered along with their size and modification time, so that each large input (eg.
+the gnomAD VCFs) is only read again when it changes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+CACHE_VERSION = 1
+STAGE_FILENAME = 'stage.json'
+FILE_HASHES_FILENAME = 'file_hashes.json'
+
+
+def hash_file(path, block_size=2**20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class StageCache(object):
+
+    def __init__(self, cache_dir, max_size=50 * 2**30, log=None):
+        """
+        Args:
+            cache_dir: Directory to keep the cache in. It's created if it doesn't exist yet.
+            max_size: Maximum total size in bytes of the cached output files
+            log: Optional function to call with a line of progress
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.log = log
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self._file_hashes_path = os.path.join(cache_dir, FILE_HASHES_FILENAME)
+        self._file_hashes = {}
+        if os.path.isfile(self._file_hashes_path):
+            with open(self._file_hashes_path) as f:
+                self._file_hashes = json.load(f)
+
+    def get_file_hash(self, path):
+        """Returns the sha1 hash of the file's contents, reusing the previous hash if the file's size and modification
+        time haven't changed since then
+        """
+        stat = os.stat(path)
+        abs_path = os.path.abspath(path)
+        previous = self._file_hashes.get(abs_path)
+        if previous is not None and previous[:2] == [stat.st_size, stat.st_mtime]:
+            return previous[2]
+
+        sha1 = hash_file(path)
+        self._file_hashes[abs_path] = [stat.st_size, stat.st_mtime, sha1]
+        tmp_path = self._file_hashes_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._file_hashes, f)
+        os.rename(tmp_path, self._file_hashes_path)
+        return sha1
+
+    def get_key(self, stage):
+        """Returns the cache key for a pipeline_runner.Stage, or None if it can't be cached because some of its input
+        files don't exist
+        """
+        if not all(os.path.isfile(path) for path in stage.input_filenames):
+            return None
+        description = json.dumps({
+            'cache_version': CACHE_VERSION,
+            'command': stage.command,
+            'inputs': [[path, self.get_file_hash(path)] for path in stage.input_filenames],
+            'outputs': stage.output_filenames,
+        }, sort_keys=True)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key, stage):
+        """Copy the cached outputs for key to the stage's output paths. Returns False if they aren't in the cache."""
+        entry_dir = self._entry_dir(key)
+        stage_path = os.path.join(entry_dir, STAGE_FILENAME)
+        if not os.path.isfile(stage_path):
+            return False
+
+        for i, path in enumerate(stage.output_filenames):
+            output_dir = os.path.dirname(path)
+            if output_dir and not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+            shutil.copyfile(os.path.join(entry_dir, str(i)), path)  # copied with the current time as mtime
+        os.utime(stage_path, None)  # mark as recently used
+        return True
+
+    def store(self, key, stage):
+        """Copy the stage's output files into the cache, then remove the least recently used entries while the cache
+        is too big. Stages whose outputs are bigger than the whole cache aren't stored.
+        """
+        if not all(os.path.isfile(path) for path in stage.output_filenames):
+            return
+        size = sum(os.path.getsize(path) for path in stage.output_filenames)
+        if size > self.max_size:
+            return
+
+        entry_dir = self._entry_dir(key)
+        tmp_dir = entry_dir + '.tmp.%d' % os.getpid()
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        for i, path in enumerate(stage.output_filenames):
+            shutil.copyfile(path, os.path.join(tmp_dir, str(i)))
+        with open(os.path.join(tmp_dir, STAGE_FILENAME), 'w') as f:
+            json.dump({'command': stage.command, 'output_filenames': stage.output_filenames, 'size': size}, f,
+                      indent=2)
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.rename(tmp_dir, entry_dir)
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is no bigger than max_size"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            stage_path = os.path.join(self.cache_dir, name, STAGE_FILENAME)
+            if not os.path.isfile(stage_path):
+                continue
+            with open(stage_path) as f:
+                size = json.load(f)['size']
+            entries.append((os.path.getmtime(stage_path), size, name))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if self.log is not None:
+                self.log("Removing %s from the stage cache" % name)
+            shutil.rmtree(os.path.join(self.cache_dir, name))
+            total_size -= size
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+"""
+Run the parse -> normalize -> sort -> group -> join -> sort steps of master.py in one process, passing the rows from
+each step to the next in memory instead of through a gzipped intermediate file. Only the published tables are written:
+    <out-dir>/clinvar_allele_trait_pairs.<single|multi>.<b37|b38>.tsv.gz
+    <out-dir>/clinvar_alleles.<single|multi>.<b37|b38>.tsv.gz
+both BGZF-compressed, with their tabix indexes. They're the same as the tables made by the separate steps. The out-dir
+can contain {genome_build} and {table}, eg. ../output/{genome_build}/{table}.
+
+Rows are normalized as they come out of the parser, and added to an external sort (sort_table.LineSorter) that keeps up
+to --buffer-size of them in memory, and spills sorted runs to --tmp-dir beyond that. The merged runs are written to the
+allele-trait pairs table and grouped by allele as they're read back, and each allele is joined with the variant
+summary and added to a second external sort for the alleles table, so no table is held in memory as a whole.
+
+Usage:
+    python streaming_pipeline.py -x ClinVarFullRelease.xml.gz -S variant_summary.txt.gz --b37-genome b37.fa -o tmp/
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+from group_by_allele import iter_grouped_rows
+from join_variant_summary_with_clinvar_alleles import FINAL_HEADER, iter_joined_rows, read_variant_summary
+from parse_clinvar_xml import parse_clinvar_tree, get_handle
+from sort_table import LineSorter, parse_size
+from tabix_writer import TabixWriter
+
+
+class RowCollector(object):
+    """File-like object for parse_clinvar_tree to write a table to. Each row is passed through transform as it's
+    written, and the resulting lines are added to an external sort, after the header line in self.header. Once the
+    table has been written, sorted_lines gives its lines in sorted order.
+    """
+
+    def __init__(self, transform=None, buffer_size=2**30, tmp_dir=None):
+        """
+        Args:
+            transform: Optional function that's given the column names and a dictionary of a row's values, and returns
+                the dictionary to keep, or None to drop the row
+            buffer_size: Approximate maximum number of bytes of memory to use for the lines before they're spilled to
+                temporary files
+            tmp_dir: Directory for the temporary files. Default: the system default.
+        """
+        self.transform = transform
+        self.header = None
+        self.rows = 0
+        self.dropped = 0
+        self._sorter = LineSorter(buffer_size=buffer_size, tmp_dir=tmp_dir)
+        self._column_names = None
+        self._partial_line = b''
+
+    def write(self, data):
+        lines = (self._partial_line + data).split(b'\n')
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._add_line(line)
+
+    def _add_line(self, line):
+        if not line:
+            return
+        if self.header is None:
+            self.header = line + b'\n'
+            self._column_names = line.split(b'\t')
+            return
+        if self.transform is None:
+            self._add_row(line + b'\n')
+            return
+
+        values = line.split(b'\t')
+        values += [b''] * (len(self._column_names) - len(values))
+        data = self.transform(self._column_names, dict(zip(self._column_names, values)))
+        if data is None:
+            self.dropped += 1
+        else:
+            self._add_row(b'\t'.join(data[column] for column in self._column_names) + b'\n')
+
+    def _add_row(self, line):
+        self._sorter.add(line)
+        self.rows += 1
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._partial_line:
+            self._add_line(self._partial_line)
+            self._partial_line = b''
+
+    def sorted_lines(self):
+        """Yields the lines after the header, sorted by genomic coordinates. Can only be called once, after close."""
+        return self._sorter.sorted_lines()
+
+    def discard(self):
+        """Remove the lines' temporary files, without reading them"""
+        self._sorter.close()
+
+
+def get_normalize_transform(reference_genome):
+    """Returns a RowCollector transform that normalizes each row's variant with normalize_variants.py, dropping the
+    rows that it would drop
+    """
+    import pysam
+    from normalize_variants import NormalizationError, ReferenceCache, normalize
+
+    # rows come out of the parser in ClinVarSet order rather than by position, so a large window wouldn't be reused
+    reference = ReferenceCache(pysam.FastaFile(reference_genome), window_size=1024)
+
+    def transform(column_names, data):
+        try:
+            data['chrom'], pos, data['ref'], data['alt'] = normalize(
+                reference, data['chrom'], data['pos'], data['ref'], data['alt'])
+        except NormalizationError as e:
+            sys.stderr.write(str(e) + '\n')
+            return None
+        data['pos'] = str(pos)
+        return data
+
+    return transform
+
+
+def _write_through(f, lines):
+    """Writes each line to f as it's passed on"""
+    for line in lines:
+        f.write(line)
+        yield line
+
+
+def write_tables(collector, summaries, trait_pairs_path, alleles_path, buffer_size=2**30, tmp_dir=None, threads=1):
+    """Write the sorted lines of a RowCollector to the allele-trait pairs table, and group and join them as they're
+    written, into the alleles table. Both tables are BGZF-compressed and indexed with tabix.
+
+    Args:
+        collector: RowCollector that the allele-trait pairs table was written to
+        summaries: Dictionary of the variant summary, from read_variant_summary
+        trait_pairs_path, alleles_path: Paths of the tables
+        buffer_size: Approximate maximum number of bytes of memory to use for sorting the alleles table
+        tmp_dir: Directory for the sort's temporary files
+        threads: Number of threads to compress the tables with
+
+    Returns:
+        the number of rows of the alleles table
+    """
+    if not collector.rows:
+        collector.discard()
+        raise ValueError("%s has 0 records" % trait_pairs_path)
+    column_names = collector.header.rstrip(b'\n').split(b'\t')
+
+    sorter = LineSorter(buffer_size=buffer_size, tmp_dir=tmp_dir)
+    try:
+        with TabixWriter(trait_pairs_path, preset='tsv', threads=threads) as f:
+            f.write(collector.header)
+            grouped_rows = iter_grouped_rows(_write_through(f, collector.sorted_lines()), column_names)
+            for row in iter_joined_rows(summaries, column_names, grouped_rows):
+                sorter.add('\t'.join(row) + '\n')
+
+        with TabixWriter(alleles_path, preset='tsv', threads=threads) as f:
+            f.write('\t'.join(FINAL_HEADER) + '\n')
+            for line in sorter.sorted_lines():
+                f.write(line)
+        return sorter.count
+    finally:
+        sorter.close()
+
+
+def run_streaming_pipeline(xml_path, variant_summary_table, reference_genomes, out_dir, tables=('single', 'multi'),
+                           processes=1, transforms=None, threads=1, buffer_size=2**30, tmp_dir=None):
+    """Make the clinvar_allele_trait_pairs and clinvar_alleles tables for each genome build and table type.
+
+    Args:
+        xml_path: Path of the ClinVar XML
+        variant_summary_table: Path of variant_summary.txt.gz
+        reference_genomes: Dictionary that maps 'b37' and/or 'b38' to the path of the reference genome .fa
+        out_dir: Directory to write the tables to. {genome_build} and {table} in it are replaced by the genome build
+            and table type of each table.
+        tables: Which of 'single' and 'multi' to make
+        processes: Number of processes to use for parsing the XML
+        transforms: Optional dictionary mapping each genome build to the RowCollector transform to use instead of
+            normalize_variants.py
+        threads: Number of threads to compress the tables with
+        buffer_size: Approximate maximum number of bytes of memory to use for sorting, in total. It's shared by the
+            tables that are collected while the XML is parsed, and the alleles table that's being sorted.
+        tmp_dir: Directory for the sorted runs that don't fit in buffer_size. Default: the system default.
+
+    Returns:
+        list of the paths written
+    """
+    genome_builds = sorted(reference_genomes)
+    genome_build_ids = [genome_build.replace('b', 'GRCh') for genome_build in genome_builds]
+    if transforms is None:
+        transforms = dict((genome_build, get_normalize_transform(reference_genomes[genome_build]))
+                          for genome_build in genome_builds)
+
+    # each table's lines stay in its sort until it's written, and one alleles table is sorted at a time after that
+    table_buffer_size = buffer_size // (len(genome_builds) * len(tables) + 1)
+
+    # tables that aren't wanted are still parsed, since they come from the same pass through the XML, but discarded
+    collectors = dict(((genome_build, table), RowCollector(transforms[genome_build] if table in tables else
+                                                           lambda column_names, data: None,
+                                                           buffer_size=table_buffer_size, tmp_dir=tmp_dir))
+                      for genome_build in genome_builds for table in ('single', 'multi'))
+    paths = []
+    try:
+        handle = get_handle(xml_path, 'auto')
+        parse_clinvar_tree(handle,
+                           dest=dict((i, collectors[genome_build, 'single'])
+                                     for i, genome_build in zip(genome_build_ids, genome_builds)),
+                           multi=dict((i, collectors[genome_build, 'multi'])
+                                      for i, genome_build in zip(genome_build_ids, genome_builds)),
+                           genome_build=genome_build_ids, processes=processes, streaming=True)
+        handle.close()
+
+        for genome_build, genome_build_id in zip(genome_builds, genome_build_ids):
+            summaries = read_variant_summary(variant_summary_table, genome_build_id)
+            print("variant_summary: %d alleles for %s" % (len(summaries), genome_build_id))
+            for table in tables:
+                collector = collectors.pop((genome_build, table))
+                collector.close()
+                print("%s %s: %d rows normalized, %d dropped" % (genome_build, table, collector.rows,
+                                                                 collector.dropped))
+                fsuffix = '%s.%s' % (table, genome_build)
+                table_dir = out_dir.format(genome_build=genome_build, table=table)
+                if table_dir and not os.path.isdir(table_dir):
+                    os.makedirs(table_dir)
+
+                trait_pairs_path = os.path.join(table_dir, 'clinvar_allele_trait_pairs.%s.tsv.gz' % fsuffix)
+                alleles_path = os.path.join(table_dir, 'clinvar_alleles.%s.tsv.gz' % fsuffix)
+                alleles = write_tables(collector, summaries, trait_pairs_path, alleles_path,
+                                       buffer_size=table_buffer_size, tmp_dir=tmp_dir, threads=threads)
+                print("%s %s: %d rows after the join" % (genome_build, table, alleles))
+                paths += [trait_pairs_path, alleles_path]
+            del summaries
+    finally:
+        for collector in collectors.values():
+            collector.discard()
+
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make the ClinVar allele tables from the XML in one process, without '
+                                                 'writing intermediate files')
+    parser.add_argument('-x', '--xml', dest='xml_path', help='Path to the ClinVar XML dump', required=True)
+    parser.add_argument('-S', '--variant-summary-table', help='Path to variant_summary.txt.gz', required=True)
+    parser.add_argument('--b37-genome', help='b37 .fa genome reference file')
+    parser.add_argument('--b38-genome', help='b38 .fa genome reference file')
+    parser.add_argument('-t', '--tables', nargs='+', choices=['single', 'multi'], default=['single', 'multi'],
+                        help='Which tables to make')
+    parser.add_argument('-p', '--processes', type=int, default=1, help='Number of processes to use for parsing')
+    parser.add_argument('-o', '--out-dir', required=True,
+                        help='Directory to write the tables to. Can contain {genome_build} and {table}')
+    parser.add_argument('-@', '--threads', type=int, default=1, help='Number of threads to compress the tables with')
+    parser.add_argument('--buffer-size', type=parse_size, default='1G', help='Approximate amount of memory to use for '
+                        'sorting, in total, eg. 512M or 2G. Rows beyond that are spilled to --tmp-dir.')
+    parser.add_argument('-T', '--tmp-dir', help='Directory for the sorted runs that are spilled to disk')
+    args = parser.parse_args()
+
+    reference_genomes = dict((genome_build, path) for genome_build, path in
+                             (('b37', args.b37_genome), ('b38', args.b38_genome)) if path is not None)
+    if not reference_genomes:
+        parser.error("At least one genome reference file is required")
+
+    for path in run_streaming_pipeline(args.xml_path, args.variant_summary_table, reference_genomes, args.out_dir,
+                                       tables=args.tables, processes=args.processes, threads=args.threads,
+                                       buffer_size=args.buffer_size, tmp_dir=args.tmp_dir):
+        print("Wrote " + path)
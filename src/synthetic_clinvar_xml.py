@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+"""
+Generate synthetic ClinVarFullRelease XML for benchmarking and testing parse_clinvar_xml.py offline. The records have
+the structure of the real release (see test_data/ClinVarFullRelease_sample.xml) with randomized content, and their
+shape is configurable: the fraction of multi-Measure (haplotype) records, the number of SCVs, the length of submitter
+comments and the number of TraitSets per record. The output is deterministic for a given seed.
+
+Usage:
+    python synthetic_clinvar_xml.py -n 10000 --multi-fraction 0.1 --scvs 3 -o synthetic.xml.gz
+"""
+
+import argparse
+import gzip
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+CHROMOSOMES = [str(c) for c in range(1, 23)] + ['X', 'Y', 'MT']
+GENES = ['BRCA1', 'BRCA2', 'CFTR', 'TSC2', 'PCSK9', 'LDLR', 'MYH7', 'TTN', 'SCN5A', 'KCNQ1', 'MLH1', 'APC']
+CLINICAL_SIGNIFICANCES = ['Pathogenic', 'Likely pathogenic', 'Uncertain significance', 'Likely benign', 'Benign']
+REVIEW_STATUSES = ['criteria provided, single submitter', 'no assertion criteria provided',
+                   'criteria provided, multiple submitters, no conflicts', 'reviewed by expert panel']
+SUBMITTERS = ['GeneDx', 'Invitae', 'Ambry Genetics', 'Illumina Clinical Services Laboratory,Illumina',
+              'Laboratory for Molecular Medicine; Partners', 'OMIM', 'PreventionGenetics,PreventionGenetics']
+ORIGINS = ['germline', 'somatic', 'de novo', 'unknown', 'not provided']
+INHERITANCE_MODES = ['Autosomal dominant inheritance', 'Autosomal recessive inheritance', 'X-linked inheritance']
+COMMENT_WORDS = ['this', 'variant', 'was', 'observed', 'in', 'an', 'individual', 'with', 'a', 'personal', 'history',
+                 'of', 'disease', 'and', 'segregates', 'family', 'functional', 'studies', 'show', 'loss']
+
+XML_HEADER = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+              b'<ReleaseSet Dated="2017-09-05" Type="full" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+              b'xsi:noNamespaceSchemaLocation="http://ftp.ncbi.nlm.nih.gov/pub/clinvar/xsd_public/clinvar_public_1.41.xsd">\n')
+XML_FOOTER = b'</ReleaseSet>\n'
+
+
+def random_allele(rng):
+    length = 1 if rng.random() < 0.8 else rng.randint(2, 12)
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+
+def random_comment(rng, length):
+    """Free text of about length characters that cites PubMed IDs the way submitters do"""
+    words = []
+    size = 0
+    while size < length:
+        if rng.random() < 0.05:
+            word = '(PMID: %s)' % ', '.join(str(rng.randint(10**6, 3 * 10**7)) for _ in range(rng.randint(1, 4)))
+        else:
+            word = rng.choice(COMMENT_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words) + '.'
+
+
+def measure_xml(rng, allele_id, gene):
+    """Returns the lines of a <Measure> with GRCh37 and GRCh38 locations"""
+    chrom = rng.choice(CHROMOSOMES)
+    ref = random_allele(rng)
+    alt = random_allele(rng)
+    while alt == ref:
+        alt = random_allele(rng)
+    transcript = 'NM_%06d.%d' % (rng.randint(1, 999999), rng.randint(1, 5))
+    change = 'c.%d%s>%s' % (rng.randint(1, 9999), ref, alt)
+    hgvs_c = '%s:%s' % (transcript, change)
+    lines = [
+        '      <Measure Type="single nucleotide variant" ID="%d">' % allele_id,
+        '        <Name>',
+        '          <ElementValue Type="Preferred">%s(%s):%s</ElementValue>' % (transcript, gene, escape(change)),
+        '        </Name>',
+        '        <AttributeSet>',
+        '          <Attribute Type="HGVS, coding, RefSeq">%s</Attribute>' % escape(hgvs_c),
+        '        </AttributeSet>',
+        '        <AttributeSet>',
+        '          <Attribute Type="HGVS, protein, RefSeq">NP_%06d.1:p.Lys%dTer</Attribute>' % (
+            rng.randint(1, 999999), rng.randint(1, 3000)),
+        '        </AttributeSet>',
+        '        <AttributeSet>',
+        '          <Attribute Type="MolecularConsequence">%s</Attribute>' % rng.choice(
+            ['nonsense', 'missense variant', 'intron variant', 'frameshift variant']),
+        '          <XRef ID=%s DB="RefSeq"/>' % quoteattr(hgvs_c),
+        '        </AttributeSet>',
+    ]
+    for assembly, accession_version in (('GRCh38', 'NC_000001.11'), ('GRCh37', 'NC_000001.10')):
+        pos = rng.randint(1, 2 * 10**8)
+        lines.append(
+            '        <SequenceLocation Assembly="%s" Chr="%s" Accession="%s" start="%d" stop="%d" display_start="%d" '
+            'display_stop="%d" variantLength="%d" referenceAllele="%s" alternateAllele="%s"/>' % (
+                assembly, chrom, accession_version, pos, pos + len(ref) - 1, pos, pos + len(ref) - 1, len(ref), ref,
+                alt))
+    lines += [
+        '        <MeasureRelationship Type="within single gene">',
+        '          <Symbol>',
+        '            <ElementValue Type="Preferred">%s</ElementValue>' % gene,
+        '          </Symbol>',
+    ]
+    strand = rng.choice('+-')
+    for assembly, accession_version in (('GRCh38', 'NC_000001.11'), ('GRCh37', 'NC_000001.10')):
+        lines.append('          <SequenceLocation Assembly="%s" Chr="%s" Accession="%s" start="1" stop="2" '
+                     'Strand="%s"/>' % (assembly, chrom, accession_version, strand))
+    lines += [
+        '        </MeasureRelationship>',
+        '        <XRef Type="rs" ID="%d" DB="dbSNP"/>' % rng.randint(1, 10**9),
+        '      </Measure>',
+    ]
+    return lines
+
+
+def trait_set_xml(rng, trait_id, indent='    '):
+    lines = [
+        '<TraitSet Type="Disease" ID="%d">' % trait_id,
+        '  <Trait ID="%d" Type="Disease">' % trait_id,
+        '    <Name>',
+        '      <ElementValue Type="Preferred">Synthetic disease %d</ElementValue>' % trait_id,
+        '    </Name>',
+        '    <AttributeSet>',
+        '      <Attribute Type="ModeOfInheritance">%s</Attribute>' % rng.choice(INHERITANCE_MODES),
+        '    </AttributeSet>',
+        '    <AttributeSet>',
+        '      <Attribute Type="prevalence">1-9 / 100 000</Attribute>',
+        '    </AttributeSet>',
+        '    <XRef ID="C%07d" DB="MedGen"/>' % trait_id,
+        '    <XRef Type="MIM" ID="%d" DB="OMIM"/>' % (100000 + trait_id % 500000),
+        '  </Trait>',
+        '</TraitSet>',
+    ]
+    return [indent + line for line in lines]
+
+
+def clinvar_set_xml(rng, index, multi_fraction=0.1, scvs=2, comment_length=200, trait_sets=1):
+    """Returns the XML of one <ClinVarSet> as bytes"""
+    gene = rng.choice(GENES)
+    is_multi = rng.random() < multi_fraction
+    measure_count = rng.randint(2, 3) if is_multi else 1
+    significance = rng.choice(CLINICAL_SIGNIFICANCES)
+
+    lines = [
+        '<ClinVarSet ID="%d">' % (5000000 + index),
+        '  <RecordStatus>current</RecordStatus>',
+        '  <Title>Synthetic record %d</Title>' % index,
+        '  <ReferenceClinVarAssertion DateCreated="2012-08-13" DateLastUpdated="2017-08-28" ID="%d">' % (100000 + index),
+        '    <ClinVarAccession Acc="RCV%09d" Version="1" Type="RCV" DateUpdated="2017-08-28"/>' % index,
+        '    <RecordStatus>current</RecordStatus>',
+        '    <ClinicalSignificance DateLastEvaluated="2016-06-14">',
+        '      <ReviewStatus>%s</ReviewStatus>' % escape(rng.choice(REVIEW_STATUSES)),
+        '      <Description>%s</Description>' % significance,
+        '    </ClinicalSignificance>',
+        '    <Assertion Type="variation to disease"/>',
+        '    <ObservedIn>',
+        '      <Sample>',
+        '        <Origin>%s</Origin>' % rng.choice(ORIGINS),
+        '      </Sample>',
+        '    </ObservedIn>',
+        '    <MeasureSet Type="%s" ID="%d">' % ('Haplotype' if is_multi else 'Variant', index),
+    ]
+    for i in range(measure_count):
+        lines += measure_xml(rng, index * 10 + i, gene)
+    lines.append('    </MeasureSet>')
+    for i in range(trait_sets):
+        lines += trait_set_xml(rng, index * 100 + i)
+    lines += [
+        '    <Citation Type="general">',
+        '      <ID Source="PubMed">%d</ID>' % rng.randint(10**6, 3 * 10**7),
+        '    </Citation>',
+        '  </ReferenceClinVarAssertion>',
+    ]
+
+    for i in range(scvs):
+        lines += [
+            '  <ClinVarAssertion ID="%d">' % (index * 100 + i),
+            '    <ClinVarSubmissionID localKey="%d" submitter=%s submitterDate="2016-07-29"/>' % (
+                i, quoteattr(rng.choice(SUBMITTERS))),
+            '    <ClinVarAccession Acc="SCV%09d" Type="SCV" Version="1" OrgID="%d" DateUpdated="2016-08-01"/>' % (
+                index * 100 + i, rng.randint(1, 600000)),
+            '    <ClinicalSignificance DateLastEvaluated="201%d-05-01">' % rng.randint(0, 7),
+            '      <ReviewStatus>%s</ReviewStatus>' % escape(rng.choice(REVIEW_STATUSES)),
+            '      <Description>%s</Description>' % rng.choice(CLINICAL_SIGNIFICANCES),
+        ]
+        if comment_length:
+            lines.append('      <Comment>%s</Comment>' % escape(random_comment(rng, comment_length)))
+        lines += [
+            '    </ClinicalSignificance>',
+            '    <MeasureSet Type="Variant">',
+            '      <Measure Type="Variation">',
+            '        <AttributeSet>',
+            '          <Attribute Type="HGVS">NM_000059.3:c.9976A&gt;T</Attribute>',
+            '        </AttributeSet>',
+            '      </Measure>',
+            '    </MeasureSet>',
+        ]
+        lines += trait_set_xml(rng, index * 100 + i)
+        lines.append('  </ClinVarAssertion>')
+
+    lines.append('</ClinVarSet>')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def generate_clinvar_xml(out, num_clinvar_sets, seed=0, **shape):
+    """Write a synthetic release with num_clinvar_sets records to the binary file object out.
+
+    Args:
+        out: Open binary output file handle
+        num_clinvar_sets: Number of <ClinVarSet> records
+        seed: Random seed
+        **shape: Keyword arguments for clinvar_set_xml: multi_fraction, scvs, comment_length and trait_sets
+    """
+    rng = random.Random(seed)
+    out.write(XML_HEADER)
+    for index in range(1, num_clinvar_sets + 1):
+        out.write(clinvar_set_xml(rng, index, **shape))
+    out.write(XML_FOOTER)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic ClinVarFullRelease XML file')
+    parser.add_argument('-n', '--num-clinvar-sets', type=int, default=1000)
+    parser.add_argument('--multi-fraction', type=float, default=0.1,
+                        help="Fraction of records with multiple Measures (haplotypes)")
+    parser.add_argument('--scvs', type=int, default=2, help="Number of submissions (SCVs) per record")
+    parser.add_argument('--comment-length', type=int, default=200,
+                        help="Approximate length of the comment in each SCV, or 0 for no comments")
+    parser.add_argument('--trait-sets', type=int, default=1, help="Number of TraitSets per record")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--out', required=True, help="Output path. Gzipped if it ends in .gz")
+    args = parser.parse_args()
+
+    with (gzip.open(args.out, 'wb') if args.out.endswith('.gz') else open(args.out, 'wb')) as out:
+        generate_clinvar_xml(out, args.num_clinvar_sets, seed=args.seed, multi_fraction=args.multi_fraction,
+                             scvs=args.scvs, comment_length=args.comment_length, trait_sets=args.trait_sets)
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+"""
+Write a sorted table or VCF as BGZF and build its tabix index (.tbi) while it's being written, instead of running
+bgzip and then tabix, which reads the whole file again. The blocks can be compressed by several threads.
+
+The data and the index are written to temporary files next to the output path, and renamed into place when the
+writer is closed, so a partly written table is never left at the output path.
+
+Presets (like tabix's):
+    tsv - clinvar_allele_trait_pairs, clinvar_alleles and clinvar_alleles_with_* tables: the same as tabix -S 1 -s 1
+          -b 2 -e 2, ie. a header line, then chrom and pos in the first two columns
+    vcf - the same as tabix -p vcf
+
+Usage:
+    python clinvar_table_to_vcf.py clinvar_alleles.tsv.gz b37.fa | python tabix_writer.py -p vcf -o clinvar.vcf.gz
+"""
+
+import argparse
+import gzip
+import os
+import struct
+import sys
+
+from bgzf import BgzfWriter
+
+PRESETS = {
+    'tsv': {'format': 0, 'col_seq': 1, 'col_beg': 2, 'col_end': 2, 'meta': b'#', 'skip': 1},
+    'vcf': {'format': 2, 'col_seq': 1, 'col_beg': 2, 'col_end': 0, 'meta': b'#', 'skip': 0},
+}
+
+# the bin that htslib uses to store each sequence's first and last offsets and record counts
+PSEUDO_BIN = 37450
+
+# size of the windows of the linear index
+LINEAR_SHIFT = 14
+
+
+def reg2bin(beg, end):
+    """Returns the smallest bin of the UCSC binning scheme that contains the 0-based, half-open interval"""
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+
+class _SequenceIndex(object):
+    def __init__(self, name):
+        self.name = name
+        self.bins = {}  # bin -> list of [start, end] offsets of chunks
+        self.linear = []  # offset of the first record that overlaps each 16kb window, or None
+        self.first_offset = None
+        self.last_offset = None
+        self.records = 0
+        self.last_beg = -1
+
+
+class TabixIndexBuilder(object):
+    """Builds a tabix index from the lines of a sorted file and the offsets they were written at, in the order they
+    were written.
+
+    The offsets can be any increasing integers that are mapped to BGZF virtual offsets when the index is written, like
+    the block number << 16 | offset in block positions from BgzfWriter.tell_block.
+    """
+
+    def __init__(self, preset='tsv'):
+        self.config = PRESETS[preset]
+        self.is_vcf = self.config['format'] == 2
+        self._max_split = max(self.config['col_seq'], self.config['col_beg'], self.config['col_end'],
+                              4 if self.is_vcf else 0)
+        self.sequences = []
+        self._sequence_names = set()
+        self._lines = 0
+
+    def add(self, line, start, end):
+        """Add a line that was written from offset start up to offset end"""
+        self._lines += 1
+        if self._lines <= self.config['skip'] or line.startswith(self.config['meta']):
+            return
+
+        fields = line.rstrip(b'\r\n').split(b'\t', self._max_split)
+        if len(fields) < self._max_split:
+            raise ValueError("Line %d has only %d columns: %r" % (self._lines, len(fields), line[:100]))
+        chrom = fields[self.config['col_seq'] - 1]
+        beg = int(fields[self.config['col_beg'] - 1]) - 1
+        if self.is_vcf:
+            record_end = beg + len(fields[3])
+        else:
+            record_end = int(fields[self.config['col_end'] - 1])
+        record_end = max(record_end, beg + 1)
+
+        if not self.sequences or self.sequences[-1].name != chrom:
+            if chrom in self._sequence_names:
+                raise ValueError("Line %d: the file isn't sorted, %s appears again after other chromosomes" % (
+                    self._lines, chrom.decode('ascii', 'replace')))
+            self._sequence_names.add(chrom)
+            self.sequences.append(_SequenceIndex(chrom))
+        sequence = self.sequences[-1]
+        if beg < sequence.last_beg:
+            raise ValueError("Line %d: the file isn't sorted by position" % self._lines)
+        sequence.last_beg = beg
+
+        chunks = sequence.bins.setdefault(reg2bin(beg, record_end), [])
+        if chunks and chunks[-1][1] == start:
+            chunks[-1][1] = end
+        else:
+            chunks.append([start, end])
+
+        last_window = (record_end - 1) >> LINEAR_SHIFT
+        if len(sequence.linear) <= last_window:
+            sequence.linear.extend([None] * (last_window + 1 - len(sequence.linear)))
+        for window in range(beg >> LINEAR_SHIFT, last_window + 1):
+            if sequence.linear[window] is None:
+                sequence.linear[window] = start
+
+        if sequence.first_offset is None:
+            sequence.first_offset = start
+        sequence.last_offset = end
+        sequence.records += 1
+
+    def write(self, path, get_virtual_offset=lambda offset: offset):
+        """Write the .tbi index to path.
+
+        Args:
+            path: Output path
+            get_virtual_offset: Function that maps the offsets given to add to BGZF virtual offsets
+        """
+        config = self.config
+        names = b''.join(sequence.name + b'\0' for sequence in self.sequences)
+        with BgzfWriter(path) as f:
+            f.write(b'TBI\x01' + struct.pack('<8i', len(self.sequences), config['format'], config['col_seq'],
+                                             config['col_beg'], config['col_end'], ord(config['meta']),
+                                             config['skip'], len(names)) + names)
+            for sequence in self.sequences:
+                f.write(struct.pack('<i', len(sequence.bins) + 1))
+                for bin_number in sorted(sequence.bins):
+                    chunks = sequence.bins[bin_number]
+                    f.write(struct.pack('<Ii', bin_number, len(chunks)))
+                    f.write(b''.join(struct.pack('<QQ', get_virtual_offset(chunk_start), get_virtual_offset(chunk_end))
+                                     for chunk_start, chunk_end in chunks))
+                f.write(struct.pack('<IiQQQQ', PSEUDO_BIN, 2, get_virtual_offset(sequence.first_offset),
+                                    get_virtual_offset(sequence.last_offset), sequence.records, 0))
+
+                # like htslib, windows without records get the offset of the window before them, or the first offset
+                linear = []
+                previous = sequence.first_offset
+                for offset in sequence.linear:
+                    previous = offset if offset is not None else previous
+                    linear.append(get_virtual_offset(previous))
+                f.write(struct.pack('<i%dQ' % len(linear), len(linear), *linear))
+            f.write(struct.pack('<Q', 0))  # number of records without coordinates
+
+
+def read_index(path):
+    """Reads the parts of a .tbi index that are needed to split the file it indexes into regions.
+
+    Returns:
+        a list with a dictionary for each sequence, in the order they appear in the file, with its 'name' (bytes),
+        the 'first_offset' and 'last_offset' virtual offsets of its records, its number of 'records' (None if the
+        index doesn't have the pseudo-bin that records it), and the 'linear' index: the virtual offset of the first
+        record that overlaps each 16kb window
+    """
+    with gzip.open(path) as f:
+        data = f.read()
+    if data[:4] != b'TBI\x01':
+        raise ValueError("%s isn't a tabix index" % path)
+    n_ref = struct.unpack('<i', data[4:8])[0]
+    l_nm = struct.unpack('<i', data[32:36])[0]
+    names = data[36:36 + l_nm].split(b'\0')[:n_ref]
+    offset = 36 + l_nm
+    sequences = []
+    for name in names:
+        sequence = {'name': name, 'first_offset': None, 'last_offset': None, 'records': None}
+        n_bin = struct.unpack('<i', data[offset:offset + 4])[0]
+        offset += 4
+        for _ in range(n_bin):
+            bin_number, n_chunk = struct.unpack('<Ii', data[offset:offset + 8])
+            offset += 8
+            if bin_number == PSEUDO_BIN:
+                sequence['first_offset'], sequence['last_offset'], sequence['records'] = struct.unpack(
+                    '<QQQ', data[offset:offset + 24])
+            else:
+                for i in range(n_chunk):
+                    chunk_start, chunk_end = struct.unpack('<QQ', data[offset + 16 * i:offset + 16 * (i + 1)])
+                    # indexes without the pseudo-bin: take the first and last offsets from the chunks
+                    if sequence['first_offset'] is None or chunk_start < sequence['first_offset']:
+                        sequence['first_offset'] = chunk_start
+                    if sequence['last_offset'] is None or chunk_end > sequence['last_offset']:
+                        sequence['last_offset'] = chunk_end
+            offset += 16 * n_chunk
+        n_intv = struct.unpack('<i', data[offset:offset + 4])[0]
+        sequence['linear'] = list(struct.unpack('<%dQ' % n_intv, data[offset + 4:offset + 4 + 8 * n_intv]))
+        offset += 4 + 8 * n_intv
+        sequences.append(sequence)
+    return sequences
+
+
+class TabixWriter(object):
+    """File-like object that writes a sorted table as BGZF to path, and its tabix index to path.tbi
+
+    Example:
+        with TabixWriter('clinvar_alleles.single.b37.tsv.gz', preset='tsv', threads=4) as f:
+            f.write(header)
+            for line in sorted_lines:
+                f.write(line)
+    """
+
+    def __init__(self, path, preset='tsv', threads=1, compresslevel=6):
+        """
+        Args:
+            path: Output path. The index is written to path + '.tbi'.
+            preset: 'tsv' or 'vcf', see PRESETS
+            threads: Number of threads to compress with
+            compresslevel: zlib compression level, 1 to 9
+        """
+        self.name = path
+        self.index_path = path + '.tbi'
+        self._tmp_path = '%s.tmp.%d' % (path, os.getpid())
+        self._tmp_index_path = '%s.tmp.%d' % (self.index_path, os.getpid())
+        self._writer = BgzfWriter(self._tmp_path, compresslevel=compresslevel, threads=threads)
+        self._index = TabixIndexBuilder(preset)
+        self._partial_line = b''
+        self.closed = False
+
+    def write(self, data):
+        if self._partial_line:
+            data = self._partial_line + data
+            self._partial_line = b''
+        start = 0
+        while True:
+            end = data.find(b'\n', start) + 1
+            if end == 0:
+                self._partial_line = data[start:]
+                return
+            self._write_line(data[start:end])
+            start = end
+
+    def _write_line(self, line):
+        block_number, offset = self._writer.tell_block()
+        self._writer.write(line)
+        end_block_number, end_offset = self._writer.tell_block()
+        self._index.add(line, (block_number << 16) | offset, (end_block_number << 16) | end_offset)
+
+    def _get_virtual_offset(self, offset):
+        return self._writer.get_virtual_offset(offset >> 16, offset & 0xffff)
+
+    def close(self):
+        """Finish writing, and move the table and its index to their final paths"""
+        if self.closed:
+            return
+        try:
+            if self._partial_line:
+                self._write_line(self._partial_line)
+            self._writer.close()
+            self._index.write(self._tmp_index_path, self._get_virtual_offset)
+            # the index is renamed last, so that it isn't older than the table
+            os.rename(self._tmp_path, self.name)
+            os.rename(self._tmp_index_path, self.index_path)
+        except Exception:
+            self.abort()
+            raise
+        self.closed = True
+
+    def abort(self):
+        """Stop writing, and remove the temporary files"""
+        self._writer.close()
+        for path in (self._tmp_path, self._tmp_index_path):
+            if os.path.isfile(path):
+                os.remove(path)
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BGZF-compress a sorted table from stdin, and index it with tabix')
+    parser.add_argument('-o', '--outfile', required=True, help="Output path. The index is written to <outfile>.tbi")
+    parser.add_argument('-p', '--preset', choices=sorted(PRESETS), default='tsv', help="Table format")
+    parser.add_argument('-@', '--threads', type=int, default=1, help="Number of threads to compress with")
+    args = parser.parse_args()
+
+    infile = getattr(sys.stdin, 'buffer', sys.stdin)
+    with TabixWriter(args.outfile, preset=args.preset, threads=args.threads) as writer:
+        while True:
+            data = infile.read(2**20)
+            if not data:
+                break
+            writer.write(data)
@@ -0,0 +1,269 @@
+"""
+Fast reading and writing of the pipeline's tab-separated tables.
+
+Reading a gzipped table with gzip.open one line at a time is slow in python 2, since GzipFile.readline decompresses
+and searches the data in small pieces, and making a dictionary of column name -> value for every row, to read a few of
+its columns, allocates more than the rest of the work. Instead, TableReader decompresses plain gzip or BGZF tables in
+large blocks, and gives each row as the list of its values, with the indexes of the columns looked up once from the
+header. Record wraps a row for code that reads it by column name, without copying it into a dictionary. TableWriter
+joins the lines that are written to it, and writes them to the file in large batches.
+
+Example:
+    with TableReader('clinvar_allele_trait_pairs.single.b37.tsv.gz') as table, TableWriter(sys.stdout) as out:
+        chrom_i, pos_i = table.indexes(['chrom', 'pos'])
+        out.write_row(table.column_names)
+        for values in table:
+            ...
+            out.write_row(values)
+"""
+
+import io
+import sys
+import zlib
+
+# number of bytes to read from the file at a time
+READ_BLOCK_SIZE = 2**20
+
+# number of bytes of lines to join before each write to the file
+WRITE_BATCH_SIZE = 2**20
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def read_blocks(path_or_fileobj, block_size=READ_BLOCK_SIZE):
+    """Yields the data of a file in blocks, decompressed if it's gzipped. Gzip files that are several gzip members one
+    after the other, like BGZF files, are decompressed member by member. zlib releases the GIL while inflating each
+    block, so this can run in parallel with other work in another thread.
+
+    Args:
+        path_or_fileobj: Path of the file, or '-' or a binary file object to read from. The file is closed at the end,
+            if it was opened from a path.
+        block_size: Number of bytes to read at a time
+    """
+    fileobj, owns_fileobj = _open(path_or_fileobj)
+    try:
+        data = fileobj.read(block_size)
+        if not data.startswith(GZIP_MAGIC):
+            while data:
+                yield data
+                data = fileobj.read(block_size)
+            return
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while data:
+            while data:
+                block = decompressor.decompress(data)
+                if block:
+                    yield block
+                # any data left over after the end of a gzip member is the start of the next member
+                data = decompressor.unused_data
+                if data:
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = fileobj.read(block_size)
+        block = decompressor.flush()
+        if block:
+            yield block
+    finally:
+        if owns_fileobj:
+            fileobj.close()
+
+
+def read_chunks(fileobj, block_size=READ_BLOCK_SIZE):
+    """Yields the data of a file in chunks of whole lines, as str. The last chunk may not end with a newline, if the
+    file doesn't.
+    """
+    rest = b''
+    for block in read_blocks(fileobj, block_size):
+        end = block.rfind(b'\n') + 1
+        if not end:
+            rest += block
+            continue
+        chunk = rest + block[:end] if rest else block[:end]
+        rest = block[end:]
+        yield chunk if bytes is str else chunk.decode('utf-8')
+    if rest:
+        yield rest if bytes is str else rest.decode('utf-8')
+
+
+def _open(path_or_fileobj):
+    """Returns (file object, whether it should be closed with the reader)"""
+    if not isinstance(path_or_fileobj, (str, type(u''))):
+        return getattr(path_or_fileobj, 'buffer', path_or_fileobj), False  # in python 3, sys.stdin's binary buffer
+    if path_or_fileobj == '-':
+        return getattr(sys.stdin, 'buffer', sys.stdin), False
+    return open(path_or_fileobj, 'rb'), True
+
+
+def read_lines(path_or_fileobj, block_size=READ_BLOCK_SIZE):
+    """Yields the lines of a file, including the header line, like iterating through gzip.open(path) or open(path).
+
+    Args:
+        path_or_fileobj: Path of the file, which can be gzipped, or '-' or a file object opened for reading to read
+            from. The file is closed at the end, if it was opened from a path.
+        block_size: Number of bytes to read at a time
+    """
+    fileobj, owns_fileobj = _open(path_or_fileobj)
+    try:
+        for chunk in read_chunks(fileobj, block_size):
+            for line in io.StringIO(chunk) if bytes is not str else io.BytesIO(chunk):
+                yield line
+    finally:
+        if owns_fileobj:
+            fileobj.close()
+
+
+class Record(object):
+    """A row of a table that can be read by column name like a dictionary, without copying its values into one"""
+
+    __slots__ = ('values', 'index')
+
+    def __init__(self, values, index):
+        """
+        Args:
+            values: list of the row's values
+            index: dictionary of column name -> index in values, eg. TableReader.index
+        """
+        self.values = values
+        self.index = index
+
+    def __getitem__(self, column_name):
+        return self.values[self.index[column_name]]
+
+    def get(self, column_name, default=None):
+        i = self.index.get(column_name)
+        return default if i is None or i >= len(self.values) else self.values[i]
+
+    def to_dict(self):
+        return dict((column_name, self.values[i]) for column_name, i in self.index.items() if i < len(self.values))
+
+
+def get_index(column_names):
+    """Returns a dictionary of column name -> index"""
+    return dict((column_name, i) for i, column_name in enumerate(column_names))
+
+
+class TableReader(object):
+    """Reads the rows of a tab-separated table with a header line, as lists of values.
+
+    Example:
+        with TableReader('clinvar_alleles.single.b37.tsv.gz') as table:
+            chrom_i, pos_i = table.indexes(['chrom', 'pos'])
+            for values in table:
+                print(values[chrom_i], values[pos_i])
+    """
+
+    def __init__(self, path_or_fileobj, block_size=READ_BLOCK_SIZE):
+        """
+        Args:
+            path_or_fileobj: Path of the table, which can be gzipped, or '-' or a file object opened for reading to read
+                it from
+            block_size: Number of bytes to read at a time
+        """
+        self.name = path_or_fileobj if isinstance(path_or_fileobj, (str, type(u''))) else getattr(
+            path_or_fileobj, 'name', '<table>')
+        self._fileobj, self._owns_fileobj = _open(path_or_fileobj)
+        self._chunks = read_chunks(self._fileobj, block_size)
+        self._rest = ''  # the part of the first chunk after the header line
+        for chunk in self._chunks:
+            self._rest += chunk
+            if '\n' in self._rest:
+                break
+        if not self._rest:
+            raise ValueError("%s is empty" % self.name)
+        end = self._rest.find('\n') + 1 or len(self._rest)
+        self.header = self._rest[:end]
+        self._rest = self._rest[end:]
+        self.column_names = self.header.rstrip('\n').split('\t')
+        self.index = get_index(self.column_names)
+
+    def indexes(self, column_names):
+        """Returns the indexes of the given columns in each row"""
+        try:
+            return [self.index[column_name] for column_name in column_names]
+        except KeyError as e:
+            raise ValueError("%s doesn't have a %s column" % (self.name, e))
+
+    def _read_chunks(self):
+        if self._rest:
+            rest = self._rest
+            self._rest = ''
+            yield rest
+        for chunk in self._chunks:
+            yield chunk
+
+    def lines(self):
+        """Yields the lines after the header, including their newlines"""
+        for chunk in self._read_chunks():
+            for line in io.StringIO(chunk) if bytes is not str else io.BytesIO(chunk):
+                yield line
+
+    def __iter__(self):
+        """Yields the list of values of each row after the header"""
+        for chunk in self._read_chunks():
+            lines = chunk.split('\n')
+            if not lines[-1]:
+                lines.pop()  # after the last newline
+            for line in lines:
+                yield line.split('\t')
+
+    def records(self):
+        """Yields a Record for each row after the header"""
+        index = self.index
+        for values in self:
+            yield Record(values, index)
+
+    def close(self):
+        if self._owns_fileobj:
+            self._fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TableWriter(object):
+    """Collects the lines written to it, and writes them to a file object in large batches, so there's one write call
+    per batch rather than one per row. The lines can be str or bytes, as long as they're all the same type.
+    """
+
+    def __init__(self, fileobj, batch_size=WRITE_BATCH_SIZE):
+        """
+        Args:
+            fileobj: File object to write to. It's flushed, but not closed, by flush() and close().
+            batch_size: Number of bytes of lines to collect before writing them
+        """
+        self.fileobj = fileobj
+        self.batch_size = batch_size
+        self._lines = []
+        self._size = 0
+
+    def write(self, data):
+        self._lines.append(data)
+        self._size += len(data)
+        if self._size >= self.batch_size:
+            self._write_lines()
+
+    def write_row(self, values):
+        """Write a row, given as a list of strings"""
+        self.write('\t'.join(values) + '\n')
+
+    def _write_lines(self):
+        if self._lines:
+            self.fileobj.write(self._lines[0][:0].join(self._lines))
+            self._lines = []
+            self._size = 0
+
+    def flush(self):
+        self._write_lines()
+        self.fileobj.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
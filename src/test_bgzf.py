@@ -0,0 +1,106 @@
+import gzip
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from bgzf import BgzfWriter, BgzfReader, BGZF_BLOCK_SIZE, BGZF_EOF_BLOCK
+
+
+def iter_blocks(data):
+    """Yields (block_size, uncompressed_size) for each BGZF block, using the sizes recorded in the block headers"""
+    offset = 0
+    while offset < len(data):
+        assert data[offset:offset + 4] == b'\x1f\x8b\x08\x04'
+        assert data[offset + 12:offset + 14] == b'BC'
+        block_size = struct.unpack('<H', data[offset + 16:offset + 18])[0] + 1
+        uncompressed_size = struct.unpack('<I', data[offset + block_size - 4:offset + block_size])[0]
+        yield block_size, uncompressed_size
+        offset += block_size
+
+
+class TestBgzfWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'test.tsv.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        lines = [('%d\ttest\t%s\n' % (i, 'ACGT' * (i % 50))).encode('ascii') for i in range(20000)]
+        with BgzfWriter(self.path) as f:
+            for line in lines:
+                f.write(line)
+            f.write(os.urandom(3 * BGZF_BLOCK_SIZE))  # incompressible data
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with gzip.open(self.path) as f:
+            self.assertEqual(f.read()[:-3 * BGZF_BLOCK_SIZE], b''.join(lines))
+
+        self.assertTrue(data.endswith(BGZF_EOF_BLOCK))
+        blocks = list(iter_blocks(data))
+        self.assertEqual(sum(block_size for block_size, _ in blocks), len(data))
+        self.assertTrue(all(block_size <= 2**16 for block_size, _ in blocks))
+        self.assertTrue(all(size == BGZF_BLOCK_SIZE for _, size in blocks[:-2]))
+
+    def test_flush(self):
+        f = BgzfWriter(fileobj=io.BytesIO())
+        f.write(b'abc')
+        f.flush()
+        f.write(b'def')
+        f.close()
+        self.assertEqual([size for _, size in iter_blocks(f.fileobj.getvalue())], [3, 3, 0])
+
+    def test_threads(self):
+        lines = [('%d\t%s\n' % (i, 'ACGT' * (i % 70))).encode('ascii') for i in range(30000)]
+        outputs = []
+        for threads in (1, 4):
+            f = BgzfWriter(fileobj=io.BytesIO(), threads=threads)
+            positions = []
+            for line in lines:
+                positions.append(f.tell_block())
+                f.write(line)
+            f.close()
+            outputs.append(f.fileobj.getvalue())
+
+            reader = BgzfReader(fileobj=io.BytesIO(outputs[-1]))
+            for i in (0, 1, 5000, 29999):
+                reader.seek(f.get_virtual_offset(*positions[i]))
+                self.assertEqual(reader.read(len(lines[i])), lines[i])
+        self.assertEqual(outputs[0], outputs[1])
+
+
+class TestBgzfReader(unittest.TestCase):
+
+    def test_seek(self):
+        records = [('record %d %s\n' % (i, 'x' * (i % 1000))).encode('ascii') for i in range(2000)]
+        f = BgzfWriter(fileobj=io.BytesIO())
+        offsets = []
+        for record in records:
+            offsets.append(f.tell())
+            f.write(record)
+        f.close()
+
+        reader = BgzfReader(fileobj=io.BytesIO(f.fileobj.getvalue()))
+        self.assertEqual(reader.read(), b''.join(records))
+        for i in (1999, 0, 1234, 1235, 17):
+            reader.seek(offsets[i])
+            self.assertEqual(reader.tell(), offsets[i])
+            self.assertEqual(reader.read(len(records[i])), records[i])
+        reader.seek(offsets[-1])
+        self.assertEqual(reader.read(10**6), records[-1])
+
+        # lines that span blocks
+        reader.seek(offsets[1000])
+        self.assertEqual(reader.readline(), records[1000])
+        self.assertEqual(list(reader), records[1001:])
+        self.assertEqual(reader.readline(), b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
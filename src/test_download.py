@@ -0,0 +1,182 @@
+import hashlib
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from download import download, DownloadError
+
+CONTENT = bytes(bytearray(random.Random(0).getrandbits(8) for _ in range(300000)))
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves CONTENT at /file.gz and its MD5 checksum at /file.gz.md5, with byte ranges if server.ranges is True, and
+    its size if server.sizes is True. The first server.failures responses are cut off after half of their bytes, and
+    the connections of the first server.dropped requests for /file.gz are closed without a response.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_content(self, include_body):
+        if self.path == '/file.gz.md5':
+            body = ('MD5 (file.gz) = %s\n' % hashlib.md5(CONTENT).hexdigest()).encode('ascii')
+            start, end = 0, len(body)
+        elif self.path == '/file.gz':
+            body = CONTENT
+            start, end = 0, len(body)
+        else:
+            self.send_error(404)
+            return
+
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+        if match is not None and self.server.ranges:
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(body)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, len(body)))
+        else:
+            self.send_response(200)
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if self.server.sizes:
+            self.send_header('Content-Length', str(end - start))
+        self.send_header('ETag', '"%s"' % self.server.etag)
+        self.end_headers()
+        if not include_body:
+            return
+
+        with self.server.lock:
+            self.server.requests.append((self.path, start, end))
+            fail = self.path == '/file.gz' and self.server.failures > 0
+            if fail:
+                self.server.failures -= 1
+        if fail:
+            self.wfile.write(body[start:(start + end) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:end])
+
+    def do_HEAD(self):
+        self.send_content(False)
+
+    def do_GET(self):
+        with self.server.lock:
+            drop = self.path == '/file.gz' and self.server.dropped > 0
+            if drop:
+                self.server.dropped -= 1
+        if drop:
+            self.close_connection = True
+            return
+        self.send_content(True)
+
+
+class TestDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'file.gz')
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.ranges = True
+        self.server.failures = 0
+        self.server.dropped = 0
+        self.server.sizes = True
+        self.server.etag = 'v1'
+        self.server.requests = []
+        self.server.lock = threading.Lock()
+        self.url = 'http://127.0.0.1:%d/file.gz' % self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def download(self, **kwargs):
+        download(self.url, self.path, min_segment_size=2**16, timeout=5, **kwargs)
+
+    def assertDownloaded(self):
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['file.gz'])
+
+    def file_requests(self):
+        return [(start, end) for path, start, end in self.server.requests if path == '/file.gz']
+
+    def test_segments(self):
+        self.download(segments=3, md5_url=self.url + '.md5')
+        self.assertDownloaded()
+        self.assertEqual(sorted(self.file_requests()), [(0, 100000), (100000, 200000), (200000, 300000)])
+
+    def test_retry_and_resume(self):
+        # each segment is cut off once, and continued from where it stopped
+        self.server.failures = 2
+        self.download(segments=2, retries=1)
+        self.assertDownloaded()
+        self.assertEqual(sorted(self.file_requests()), [(0, 150000), (75000, 150000), (150000, 300000),
+                                                        (225000, 300000)])
+
+        # without retries the download fails, and is resumed by the next one
+        os.remove(self.path)
+        del self.server.requests[:]
+        self.server.failures = 1
+        self.assertRaises(DownloadError, self.download, segments=1, retries=0)
+        self.assertFalse(os.path.exists(self.path))
+        self.download(segments=1, retries=0)
+        self.assertDownloaded()
+        self.assertEqual(self.file_requests(), [(0, 300000), (150000, 300000)])
+
+        # but not if the remote file changed in between
+        os.remove(self.path)
+        del self.server.requests[:]
+        self.server.failures = 1
+        self.assertRaises(DownloadError, self.download, segments=1, retries=0)
+        self.server.etag = 'v2'
+        self.download(segments=1, retries=0)
+        self.assertDownloaded()
+        self.assertEqual(self.file_requests(), [(0, 300000), (0, 300000)])
+
+    def test_no_ranges(self):
+        self.server.ranges = False
+        self.server.failures = 1
+        self.download(segments=4, retries=1)
+        self.assertDownloaded()
+        self.assertEqual(self.file_requests(), [(0, 300000), (0, 300000)])
+
+    def test_retry_unknown_size(self):
+        self.server.sizes = False
+        self.server.dropped = 1
+        messages = []
+        self.download(segments=4, retries=1, log=messages.append)
+        self.assertDownloaded()
+        self.assertEqual(len([message for message in messages if message.startswith('Retrying bytes 0- of ')]), 1)
+
+        # without retries, the error is reported, and the partial file isn't renamed
+        os.remove(self.path)
+        self.server.dropped = 1
+        self.assertRaises(DownloadError, self.download, segments=4, retries=0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_wrong_md5(self):
+        self.assertRaises(DownloadError, self.download, md5='0' * 32)
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
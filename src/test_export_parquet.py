@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from export_parquet import export_parquet, get_column_type, parse_columns
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+COLUMN_NAMES = ['chrom', 'pos', 'ref', 'alt', 'rcv', 'pathogenic', 'clinical_significance', 'gold_stars', 'ac_adj']
+ROWS = [
+    ['1', '100', 'A', 'G', 'RCV000000001;RCV000000002', '2', 'Pathogenic', '3', '5'],
+    ['1', '200', 'C', 'T', 'RCV000000003', '0', 'Benign', '-', ''],
+    ['X', '5', 'G', 'GA', '', '1', 'Conflicting interpretations of pathogenicity', '1.0', '7'],
+]
+
+
+class TestExportParquet(unittest.TestCase):
+
+    def test_column_types(self):
+        self.assertEqual([get_column_type(column_name) for column_name in COLUMN_NAMES],
+                         ['string', 'int', 'string', 'string', 'list', 'int', 'dictionary', 'int', 'string'])
+
+    def test_parse_columns(self):
+        columns = parse_columns(ROWS, COLUMN_NAMES)
+        self.assertEqual(columns['pos'], [100, 200, 5])
+        self.assertEqual(columns['rcv'], [['RCV000000001', 'RCV000000002'], ['RCV000000003'], []])
+        self.assertEqual(columns['gold_stars'], [3, None, 1])
+        self.assertEqual(columns['ac_adj'], ['5', None, '7'])
+        self.assertRaises(ValueError, parse_columns, [['1', 'x'] + ROWS[0][2:]], COLUMN_NAMES)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow isn't installed")
+    def test_export_parquet(self):
+        import pyarrow.parquet as pq
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            dataset_dir = os.path.join(tmp_dir, 'clinvar_alleles.parquet')
+            table = '\t'.join(COLUMN_NAMES) + '\n' + ''.join('\t'.join(row) + '\n' for row in ROWS)
+            self.assertEqual(export_parquet(iter(table.splitlines(True)), dataset_dir, batch_size=2), 3)
+            self.assertEqual(sorted(os.listdir(dataset_dir)), ['_common_metadata', 'chrom=1', 'chrom=X'])
+            self.assertEqual(os.listdir(tmp_dir), ['clinvar_alleles.parquet'])
+
+            chrom_1 = pq.read_table(os.path.join(dataset_dir, 'chrom=1', 'part-0.parquet'))
+            self.assertEqual(chrom_1.num_rows, 2)
+            self.assertEqual(str(chrom_1.schema.field('pos').type), 'int64')
+            self.assertEqual(chrom_1.column('gold_stars').to_pylist(), [3, None])
+            self.assertEqual(chrom_1.column('rcv').to_pylist(), [['RCV000000001', 'RCV000000002'], ['RCV000000003']])
+            self.assertTrue(pyarrow.types.is_dictionary(chrom_1.schema.field('clinical_significance').type))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
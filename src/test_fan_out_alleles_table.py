@@ -0,0 +1,109 @@
+import functools
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from clinvar_alleles_stats import AlleleStats
+from clinvar_table_to_vcf import table_to_vcf
+from fan_out_alleles_table import fan_out, VcfOutput, TableExampleOutput, StatsOutput, CheckOutput
+from parse_clinvar_xml import HEADER
+
+FINAL_HEADER = HEADER + ['gold_stars', 'conflicted']
+
+
+def make_row(i):
+    values = dict((column, '') for column in FINAL_HEADER)
+    values.update({
+        'chrom': '1', 'pos': str(1000 + i), 'ref': 'A', 'alt': 'G', 'variation_type': 'Variant',
+        'variation_id': str(i), 'rcv': 'RCV%09d' % i, 'allele_id': str(100 + i), 'hgvs_c': 'NM_1:c.%dA>G' % i,
+        'clinical_significance': ['Pathogenic', 'Benign', 'Uncertain significance'][i % 3],
+        'review_status': 'criteria provided, single submitter', 'gold_stars': '1', 'conflicted': '0',
+        'all_traits': 'Trait %d;Trait, with comma' % (i % 5), 'pathogenic': '1', 'benign': '0',
+    })
+    return '\t'.join(values[column] for column in FINAL_HEADER) + '\n'
+
+
+class TestFanOutAllelesTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.reference_genome = os.path.join(self.tmp_dir, 'b37.fa')
+        with open(self.reference_genome + '.fai', 'w') as f:
+            f.write('1\t249250621\t52\t60\t61\nMT\t16569\t253404903\t70\t71\n')
+        # check_allele_table.py expects more than 100 rows in a multi table
+        self.table_path = os.path.join(self.tmp_dir, 'clinvar_alleles.multi.b37.tsv')
+        self.lines = ['\t'.join(FINAL_HEADER) + '\n'] + [make_row(i) for i in range(1200)]
+        with open(self.table_path, 'w') as f:
+            f.write(''.join(self.lines))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def read(self, name):
+        with (gzip.open if name.endswith('.gz') else open)(self.path(name)) as f:
+            return f.read()
+
+    def run_fan_out(self, lines, parallel):
+        output_factories = [
+            functools.partial(VcfOutput, path=self.path('out.vcf.gz'), reference_genome=self.reference_genome,
+                              example_path=self.path('example.vcf')),
+            functools.partial(TableExampleOutput, path=self.path('example.tsv')),
+            functools.partial(StatsOutput, path=self.path('stats.txt')),
+            functools.partial(CheckOutput, alleles_table_path=self.table_path),
+        ]
+        fan_out(iter(lines), output_factories, parallel=parallel, batch_size=100)
+
+    def test_outputs(self):
+        expected_vcf_path = self.path('expected.vcf')
+        with open(expected_vcf_path, 'w') as f:
+            table_to_vcf(self.table_path, self.reference_genome, out=f)
+        expected_vcf = self.read('expected.vcf')
+
+        for parallel in (False, True):
+            self.run_fan_out(self.lines, parallel)
+            self.assertEqual(self.read('out.vcf.gz').decode('ascii'), expected_vcf)
+            self.assertTrue(os.path.isfile(self.path('out.vcf.gz.tbi')))
+            self.assertEqual(self.read('example.vcf'), ''.join(expected_vcf.splitlines(True)[:750]))
+            self.assertEqual(self.read('example.tsv'), ''.join(self.lines[:750]))
+            stats = self.read('stats.txt')
+            self.assertIn('Total rows: 1200\n', stats)
+            self.assertIn('Pathogenic                400\n', stats)
+
+        # the VCF's INFO values don't have commas or semicolons
+        self.assertIn('ALL_TRAITS=Trait_0|Trait..with_comma', expected_vcf)
+
+    def test_failed_check(self):
+        # the other outputs are still written
+        lines = self.lines[:] + [make_row(2000).replace('1\t3000', 'chr1\t3000', 1)]
+        for parallel in (False, True):
+            self.assertRaises(RuntimeError, self.run_fan_out, lines, parallel)
+            self.assertIn('Total rows: 1201\n', self.read('stats.txt'))
+            self.assertTrue(os.path.isfile(self.path('out.vcf.gz.tbi')))
+
+
+    def test_stats_format(self):
+        stats = AlleleStats(FINAL_HEADER)
+        for submitters in ['OMIM'] * 12 + [u'Universit\xe9 Lille'.encode('utf-8'), 'Counsyl']:
+            values = make_row(0).rstrip('\n').split('\t')
+            values[FINAL_HEADER.index('all_submitters')] = submitters
+            stats.add(values)
+        out = io.BytesIO()
+        stats.write(out)
+        lines = out.getvalue().decode('utf-8').split('================\n')
+        all_submitters = [section for section in lines if section.startswith('column 27: all_submitters')][0]
+        # padded to the same number of characters, like pandas' value_counts
+        self.assertEqual(all_submitters.splitlines()[1:], [
+            u'OMIM                12', u'Counsyl              1', u'Universit\xe9 Lille     1',
+            u'Name: all_submitters, dtype: int64'])
+        # columns without values
+        self.assertIn(u'column 33: prevalence\nSeries([], Name: prevalence, dtype: int64)\n', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,14 @@
+import os
+import random
+import shutil
+import tempfile
 import unittest
-from group_by_allele import group_alleles, group_by_allele
+from group_by_allele import group_alleles, group_by_allele, group_by_allele_parallel, get_shards, group_unsorted
 from pprint import pprint
 from StringIO import StringIO
 from parse_clinvar_xml import HEADER
+from sort_table import sort_lines
+from tabix_writer import TabixWriter, read_index
 
 class TestGroupByAllele(unittest.TestCase):
 
@@ -46,6 +52,79 @@ class TestGroupByAllele(unittest.TestCase):
             elif i == 2:
                 self.assertEqual(output_row, '')
 
+    def test_group_by_allele_same_as_group_alleles(self):
+        # an allele with one row is written as it is, with its duplicate values. Alleles with several rows are
+        # written the same way as when their rows are combined two at a time by group_alleles
+        r4 = list(self.r1)
+        r4[1] = '55518317'
+        input_rows = ["\t".join(row)+"\n" for row in [self.header, self.r1, self.r2, self.r3, self.r1, r4]]
+
+        outfile = StringIO()
+        group_by_allele(iter(input_rows), outfile)
+
+        combined_data = dict(zip(self.header, self.r1))
+        for row in [self.r2, self.r3, self.r1]:
+            combined_data = group_alleles(combined_data, dict(zip(self.header, row)))
+        expected_rows = [self.header, [combined_data[column] for column in self.header], r4]
+        self.assertEqual(outfile.getvalue(), "".join("\t".join(row)+"\n" for row in expected_rows))
+
+    def make_rows(self, rng):
+        rows = []
+        for chrom in ['1', '2', 'X']:
+            for pos in sorted(rng.sample(range(1, 2 * 10**6), 2000)):
+                # some alleles have several rows, with different RCVs and counts
+                for i in range(rng.choice([1, 1, 1, 2, 5])):
+                    row = list(rng.choice([self.r1, self.r2, self.r3]))
+                    row[0], row[1], row[4], row[5] = chrom, str(pos), str(pos), str(pos)
+                    row[9] = 'RCV%09d' % rng.randint(0, 10**6)
+                    row[22] = str(rng.randint(0, 3))
+                    rows.append(row)
+        return ["\t".join(row)+"\n" for row in [self.header] + rows]
+
+    def test_group_by_allele_parallel(self):
+        rng = random.Random(0)
+        input_rows = self.make_rows(rng)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'clinvar_allele_trait_pairs.tsv.gz')
+            with TabixWriter(path) as f:
+                f.write("".join(input_rows))
+            shards = get_shards(read_index(path + '.tbi'), 3)
+            self.assertGreater(len(shards), 3)
+
+            expected = StringIO()
+            group_by_allele(iter(input_rows), expected)
+            outfile = StringIO()
+            group_by_allele_parallel(path, outfile, 3, tmp_dir=tmp_dir)
+            self.assertEqual(outfile.getvalue(), expected.getvalue())
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ['clinvar_allele_trait_pairs.tsv.gz',
+                                                           'clinvar_allele_trait_pairs.tsv.gz.tbi'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_group_unsorted(self):
+        rng = random.Random(1)
+        input_rows = self.make_rows(rng)
+        expected = StringIO()
+        group_by_allele(iter(input_rows[:1] + list(sort_lines(input_rows[1:]))), expected)
+        expected_rows = sorted(expected.getvalue().splitlines(True)[1:])
+
+        rows = input_rows[1:]
+        rng.shuffle(rows)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            # in memory, and spilled several times
+            for buffer_size in (2**30, 2**16):
+                outfile = StringIO()
+                group_unsorted(iter(input_rows[:1] + rows), outfile, buffer_size=buffer_size, tmp_dir=tmp_dir)
+                output_rows = outfile.getvalue().splitlines(True)
+                self.assertEqual(output_rows[0], input_rows[0])
+                self.assertEqual(sorted(output_rows[1:]), expected_rows)
+                self.assertEqual(os.listdir(tmp_dir), [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,68 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from bgzf import BgzfWriter, BgzfReader
+from grab_interesting_variations import grab_by_scanning, grab_with_index
+from index_clinvar_xml import index_clinvar_xml, get_index_path
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data')
+SAMPLE_XML = os.path.join(TEST_DATA_DIR, 'ClinVarFullRelease_sample.xml')
+
+
+class TestIndexClinvarXml(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.bgzf_path = os.path.join(self.tmp_dir, 'ClinVarFullRelease_sample.xml.bgz')
+        with open(SAMPLE_XML, 'rb') as f:
+            self.xml = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def build_index(self, block_size):
+        with BgzfWriter(self.bgzf_path) as writer, open(get_index_path(self.bgzf_path), 'w') as index_file:
+            return index_clinvar_xml(io.BytesIO(self.xml), writer, index_file, block_size=block_size)
+
+    def test_index(self):
+        for block_size in (7, 1000, 2**20):
+            self.assertEqual(self.build_index(block_size), 5)
+            with gzip.open(self.bgzf_path) as f:
+                self.assertEqual(f.read(), self.xml)
+
+            with open(get_index_path(self.bgzf_path)) as f:
+                rows = [line.rstrip('\n').split('\t') for line in f][1:]
+            self.assertEqual([row[:3] for row in rows], [
+                ['RCV000000001', '38266', '46822'],
+                ['RCV000000002', '7200', '22100,22101'],
+                ['RCV000000003', '9002,9004', '9003,9005'],
+                ['RCV000000004', '9600', '24600'],
+                ['RCV000000005', '9700', '24700'],
+            ])
+
+            with BgzfReader(self.bgzf_path) as reader:
+                for row in rows:
+                    reader.seek(int(row[3]))
+                    clinvar_set = reader.read(int(row[4]))
+                    self.assertTrue(clinvar_set.startswith(b'<ClinVarSet '))
+                    self.assertTrue(clinvar_set.endswith(b'</ClinVarSet>'))
+                    self.assertIn(('Acc="%s"' % row[0]).encode('ascii'), clinvar_set)
+
+    def test_grab_with_index(self):
+        self.build_index(2**20)
+        for interesting_variations in (set(['38266']), set(['7200', '9700']), set(['1'])):
+            expected = io.BytesIO()
+            with open(SAMPLE_XML, 'rb') as in_f:
+                grab_by_scanning(in_f, expected, interesting_variations)
+
+            out = io.BytesIO()
+            grab_with_index(self.bgzf_path, out, interesting_variations)
+            self.assertEqual(out.getvalue(), expected.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
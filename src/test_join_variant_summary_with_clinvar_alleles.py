@@ -0,0 +1,84 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from join_variant_summary_with_clinvar_alleles import FINAL_HEADER, join_variant_summary_with_clinvar_alleles
+from parse_clinvar_xml import HEADER
+
+VARIANT_SUMMARY_HEADER = ['#AlleleID', 'Type', 'Name', 'GeneID', 'GeneSymbol', 'ClinicalSignificance',
+                          'ClinSigSimple', 'LastEvaluated', 'RS# (dbSNP)', 'RCVaccession', 'Origin', 'Assembly',
+                          'Chromosome', 'Start', 'Stop', 'ReviewStatus', 'NumberSubmitters']
+
+
+def make_summary_row(allele_id, assembly, clinical_significance, review_status, last_evaluated):
+    values = dict((column, '-') for column in VARIANT_SUMMARY_HEADER)
+    values.update({'#AlleleID': allele_id, 'Assembly': assembly, 'ClinicalSignificance': clinical_significance,
+                   'ReviewStatus': review_status, 'LastEvaluated': last_evaluated})
+    return '\t'.join(values[column] for column in VARIANT_SUMMARY_HEADER) + '\n'
+
+
+def make_allele_row(allele_id, pos):
+    values = dict((column, '') for column in HEADER)
+    values.update({'chrom': '1', 'pos': str(pos), 'ref': 'A', 'alt': 'G', 'allele_id': allele_id,
+                   'clinical_significance': 'Pathogenic', 'review_status': 'no assertion provided',
+                   'last_evaluated': 'Jan 01, 2000', 'pathogenic': '1', 'benign': '0'})
+    return values
+
+
+class TestJoinVariantSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.variant_summary_table = os.path.join(self.tmp_dir, 'variant_summary.txt.gz')
+        with gzip.open(self.variant_summary_table, 'wb') as f:
+            f.write(('\t'.join(VARIANT_SUMMARY_HEADER) + '\n' + ''.join([
+                make_summary_row('15041', 'GRCh37', 'Pathogenic', 'criteria provided, single submitter', 'Jun 29, 2015'),
+                make_summary_row('15041', 'GRCh38', 'Pathogenic', 'criteria provided, single submitter', 'Jun 29, 2015'),
+                # only in GRCh38
+                make_summary_row('15042', 'GRCh38', 'Benign', 'reviewed by expert panel', '-'),
+                # twice in GRCh37 with the same values, eg. in the PARs
+                make_summary_row('15043', 'GRCh37', 'Conflicting interpretations of pathogenicity',
+                                 'criteria provided, conflicting interpretations', 'Mar 01, 2017'),
+                make_summary_row('15043', 'GRCh37', 'Conflicting interpretations of pathogenicity',
+                                 'criteria provided, conflicting interpretations', 'Mar 01, 2017'),
+                # twice in GRCh37 with different values
+                make_summary_row('15044', 'GRCh37', 'Benign', 'practice guideline', '-'),
+                make_summary_row('15044', 'GRCh37', 'Likely benign', 'an unknown review status', '-'),
+            ])).encode('ascii'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_join(self):
+        alleles = [make_allele_row(allele_id, 1000 + i)
+                   for i, allele_id in enumerate(['15044', '15041', '15042', '15043', '15041;15043', '99999'])]
+        alleles_table = ''.join('\t'.join(row[column] for column in HEADER) + '\n' for row in [
+            dict((column, column) for column in HEADER)] + alleles)
+
+        outfile = io.BytesIO()
+        rows = join_variant_summary_with_clinvar_alleles(self.variant_summary_table,
+                                                         io.BytesIO(alleles_table.encode('ascii')), outfile, 'GRCh37')
+        self.assertEqual(rows, 4)
+
+        lines = outfile.getvalue().decode('ascii').splitlines()
+        self.assertEqual(lines[0].split('\t'), FINAL_HEADER)
+        output = [dict(zip(FINAL_HEADER, line.split('\t'))) for line in lines[1:]]
+        self.assertEqual([(row['allele_id'], row['pos'], row['clinical_significance'], row['review_status'],
+                           row['last_evaluated'], row['gold_stars'], row['conflicted']) for row in output], [
+            ('15044', '1000', 'Benign', 'practice guideline', '-', '4', '0'),
+            ('15044', '1000', 'Likely benign', 'an unknown review status', '-', '', '0'),
+            ('15041', '1001', 'Pathogenic', 'criteria provided, single submitter', 'Jun 29, 2015', '1', '0'),
+            ('15043', '1003', 'Conflicting interpretations of pathogenicity',
+             'criteria provided, conflicting interpretations', 'Mar 01, 2017', '1', '1'),
+        ])
+        # the other columns are the same as in the alleles table
+        for row in output:
+            self.assertEqual(row['pathogenic'], '1')
+            self.assertEqual(row['ref'], 'A')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import random
+import unittest
+from collections import defaultdict
+
+from normalize_variants import (ReferenceCache, normalize, normalize_lines, RefEqualsAltError, WrongRefError,
+                                InvalidNucleotideSequenceError)
+
+
+class Fasta(object):
+    """Reference genome in memory, with the fetch method of pysam.FastaFile"""
+
+    def __init__(self, sequences):
+        self.sequences = sequences
+        self.fetches = 0
+
+    def fetch(self, chrom, start, end):
+        self.fetches += 1
+        if chrom not in self.sequences:
+            raise KeyError("sequence '%s' not present" % chrom)
+        return self.sequences[chrom][start:end]
+
+
+#                  1234567890123456789
+REFERENCE = {'1': 'GATTACACACAGTTTTCGA', '2': 'acgtacgt'}
+
+
+class TestNormalize(unittest.TestCase):
+
+    def setUp(self):
+        self.reference = ReferenceCache(Fasta(REFERENCE), window_size=8)
+
+    def test_normalize(self):
+        for variant, expected in [
+            (('1', 5, 'A', 'G'), ('1', 5, 'A', 'G')),  # SNV
+            (('1', 8, 'CA', '-'), ('1', 4, 'TAC', 'T')),  # deletion in a repeat is moved left
+            (('1', 11, 'A', 'ACA'), ('1', 4, 'T', 'TAC')),  # so is an insertion
+            (('1', 13, 'TTTTC', 'TTTC'), ('1', 12, 'GT', 'G')),
+            (('1', 5, 'ACAC', 'GCAC'), ('1', 5, 'A', 'G')),  # shared suffix trimmed
+            (('1', 5, 'ACA', 'AGA'), ('1', 6, 'C', 'G')),  # shared prefix trimmed
+            (('1', 1, 'GA', 'A'), ('1', 1, 'GA', 'A')),  # can't be extended before the start of the chromosome
+            (('2', 8, 't', 'tacgt'), ('2', 1, 'A', 'ACGTA')),  # lower case, moved left to the start
+        ]:
+            self.assertEqual(normalize(self.reference, *variant), expected)
+
+    def test_errors(self):
+        self.assertRaises(RefEqualsAltError, normalize, self.reference, '1', 5, 'ACA', 'ACA')
+        self.assertRaises(WrongRefError, normalize, self.reference, '1', 5, 'T', 'G')
+        self.assertRaises(WrongRefError, normalize, self.reference, '3', 5, 'T', 'G')
+        self.assertRaises(InvalidNucleotideSequenceError, normalize, self.reference, '1', 5, 'A', 'R')
+
+    def test_normalize_lines(self):
+        rng = random.Random(0)
+        sequence = ''.join(rng.choice('ACGT') for _ in range(5000))
+        # repeats to left-align in
+        sequence = sequence[:1000] + 'CAG' * 30 + sequence[1090:2000] + 'T' * 50 + sequence[2050:]
+        fasta = Fasta({'1': sequence, '2': sequence[::-1], 'X': sequence[1000:]})
+        lines = []
+        for i in range(2000):
+            chrom = rng.choice(['1', '2', 'X'])
+            pos = rng.randint(2, len(fasta.sequences[chrom]) - 20)
+            ref = fasta.sequences[chrom][pos - 1:pos - 1 + rng.randint(1, 6)]
+            alt = rng.choice([ref[0], ref + 'CAG', ref[0] + 'T', rng.choice('ACGT'), 'N'])
+            lines.append('\t'.join([chrom, str(pos), ref, alt, 'RCV%07d' % i]) + '\n')
+        wrong_ref = 'C' if fasta.sequences['2'][99] == 'A' else 'A'
+        lines.append('2\t100\t%s\tG\tRCV9999999\n' % wrong_ref)
+        column_names = ['chrom', 'pos', 'ref', 'alt', 'rcv']
+
+        dropped_counter = defaultdict(int)
+        expected = list(normalize_lines(lines, column_names, ReferenceCache(fasta, window_size=0), batch_size=1,
+                                        dropped_counter=dropped_counter))
+        self.assertEqual(len(expected) + sum(dropped_counter.values()), len(lines))
+        self.assertGreater(dropped_counter['RefEqualsAltError'], 0)
+        self.assertEqual(dropped_counter['WrongRefError'], 1)
+
+        # reading the reference in windows and batching rows by chromosome doesn't change the output
+        fasta.fetches = 0
+        reference = ReferenceCache(fasta, window_size=2**12)
+        self.assertEqual(sorted(normalize_lines(lines, column_names, reference, batch_size=500)), sorted(expected))
+        self.assertLess(fasta.fetches, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import gzip
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from benchmark_parse_clinvar_xml import run_benchmark, compare_results
+from benchmark_pmid_extraction import COMMENT_SAMPLES, legacy_extract_comment_pmids
+from clinvar_set_cache import ClinVarSetCache, read_changed_rcvs
+from distutils import spawn
+from parse_clinvar_xml import parse_clinvar_tree, extract_comment_pmids, get_handle, BackgroundReader, ClinVarSetNodes
+from synthetic_clinvar_xml import generate_clinvar_xml
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data')
+SAMPLE_XML = os.path.join(TEST_DATA_DIR, 'ClinVarFullRelease_sample.xml')
+
+
+def read_expected(table_name, genome_build):
+    with open(os.path.join(TEST_DATA_DIR, 'clinvar_table_raw.%s.%s.tsv' % (table_name, genome_build)), 'rb') as f:
+        return f.read()
+
+
+class TestParseClinvarTree(unittest.TestCase):
+
+    def parse(self, genome_build, **kwargs):
+        dest = io.BytesIO()
+        multi = io.BytesIO()
+        with open(SAMPLE_XML, 'rb') as handle:
+            parse_clinvar_tree(handle, dest=dest, multi=multi, verbose=False, genome_build=genome_build, **kwargs)
+        return dest.getvalue(), multi.getvalue()
+
+    def test_serial(self):
+        for genome_build in ('GRCh37', 'GRCh38'):
+            single, multi = self.parse(genome_build)
+            self.assertEqual(single, read_expected('single', genome_build))
+            self.assertEqual(multi, read_expected('multi', genome_build))
+
+    def test_parallel(self):
+        # use a tiny chunk size so the release gets split into many chunks
+        for chunk_size in (64, 1000, 2**20):
+            for genome_build in ('GRCh37', 'GRCh38'):
+                single, multi = self.parse(genome_build, processes=3, chunk_size=chunk_size)
+                self.assertEqual(single, read_expected('single', genome_build))
+                self.assertEqual(multi, read_expected('multi', genome_build))
+
+    def test_multiple_genome_builds(self):
+        genome_builds = ['GRCh37', 'GRCh38']
+        for processes in (1, 2):
+            dest = dict((genome_build, io.BytesIO()) for genome_build in genome_builds)
+            multi = dict((genome_build, io.BytesIO()) for genome_build in genome_builds)
+            with open(SAMPLE_XML, 'rb') as handle:
+                parse_clinvar_tree(handle, dest=dest, multi=multi, verbose=False, genome_build=genome_builds,
+                                   processes=processes, chunk_size=1000)
+            for genome_build in genome_builds:
+                self.assertEqual(dest[genome_build].getvalue(), read_expected('single', genome_build))
+                self.assertEqual(multi[genome_build].getvalue(), read_expected('multi', genome_build))
+
+    def test_streaming(self):
+        for processes in (1, 2):
+            for genome_build in ('GRCh37', 'GRCh38'):
+                single, multi = self.parse(genome_build, processes=processes, chunk_size=1000, streaming=True)
+                self.assertEqual(single, read_expected('single', genome_build))
+                self.assertEqual(multi, read_expected('multi', genome_build))
+
+    def test_buffer_size(self):
+        for buffer_size in (1, 1000):
+            single, multi = self.parse('GRCh37', buffer_size=buffer_size)
+            self.assertEqual(single, read_expected('single', 'GRCh37'))
+            self.assertEqual(multi, read_expected('multi', 'GRCh37'))
+
+    def test_stats(self):
+        with open(SAMPLE_XML, 'rb') as handle:
+            stats = parse_clinvar_tree(handle, dest=io.BytesIO(), multi=io.BytesIO(), verbose=False,
+                                       streaming=True)
+        self.assertEqual(stats['clinvar_sets'], 5)
+        self.assertEqual(stats['rows'], len(read_expected('single', 'GRCh37').splitlines()) - 1 +
+                         len(read_expected('multi', 'GRCh37').splitlines()) - 1)
+
+
+class TestIncrementalParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def parse(self, xml, processes=1, use_cache=True):
+        cache = ClinVarSetCache(os.path.join(self.cache_dir, 'clinvar_sets.sqlite'), ['GRCh37'], 'test') \
+            if use_cache else None
+        dest = io.BytesIO()
+        multi = io.BytesIO()
+        stats = parse_clinvar_tree(io.BytesIO(xml), dest=dest, multi=multi, verbose=False, processes=processes,
+                                   chunk_size=1000, cache=cache)
+        return dest.getvalue(), multi.getvalue(), stats, cache
+
+    def test_incremental(self):
+        with open(SAMPLE_XML, 'rb') as f:
+            xml = f.read()
+
+        # the next release: RCV000000005 changed, and RCV000000003 was removed
+        next_xml = xml.replace(b'DateLastUpdated="2017-03-01"', b'DateLastUpdated="2017-09-01"')
+        next_xml = re.sub(br'<ClinVarSet ID="5000003">.*?</ClinVarSet>', b'', next_xml, flags=re.DOTALL)
+        expected_single, expected_multi, _, _ = self.parse(next_xml, use_cache=False)
+
+        for processes in (1, 2):
+            single, multi, stats, first_cache = self.parse(xml, processes=processes)
+            self.assertEqual(single, read_expected('single', 'GRCh37'))
+            self.assertEqual(multi, read_expected('multi', 'GRCh37'))
+            self.assertEqual(first_cache.previous_generation, None)
+
+            single, multi, stats, cache = self.parse(next_xml, processes=processes)
+            self.assertEqual(single, expected_single)
+            self.assertEqual(multi, expected_multi)
+            self.assertEqual(stats['clinvar_sets'], 4)
+            self.assertEqual(stats['cached_clinvar_sets'], 3)
+            self.assertEqual(cache.changed_rcvs, ['RCV000000003', 'RCV000000005'])
+            self.assertEqual(cache.previous_generation, first_cache.generation)
+
+            shutil.rmtree(self.cache_dir)
+            os.mkdir(self.cache_dir)
+
+    def test_changed_rcvs_generations(self):
+        with open(SAMPLE_XML, 'rb') as f:
+            xml = f.read()
+        first_path, second_path, third_path = [os.path.join(self.cache_dir, 'changed_rcvs.%d.txt' % i)
+                                               for i in (1, 2, 3)]
+        for path in (first_path, second_path, third_path):
+            _, _, _, cache = self.parse(xml)
+            cache.write_changed_rcvs(path)
+
+        # every RCV is new in the first run, and none changed after that
+        self.assertEqual(read_changed_rcvs(first_path), set(['RCV000000001', 'RCV000000002', 'RCV000000003',
+                                                             'RCV000000004', 'RCV000000005']))
+        self.assertEqual(read_changed_rcvs(second_path), set())
+        # the changes are only used if the table was made in the run before, whose changed RCVs file it's stamped with
+        self.assertEqual(read_changed_rcvs(second_path, first_path), set())
+        self.assertEqual(read_changed_rcvs(third_path, second_path), set())
+        self.assertEqual(read_changed_rcvs(third_path, first_path), None)
+        self.assertEqual(read_changed_rcvs(first_path, first_path), None)
+        self.assertEqual(read_changed_rcvs(second_path, os.path.join(self.cache_dir, 'missing')), None)
+
+        # and with the same version of the normalizer and reference genome, from the stamp's second line
+        stamp_path = os.path.join(self.cache_dir, 'table.generation')
+        with open(stamp_path, 'w') as f:
+            with open(second_path) as changed_rcvs:
+                f.write(changed_rcvs.readline() + '#version\tabc\n')
+        self.assertEqual(read_changed_rcvs(third_path, stamp_path, 'abc'), set())
+        self.assertEqual(read_changed_rcvs(third_path, stamp_path), set())
+        self.assertEqual(read_changed_rcvs(third_path, stamp_path, 'abd'), None)
+        self.assertEqual(read_changed_rcvs(third_path, second_path, 'abc'), None)
+
+
+class TestGetHandle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_decompression_modes(self):
+        with open(SAMPLE_XML, 'rb') as f:
+            xml = f.read()
+
+        # a multi-member gzip file, like the BGZF files written by bgzip
+        path = os.path.join(self.tmp_dir, 'ClinVarFullRelease_sample.xml.gz')
+        for start in range(0, len(xml), 10000):
+            with gzip.open(path, 'ab') as f:
+                f.write(xml[start:start + 10000])
+
+        modes = ['inline', 'thread', 'auto'] + (['pigz'] if spawn.find_executable('pigz') else [])
+        for mode in modes:
+            handle = get_handle(path, mode)
+            self.assertEqual(b''.join(iter(lambda: handle.read(1000), b'')), xml)
+            handle.close()
+
+            handle = get_handle(path, mode)
+            single = io.BytesIO()
+            parse_clinvar_tree(handle, dest=single, multi=io.BytesIO(), verbose=False)
+            handle.close()
+            self.assertEqual(single.getvalue(), read_expected('single', 'GRCh37'))
+
+    def test_background_reader_errors(self):
+        def blocks():
+            yield b'abc'
+            raise IOError('truncated')
+
+        handle = BackgroundReader(blocks())
+        self.assertEqual(handle.read(2), b'ab')
+        self.assertEqual(handle.read(1), b'c')
+        self.assertRaises(IOError, handle.read, 1)
+        self.assertEqual(handle.read(), b'')
+
+
+class TestExtractCommentPmids(unittest.TestCase):
+
+    def test_same_as_legacy_loop(self):
+        texts = COMMENT_SAMPLES + [
+            u"No citations here.",
+            u"PMID 123",
+            u"PMID: 123,456,789.",
+            u"PMID: 123, 456, 789.",
+            u"PMID123 456.",
+            u"PMIDs:12 and 34\nand 56 on the next line.",
+            u"PubMed1a2b3c",
+            u"Reported by Sj\u00f6gren et al. (PubMed: 24033266; PubMed: 21228398)",
+            u"PMID: 1 PMID: 2 PMID: 3 ",
+        ]
+        for text in texts:
+            self.assertEqual(extract_comment_pmids(text), legacy_extract_comment_pmids(text), text)
+
+        self.assertEqual(extract_comment_pmids(u"PMID: 123, 456."), [u'123', u'456'])
+        self.assertEqual(extract_comment_pmids(u"PMID: 123,456."), [u'123'])
+
+
+class TestClinVarSetNodes(unittest.TestCase):
+    """Check that the single-walk node collection matches the .findall(...) queries it replaces"""
+
+    def test_nodes_match_findall(self):
+        for elem in ET.parse(SAMPLE_XML).getroot().findall('ClinVarSet'):
+            nodes = ClinVarSetNodes(elem)
+
+            self.assertEqual(nodes.reference_clinvar_assertions, elem.findall('.//ReferenceClinVarAssertion'))
+            self.assertEqual([m.node for m in nodes.measuresets],
+                             elem.findall('.//ReferenceClinVarAssertion')[0].findall('.//MeasureSet'))
+            self.assertEqual(nodes.scv_accessions, elem.findall('.//ClinVarAssertion/ClinVarAccession'))
+            self.assertEqual(nodes.pubmed_ids, [
+                id_node.text for citation in elem.findall('.//Citation') for id_node in citation.findall('.//ID')
+                if id_node.attrib.get('Source') == 'PubMed'])
+            self.assertEqual(nodes.comments, elem.findall('.//Comment'))
+            self.assertEqual(nodes.submitters, elem.findall('.//ClinVarSubmissionID'))
+
+            rcv_clinical_significance = elem.find('.//ReferenceClinVarAssertion/ClinicalSignificance')
+            self.assertEqual(nodes.rcv_clinical_significance, rcv_clinical_significance)
+            self.assertEqual(nodes.rcv_review_status, rcv_clinical_significance.find('.//ReviewStatus'))
+            self.assertEqual(nodes.rcv_description, rcv_clinical_significance.find('.//Description'))
+            self.assertEqual(nodes.scv_clinical_significances, elem.findall('.//ClinVarAssertion/ClinicalSignificance'))
+            self.assertEqual(nodes.scv_review_statuses,
+                             elem.findall('.//ClinVarAssertion/ClinicalSignificance/ReviewStatus'))
+            self.assertEqual(nodes.scv_descriptions,
+                             elem.findall('.//ClinVarAssertion/ClinicalSignificance/Description'))
+
+            traitsets = elem.findall('.//TraitSet')
+            self.assertEqual(nodes.trait_names, [n for t in traitsets for n in t.findall('.//Name/ElementValue')])
+            self.assertEqual(nodes.trait_attributes,
+                             [n for t in traitsets for n in t.findall('.//AttributeSet/Attribute')])
+            self.assertEqual(nodes.trait_xrefs, [n for t in traitsets for n in t.findall('.//XRef')])
+            self.assertEqual(nodes.origins, elem.findall('.//ReferenceClinVarAssertion/ObservedIn/Sample/Origin'))
+
+            for measureset in nodes.measuresets:
+                self.assertEqual(measureset.name, measureset.node.find('.//Name/ElementValue'))
+                self.assertEqual([m.node for m in measureset.measures], measureset.node.findall('.//Measure'))
+                for measure in measureset.measures:
+                    self.assertEqual(measure.sequence_locations, measure.node.findall('.//SequenceLocation'))
+                    self.assertEqual([r.node for r in measure.measure_relationships],
+                                     measure.node.findall('.//MeasureRelationship'))
+                    for relationship in measure.measure_relationships:
+                        self.assertEqual(relationship.symbol, relationship.node.find('.//Symbol/ElementValue'))
+                        self.assertEqual(relationship.sequence_locations,
+                                         relationship.node.findall('.//SequenceLocation'))
+                    self.assertEqual([a.node for a in measure.attributesets], measure.node.findall('./AttributeSet'))
+                    for attributeset in measure.attributesets:
+                        self.assertEqual(attributeset.attribute, attributeset.node.find('./Attribute'))
+                        self.assertEqual(attributeset.xrefs, attributeset.node.findall('.//XRef'))
+
+
+class TestSyntheticClinVarXml(unittest.TestCase):
+
+    def test_parse_modes_agree(self):
+        xml = io.BytesIO()
+        generate_clinvar_xml(xml, 200, seed=1, multi_fraction=0.3, scvs=3, comment_length=300, trait_sets=2)
+        outputs = []
+        for kwargs in ({}, {'processes': 2, 'chunk_size': 10000}, {'streaming': True}):
+            dest = io.BytesIO()
+            multi = io.BytesIO()
+            stats = parse_clinvar_tree(io.BytesIO(xml.getvalue()), dest=dest, multi=multi, verbose=False, **kwargs)
+            self.assertEqual(stats['clinvar_sets'], 200)
+            outputs.append((dest.getvalue(), multi.getvalue()))
+        self.assertGreater(len(outputs[0][0].splitlines()), 100)
+        self.assertGreater(len(outputs[0][1].splitlines()), 50)
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[2], outputs[0])
+
+    def test_benchmark(self):
+        results = run_benchmark(20, scenarios=['single', 'multi'], repeat=1)
+        self.assertEqual(sorted(results['scenarios']), ['multi', 'single'])
+        for result in results['scenarios'].values():
+            self.assertEqual(result['clinvar_sets'], 20)
+            self.assertGreater(result['records_per_sec'], 0)
+            self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertEqual(compare_results(results, results), [])
+        slower = {'scenarios': dict((name, dict(result, us_per_clinvar_set=result['us_per_clinvar_set'] * 2))
+                                    for name, result in results['scenarios'].items())}
+        self.assertEqual(len(compare_results(slower, results)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pipeline_runner import Pipeline, PipelineError, Stage, count_rows, find_local_imports, format_report_summary
+from tabix_writer import TabixWriter
+from stage_cache import StageCache
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def pipeline(self, **kwargs):
+        return Pipeline(log=self.log.append, **kwargs)
+
+    def read(self, name):
+        with open(self.path(name)) as f:
+            return f.read()
+
+    def test_stage_tokens(self):
+        stage = Stage("cat <(gunzip -c IN:a.gz) IN:b | bgzip -c > OUT:c.gz", input_filenames=['d'],
+                      output_filenames=['c.gz.tbi'])
+        self.assertEqual(stage.command, "cat <(gunzip -c a.gz) b | bgzip -c > c.gz")
+        self.assertEqual(stage.input_filenames, ['a.gz', 'b', 'd'])
+        self.assertEqual(stage.output_filenames, ['c.gz', 'c.gz.tbi'])
+
+    def test_local_imports(self):
+        modules = {
+            'script.py': "import os, helper\n\ndef main():\n    from optional import f\n",
+            'helper.py': "from __future__ import print_function\nimport gzip\nfrom shared.sub import g\n",
+            'optional.py': "import helper\n",
+            'shared.py': "import script\n",
+            'unused.py': "",
+        }
+        for name, source in modules.items():
+            with open(self.path(name), 'w') as f:
+                f.write(source)
+        self.assertEqual(find_local_imports(self.path('script.py')),
+                         [self.path('helper.py'), self.path('optional.py'), self.path('shared.py')])
+
+        stage = Stage("python IN:%s IN:%s > OUT:%s" % (self.path('script.py'), self.path('data'), self.path('out')),
+                      input_filenames=[self.path('shared.py')])
+        self.assertEqual(stage.input_filenames, [self.path('script.py'), self.path('data'), self.path('shared.py'),
+                                                 self.path('helper.py'), self.path('optional.py')])
+
+        # a change to an imported module makes the stage out of date
+        for name in ('data', 'out'):
+            with open(self.path(name), 'w') as f:
+                f.write('\n')
+        self.assertTrue(stage.is_up_to_date())
+        os.utime(self.path('helper.py'), (time.time() + 10, time.time() + 10))
+        self.assertFalse(stage.is_up_to_date())
+
+    def test_dependency_order_and_skipping(self):
+        def add_stages(pipeline):
+            # added in reverse order of their dependencies
+            pipeline.add("cat IN:%s IN:%s > OUT:%s" % (self.path('b'), self.path('c'), self.path('d')))
+            pipeline.add("sleep 0.2; tr a-z A-Z < IN:%s > OUT:%s" % (self.path('a'), self.path('b')))
+            pipeline.add("rev < IN:%s > OUT:%s" % (self.path('a'), self.path('c')))
+            pipeline.add("echo checked")  # no outputs, so always run
+
+        with open(self.path('a'), 'w') as f:
+            f.write('abc\n')
+        pipeline = self.pipeline(max_parallel=3)
+        add_stages(pipeline)
+        pipeline.run()
+        self.assertEqual(self.read('d'), 'ABC\ncba\n')
+        # the independent stages ran at the same time
+        started = [line for line in self.log if line.startswith('Running')]
+        self.assertEqual(len(started), 4)
+        self.assertTrue(started[-1].endswith('cat %s %s > %s' % (self.path('b'), self.path('c'), self.path('d'))))
+
+        # nothing changed, so only the stage without outputs is run again
+        del self.log[:]
+        pipeline = self.pipeline(max_parallel=3)
+        add_stages(pipeline)
+        pipeline.run()
+        self.assertEqual([line for line in self.log if line.startswith('Running')], ['Running: echo checked'])
+
+        # a changed input is propagated
+        time.sleep(0.01)
+        with open(self.path('a'), 'w') as f:
+            f.write('xyz\n')
+        pipeline = self.pipeline(max_parallel=1)
+        add_stages(pipeline)
+        pipeline.run()
+        self.assertEqual(self.read('d'), 'XYZ\nzyx\n')
+
+    def test_parallel_and_memory_limit(self):
+        def run(name, **kwargs):
+            pipeline = self.pipeline(**kwargs)
+            for i in range(4):
+                pipeline.add("sleep 0.3; touch OUT:%s" % self.path('%s.%d' % (name, i)), memory=100)
+            start = time.time()
+            pipeline.run()
+            return time.time() - start
+
+        self.assertLess(run('parallel', max_parallel=4), 0.9)
+        self.assertGreater(run('memory', max_parallel=4, max_memory=200), 0.6)  # at most 2 at a time
+        self.assertGreater(run('serial', max_parallel=1), 1.2)
+
+    def test_report(self):
+        pipeline = self.pipeline()
+        pipeline.add("printf 'a\\tb\\n1\\t2\\n3\\t4\\n' > OUT:%s" % self.path('table.tsv'))
+        pipeline.add("python -c 'x = bytearray(50 * 2**20); import time; time.sleep(0.2)'; gzip -c IN:%s > OUT:%s" % (
+            self.path('table.tsv'), self.path('table.tsv.gz')))
+        pipeline.add("exit 1")
+        self.assertRaises(PipelineError, pipeline.run)
+        # the rows are only counted for the report, after the run
+        self.assertNotIn('output_rows', pipeline.stages[0].stats)
+
+        report = pipeline.get_report()
+        first, second, third = report['stages']
+        self.assertEqual([first['status'], second['status'], third['status']], ['ran', 'ran', 'failed'])
+        self.assertEqual(first['output_rows'], {self.path('table.tsv'): 2})
+        self.assertEqual(second['output_rows'], {self.path('table.tsv.gz'): 2})
+        self.assertEqual(second['input_bytes'], 12)
+        self.assertGreater(second['wall_seconds'], 0.2)
+        self.assertGreater(second['peak_rss_mb'], 50)
+        self.assertGreater(second['user_seconds'] + second['system_seconds'], 0)
+        self.assertIn('exit 1', format_report_summary(report))
+
+    def test_count_rows(self):
+        with gzip.open(self.path('a.vcf.gz'), 'wb') as f:
+            f.write(b'##fileformat=VCFv4.2\n#CHROM\tPOS\n1\t100\n' + b'1\t200\n' * 10**6)
+        self.assertEqual(count_rows(self.path('a.vcf.gz')), 10**6 + 1)
+        with open(self.path('a.txt'), 'w') as f:
+            f.write('a\n')
+        self.assertIsNone(count_rows(self.path('a.txt')))
+
+        # tables with a tabix index are counted from the index, without reading them
+        with TabixWriter(self.path('b.tsv.gz')) as f:
+            f.write(b'chrom\tpos\n' + b''.join(b'%d\t%d\n' % (chrom, pos) for chrom in (1, 2) for pos in range(1, 1001)))
+        self.assertEqual(count_rows(self.path('b.tsv.gz'), max_size=0), 2000)
+
+    def test_failure(self):
+        pipeline = self.pipeline(max_parallel=2)
+        pipeline.add("echo partial > OUT:%s; exit 3" % self.path('a'))
+        pipeline.add("cat IN:%s > OUT:%s" % (self.path('a'), self.path('b')))
+        self.assertRaises(PipelineError, pipeline.run)
+        self.assertFalse(os.path.exists(self.path('a')))  # the failed stage's output was removed
+        self.assertFalse(os.path.exists(self.path('b')))  # and the stage that depends on it wasn't run
+
+    def test_duplicate_stages(self):
+        pipeline = self.pipeline()
+        stage = pipeline.add("echo 1 > OUT:%s" % self.path('a'))
+        self.assertIs(pipeline.add("echo 1 > OUT:%s" % self.path('a')), stage)
+        self.assertRaises(PipelineError, pipeline.add, "echo 2 > OUT:%s" % self.path('a'))
+
+        pipeline.add("cat IN:%s > OUT:%s" % (self.path('b'), self.path('c')))
+        pipeline.add("cat IN:%s > OUT:%s" % (self.path('c'), self.path('b')))
+        self.assertRaises(PipelineError, pipeline.run)
+
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.log = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def write(self, name, content):
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+        # make sure it's newer than the outputs of earlier runs
+        if os.path.exists(self.path(name + '.out')):
+            mtime = os.path.getmtime(self.path(name + '.out')) + 10
+            os.utime(self.path(name), (mtime, mtime))
+
+    def run_pipeline(self, max_size=2**20):
+        del self.log[:]
+        pipeline = Pipeline(stage_cache=StageCache(self.cache_dir, max_size=max_size), log=self.log.append)
+        for name in ('a', 'b'):
+            pipeline.add("rev < IN:%s > OUT:%s.out" % (self.path(name), self.path(name)))
+        pipeline.run()
+        return sorted(line.split(':')[0] for line in self.log)
+
+    def test_restore(self):
+        self.write('a', 'abc\n')
+        self.write('b', 'xyz\n')
+        self.assertEqual(self.run_pipeline(), ['Running', 'Running'])
+
+        # touching an input makes the stage out of date, but the outputs are restored from the cache
+        self.write('a', 'abc\n')
+        os.remove(self.path('a.out'))
+        self.assertEqual(self.run_pipeline(), ['Restored outputs from the stage cache', 'Skipping, outputs are up to date'])
+        with open(self.path('a.out')) as f:
+            self.assertEqual(f.read(), 'cba\n')
+
+        # a changed input is run again
+        self.write('a', 'abd\n')
+        self.assertEqual(self.run_pipeline(), ['Running', 'Skipping, outputs are up to date'])
+
+    def test_eviction(self):
+        self.write('a', 'abc\n')
+        self.write('b', 'xyz\n')
+        # only room for one stage's output, so a's is removed when b's is added
+        self.run_pipeline(max_size=6)
+        self.assertEqual(len([name for name in os.listdir(self.cache_dir) if len(name) == 40]), 1)
+        self.write('a', 'abc\n')
+        self.assertEqual(self.run_pipeline(max_size=6), ['Running', 'Skipping, outputs are up to date'])
+        self.write('a', 'abc\n')
+        self.write('b', 'xyz\n')
+        self.assertEqual(self.run_pipeline(max_size=6), ['Restored outputs from the stage cache', 'Running'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from select_rows_by_rcv import get_rcv_filters, select_rows_by_rcv
+
+HEADER = 'chrom\tpos\trcv\n'
+
+
+class TestSelectRowsByRcv(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # the previous run's normalized table: RCV2 has changed since then, and RCV3 was removed from the release
+        self.previous_table = self.write('previous.tsv', HEADER + '1\t10\tRCV1\n1\t20\tRCV2\n1\t30\tRCV3\n')
+        # the new release: RCV2 changed, and RCV4 is new
+        self.raw_table = self.write('raw.tsv', HEADER + '1\t10\tRCV1\n1\t21\tRCV2\n1\t40\tRCV4\n')
+        # changed since generation A of the parse cache, as written by parse_clinvar_xml.py --changed-rcvs
+        self.changed_rcvs = self.write('changed_rcvs.txt', '#generation\tA\tB\nRCV2\nRCV3\nRCV4\n')
+        # the stamp of the previous normalized table, as written by master.py
+        self.stamp = self.write('previous.tsv.generation', '#generation\t\tA\n#version\tv1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def select(self, path, write_header=True, **kwargs):
+        include, exclude = get_rcv_filters(**kwargs)
+        outfile = io.BytesIO() if bytes is str else io.StringIO()
+        with open(path) as infile:
+            select_rows_by_rcv(infile, outfile, include=include, exclude=exclude, write_header=write_header)
+        return [line.split('\t')[2] for line in outfile.getvalue().splitlines()]
+
+    def select_changed(self, **kwargs):
+        """The rows of the new release to normalize"""
+        return self.select(self.raw_table, rcvs=self.changed_rcvs, **kwargs)
+
+    def select_reused(self, **kwargs):
+        """The rows to take from the previous normalized table"""
+        return self.select(self.previous_table, write_header=False, rcvs_from_table=self.raw_table,
+                           exclude_rcvs=self.changed_rcvs, **kwargs)
+
+    def test_rcvs(self):
+        self.assertEqual(self.select_changed(), ['rcv', 'RCV2', 'RCV4'])
+        self.assertEqual(self.select_changed(table_generation=self.stamp, table_version='v1'), ['rcv', 'RCV2', 'RCV4'])
+
+    def test_exclude_rcvs(self):
+        self.assertEqual(self.select(self.previous_table, exclude_rcvs=self.changed_rcvs), ['rcv', 'RCV1'])
+
+    def test_rcvs_from_table(self):
+        # the rows of RCVs that were removed from the release are dropped
+        self.assertEqual(self.select(self.previous_table, rcvs_from_table=self.raw_table), ['rcv', 'RCV1', 'RCV2'])
+        self.assertEqual(self.select_reused(), ['RCV1'])
+        self.assertEqual(self.select_reused(table_generation=self.stamp, table_version='v1'), ['RCV1'])
+
+    def test_stale_table_generation(self):
+        # the previous table was made from another generation of the parse cache, with another normalizer or reference
+        # genome, or isn't stamped, so every RCV is normalized again and none are reused
+        stale_stamps = [(self.write('stale.generation', '#generation\tA\tC\n#version\tv1\n'), 'v1'),
+                        (self.stamp, 'v2'),
+                        (os.path.join(self.tmp_dir, 'missing.generation'), 'v1')]
+        for stamp, version in stale_stamps:
+            self.assertEqual(self.select_changed(table_generation=stamp, table_version=version),
+                             ['rcv', 'RCV1', 'RCV2', 'RCV4'])
+            self.assertEqual(self.select_reused(table_generation=stamp, table_version=version), [])
+
+        # changes from a parse without a usable previous cache can't be applied to any table
+        self.write('changed_rcvs.txt', '#generation\t\tB\nRCV1\nRCV2\nRCV4\n')
+        self.assertEqual(self.select_reused(table_generation=self.stamp, table_version='v1'), [])
+
+    def test_command_line(self):
+        output = subprocess.check_output([
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'select_rows_by_rcv.py'),
+            '-i', self.previous_table, '--rcvs-from-table', self.raw_table, '--exclude-rcvs', self.changed_rcvs,
+            '--table-generation', self.stamp, '--table-version', 'v1', '--no-header'])
+        self.assertEqual(output, b'1\t10\tRCV1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
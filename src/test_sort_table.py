@@ -0,0 +1,62 @@
+import io
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from sort_table import sort_table, genomic_sort_key
+
+# the sort commands that master.py used before sort_table.py, with MT after X and Y
+SORT_COMMAND = ("cat <(egrep -v '^[XYM]' {0} | sort -k1,1n -k2,2n -k3,3 -k4,4) "
+                "<(egrep '^[XY]' {0} | sort -k1,1 -k2,2n -k3,3 -k4,4) "
+                "<(egrep '^M' {0} | sort -k1,1 -k2,2n -k3,3 -k4,4)")
+
+
+class TestSortTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = random.Random(0)
+        self.lines = []
+        for i in range(3000):
+            chrom = rng.choice([str(c) for c in range(1, 23)] + ['X', 'Y', 'MT'])
+            pos = str(rng.randint(1, 200))
+            ref, alt = rng.choice(['A', 'C', 'AC', 'G']), rng.choice(['T', 'G', 'TTA'])
+            self.lines.append('\t'.join([chrom, pos, ref, alt, str(rng.randint(1, 5)), 'x']) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_as_sort_commands(self):
+        path = os.path.join(self.tmp_dir, 'unsorted.tsv')
+        with open(path, 'w') as f:
+            f.writelines(self.lines)
+        expected = subprocess.check_output(['bash', '-c', SORT_COMMAND.format(path)], env=dict(os.environ, LC_ALL='C'))
+        self.assertEqual(''.join(sorted(self.lines, key=genomic_sort_key)), expected.decode('ascii'))
+
+    def test_other_chromosomes_last(self):
+        lines = ['GL000192.1\t5\n', 'MT\t1\n', '10\t1\n', '2\t7\n', 'X\t3\n', '1\t9\n']
+        self.assertEqual(sorted(lines, key=genomic_sort_key),
+                         ['1\t9\n', '2\t7\n', '10\t1\n', 'X\t3\n', 'MT\t1\n', 'GL000192.1\t5\n'])
+
+    def test_x_y_mt_order(self):
+        self.assertLess(genomic_sort_key('22\t900\n'), genomic_sort_key('X\t1\n'))
+        self.assertLess(genomic_sort_key('X\t900\n'), genomic_sort_key('Y\t1\n'))
+        self.assertLess(genomic_sort_key('Y\t900\n'), genomic_sort_key('MT\t1\n'))
+        self.assertLess(genomic_sort_key('MT\t900\n'), genomic_sort_key('X_random\t1\n'))
+
+    def test_spill_and_merge(self):
+        expected = 'header\n' + ''.join(sorted(self.lines, key=genomic_sort_key))
+        for buffer_size, processes in ((2**30, 1), (10000, 1), (10000, 3)):
+            outfile = io.BytesIO()
+            counter = sort_table(iter(['header\n'] + self.lines), outfile, buffer_size=buffer_size,
+                                 processes=processes, tmp_dir=self.tmp_dir)
+            self.assertEqual(counter, len(self.lines))
+            self.assertEqual(outfile.getvalue(), expected)
+            self.assertEqual(os.listdir(self.tmp_dir), [])  # the runs were deleted
+
+
+if __name__ == '__main__':
+    unittest.main()
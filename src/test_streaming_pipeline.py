@@ -0,0 +1,107 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from bgzf import BgzfReader
+from group_by_allele import group_by_allele
+from join_variant_summary_with_clinvar_alleles import join_variant_summary_with_clinvar_alleles
+from parse_clinvar_xml import parse_clinvar_tree
+from sort_table import sort_lines
+from streaming_pipeline import RowCollector, read_variant_summary, write_tables
+from test_join_variant_summary_with_clinvar_alleles import VARIANT_SUMMARY_HEADER, make_summary_row
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data')
+SAMPLE_XML = os.path.join(TEST_DATA_DIR, 'ClinVarFullRelease_sample.xml')
+
+
+class TestRowCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_transform(self):
+        def transform(column_names, data):
+            if data['chrom'] == '13':
+                return None
+            data['ref'] = data['ref'].lower()
+            return data
+
+        # with a buffer small enough for each row to be spilled to its own sorted run
+        collectors = dict((table, (RowCollector(), RowCollector(transform, buffer_size=1, tmp_dir=self.tmp_dir)))
+                          for table in ('single', 'multi'))
+        for i in (0, 1):
+            with open(SAMPLE_XML, 'rb') as handle:
+                parse_clinvar_tree(handle, dest=collectors['single'][i], multi=collectors['multi'][i], verbose=False,
+                                   buffer_size=100)
+
+        for table, (collector, transformed) in collectors.items():
+            collector.close()
+            transformed.close()
+            with open(os.path.join(TEST_DATA_DIR, 'clinvar_table_raw.%s.GRCh37.tsv' % table), 'rb') as f:
+                expected_lines = f.read().splitlines(True)
+            self.assertEqual(collector.header, expected_lines[0])
+            self.assertEqual(collector.rows, len(expected_lines) - 1)
+            self.assertEqual(list(collector.sorted_lines()), list(sort_lines(expected_lines[1:])))
+
+            self.assertEqual(transformed.header, expected_lines[0])
+            kept = [line.split(b'\t') for line in expected_lines[1:] if not line.startswith(b'13\t')]
+            self.assertEqual(list(transformed.sorted_lines()),
+                             list(sort_lines(b'\t'.join(values[:2] + [values[2].lower()] + values[3:])
+                                             for values in kept)))
+            self.assertEqual(transformed.dropped, len(expected_lines) - 1 - len(kept))
+        # the sorted runs were removed once they were read
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_write_tables(self):
+        # the rows of both tables, for more than one allele
+        with open(os.path.join(TEST_DATA_DIR, 'clinvar_table_raw.single.GRCh37.tsv'), 'rb') as f:
+            raw_lines = f.read().splitlines(True)
+        with open(os.path.join(TEST_DATA_DIR, 'clinvar_table_raw.multi.GRCh37.tsv'), 'rb') as f:
+            raw_lines += f.read().splitlines(True)[1:]
+        allele_id_i = raw_lines[0].rstrip(b'\n').split(b'\t').index(b'allele_id')
+        allele_ids = sorted(set(line.split(b'\t')[allele_id_i] for line in raw_lines[1:]))
+        variant_summary_table = os.path.join(self.tmp_dir, 'variant_summary.txt')
+        with open(variant_summary_table, 'w') as f:
+            f.write('\t'.join(VARIANT_SUMMARY_HEADER) + '\n')
+            for allele_id in allele_ids[::2]:
+                f.write(make_summary_row(allele_id, 'GRCh37', 'Pathogenic', 'practice guideline', '-'))
+        summaries = read_variant_summary(variant_summary_table, 'GRCh37')
+
+        # the same rows made by the separate steps, in memory
+        sorted_lines = list(sort_lines(raw_lines[1:]))
+        grouped = io.BytesIO()
+        group_by_allele(iter(raw_lines[:1] + sorted_lines), grouped)
+        grouped.seek(0)
+        joined = io.BytesIO()
+        join_variant_summary_with_clinvar_alleles(variant_summary_table, grouped, joined, 'GRCh37')
+        joined_lines = joined.getvalue().splitlines(True)
+        expected_alleles = joined_lines[:1] + list(sort_lines(joined_lines[1:]))
+
+        collector = RowCollector(buffer_size=1, tmp_dir=self.tmp_dir)
+        collector.write(b''.join(raw_lines))
+        collector.close()
+        trait_pairs_path = os.path.join(self.tmp_dir, 'clinvar_allele_trait_pairs.tsv.gz')
+        alleles_path = os.path.join(self.tmp_dir, 'clinvar_alleles.tsv.gz')
+        rows = write_tables(collector, summaries, trait_pairs_path, alleles_path, buffer_size=1,
+                            tmp_dir=self.tmp_dir)
+        self.assertEqual(rows, len(expected_alleles) - 1)
+        for path, expected in ((trait_pairs_path, raw_lines[:1] + sorted_lines), (alleles_path, expected_alleles)):
+            with BgzfReader(path) as reader:
+                self.assertEqual(list(reader), expected)
+            self.assertTrue(os.path.isfile(path + '.tbi'))
+
+    def test_write_tables_empty(self):
+        collector = RowCollector(tmp_dir=self.tmp_dir)
+        collector.write(b'chrom\tpos\tref\talt\n')
+        collector.close()
+        self.assertRaises(ValueError, write_tables, collector, {}, os.path.join(self.tmp_dir, 'a.tsv.gz'),
+                          os.path.join(self.tmp_dir, 'b.tsv.gz'))
+
+
+if __name__ == '__main__':
+    unittest.main()
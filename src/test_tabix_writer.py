@@ -0,0 +1,142 @@
+import gzip
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+from bgzf import BgzfReader
+from tabix_writer import TabixWriter, reg2bin
+
+
+def read_index(path):
+    """Parses a .tbi file into (config, {chrom: (bins, linear)})"""
+    with gzip.open(path) as f:
+        data = f.read()
+    assert data[:4] == b'TBI\x01'
+    n_ref, fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack('<8i', data[4:36])
+    names = data[36:36 + l_nm].split(b'\0')[:n_ref]
+    offset = 36 + l_nm
+    sequences = {}
+    for name in names:
+        bins = {}
+        n_bin, = struct.unpack('<i', data[offset:offset + 4])
+        offset += 4
+        for _ in range(n_bin):
+            bin_number, n_chunk = struct.unpack('<Ii', data[offset:offset + 8])
+            offset += 8
+            bins[bin_number] = [struct.unpack('<QQ', data[offset + 16 * i:offset + 16 * (i + 1)])
+                                for i in range(n_chunk)]
+            offset += 16 * n_chunk
+        n_intv, = struct.unpack('<i', data[offset:offset + 4])
+        linear = struct.unpack('<%dQ' % n_intv, data[offset + 4:offset + 4 + 8 * n_intv])
+        offset += 4 + 8 * n_intv
+        sequences[name] = (bins, linear)
+    assert len(data) == offset + 8
+    return (fmt, col_seq, col_beg, col_end, chr(meta), skip), sequences
+
+
+def reg2bins(beg, end):
+    """The bins that can contain records overlapping the 0-based, half-open interval, as in the SAM spec"""
+    end -= 1
+    bins = [0]
+    for shift, first in ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)):
+        bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+    return bins
+
+
+def query(path, sequences, chrom, beg, end, is_vcf=False):
+    """Returns the lines that overlap the interval, read using only the index, like tabix does"""
+    bins, linear = sequences[chrom]
+    min_offset = linear[min(beg >> 14, len(linear) - 1)]
+    chunks = sorted(chunk for bin_number in reg2bins(beg, end) for chunk in bins.get(bin_number, [])
+                    if chunk[1] > min_offset)
+    lines = []
+    reader = BgzfReader(path)
+    for chunk_start, chunk_end in chunks:
+        reader.seek(chunk_start)
+        while reader.tell() < chunk_end:
+            line_start = reader.tell()
+            line = b''
+            while b'\n' not in line:
+                data = reader.read(1024)
+                line += data
+                if not data:
+                    break
+            line = line[:line.find(b'\n') + 1] or line
+            reader.seek(line_start)
+            reader.read(len(line))
+            fields = line.split(b'\t')
+            record_beg = int(fields[1]) - 1
+            record_end = record_beg + len(fields[3]) if is_vcf else record_beg + 1
+            if fields[0] == chrom and record_beg < end and record_end > beg and line not in lines:
+                lines.append(line)
+    return lines
+
+
+class TestTabixWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'table.vcf.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reg2bin(self):
+        self.assertEqual(reg2bin(0, 1), 4681)
+        self.assertEqual(reg2bin(2**14 - 1, 2**14 + 1), 585)
+        self.assertEqual(reg2bin(0, 2**29), 0)
+
+    def test_vcf(self):
+        rng = random.Random(0)
+        header = b'##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\n'
+        lines = []
+        for chrom, length in ((b'1', 3 * 10**6), (b'2', 10**5), (b'X', 10**6)):
+            for pos in sorted(rng.sample(range(1, length), 3000)):
+                # a few records span several 16kb windows of the linear index
+                ref = b'A' * (30000 if rng.random() < 0.01 else rng.choice([1, 1, 2, 50]))
+                lines.append(b'\t'.join([chrom, str(pos).encode('ascii'), b'.', ref, b'G']) + b'\n')
+
+        # written in pieces that don't line up with the lines
+        data = header + b''.join(lines)
+        with TabixWriter(self.path, preset='vcf', threads=3) as writer:
+            for start in range(0, len(data), 1000):
+                writer.write(data[start:start + 1000])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['table.vcf.gz', 'table.vcf.gz.tbi'])
+        with gzip.open(self.path) as f:
+            self.assertEqual(f.read(), data)
+
+        config, sequences = read_index(self.path + '.tbi')
+        self.assertEqual(config, (2, 1, 2, 0, '#', 0))
+        self.assertEqual(sorted(sequences), [b'1', b'2', b'X'])
+        for _ in range(50):
+            chrom = rng.choice([b'1', b'2', b'X'])
+            beg = rng.randint(0, 3 * 10**6)
+            end = beg + rng.choice([1, 100, 10**5])
+            expected = [line for line in lines if line.startswith(chrom + b'\t') and
+                        int(line.split(b'\t')[1]) - 1 < end and
+                        int(line.split(b'\t')[1]) - 1 + len(line.split(b'\t')[3]) > beg]
+            self.assertEqual(query(self.path, sequences, chrom, beg, end, is_vcf=True), expected)
+
+    def test_tsv_and_errors(self):
+        path = os.path.join(self.tmp_dir, 'table.tsv.gz')
+        with TabixWriter(path) as writer:
+            writer.write(b'chrom\tpos\tref\talt\n1\t5\tA\tG\n1\t7\tC\tT\n2\t1\tA\tAT')
+        config, sequences = read_index(path + '.tbi')
+        self.assertEqual(config, (0, 1, 2, 2, '#', 1))
+        self.assertEqual(query(path, sequences, b'1', 6, 7), [b'1\t7\tC\tT\n'])
+        self.assertEqual(query(path, sequences, b'2', 0, 1), [b'2\t1\tA\tAT'])
+
+        # unsorted input: nothing is left at the output path
+        os.remove(path)
+        os.remove(path + '.tbi')
+        with self.assertRaises(ValueError):
+            with TabixWriter(path) as writer:
+                writer.write(b'chrom\tpos\n1\t5\n2\t3\n1\t9\n')
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
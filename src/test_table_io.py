@@ -0,0 +1,84 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from bgzf import BgzfWriter
+from table_io import TableReader, TableWriter, Record, read_lines
+
+
+class TestTableIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lines = ['chrom\tpos\tref\talt\n'] + ['%d\t%d\tA\tG%s\n' % (i % 22 + 1, i, 'C' * (i % 7))
+                                                   for i in range(5000)]
+        self.data = ''.join(self.lines).encode('ascii')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_files(self, data):
+        """Returns the paths of the data written as plain text, with gzip, and with BGZF"""
+        paths = [os.path.join(self.tmp_dir, name) for name in ('table.tsv', 'table.tsv.gz', 'table.bgz.tsv.gz')]
+        with open(paths[0], 'wb') as f:
+            f.write(data)
+        with gzip.open(paths[1], 'wb') as f:
+            f.write(data)
+        with BgzfWriter(paths[2]) as f:
+            f.write(data)
+        return paths
+
+    def test_read_lines(self):
+        for path in self.write_files(self.data):
+            # with blocks that end in the middle of lines and of gzip members
+            for block_size in (100, 2**20):
+                self.assertEqual(list(read_lines(path, block_size=block_size)), self.lines)
+        self.assertEqual(list(read_lines(io.BytesIO(self.data), block_size=1000)), self.lines)
+
+    def test_table_reader(self):
+        expected_rows = [line.rstrip('\n').split('\t') for line in self.lines[1:]]
+        for path in self.write_files(self.data):
+            for block_size in (100, 2**20):
+                with TableReader(path, block_size=block_size) as table:
+                    self.assertEqual(table.header, self.lines[0])
+                    self.assertEqual(table.column_names, ['chrom', 'pos', 'ref', 'alt'])
+                    self.assertEqual(table.indexes(['pos', 'chrom']), [1, 0])
+                    self.assertEqual(list(table), expected_rows)
+                with TableReader(path, block_size=block_size) as table:
+                    self.assertEqual(list(table.lines()), self.lines[1:])
+
+        # without a newline at the end, and with an empty line
+        with TableReader(io.BytesIO(b'a\tb\n1\t2\n\n3\t4')) as table:
+            self.assertEqual(list(table), [['1', '2'], [''], ['3', '4']])
+        with TableReader(io.BytesIO(b'a\tb')) as table:
+            self.assertEqual(table.column_names, ['a', 'b'])
+            self.assertEqual(list(table), [])
+        self.assertRaises(ValueError, TableReader, io.BytesIO(b''))
+        self.assertRaises(ValueError, TableReader(io.BytesIO(self.data)).indexes, ['chrom', 'gene'])
+
+    def test_record(self):
+        with TableReader(io.BytesIO(self.data)) as table:
+            record = next(table.records())
+        self.assertEqual(record['pos'], '0')
+        self.assertEqual(record.get('alt'), 'G')
+        self.assertEqual(record.get('gene', ''), '')
+        self.assertEqual(record.to_dict(), {'chrom': '1', 'pos': '0', 'ref': 'A', 'alt': 'G'})
+        self.assertRaises(KeyError, lambda: record['gene'])
+        self.assertEqual(Record(['1'], {'chrom': 0, 'pos': 1}).get('pos'), None)
+
+    def test_table_writer(self):
+        path = os.path.join(self.tmp_dir, 'out.tsv')
+        with open(path, 'w') as f:
+            with TableWriter(f, batch_size=100) as out:
+                out.write(self.lines[0])
+                for line in self.lines[1:]:
+                    out.write_row(line.rstrip('\n').split('\t'))
+        with open(path) as f:
+            self.assertEqual(f.read(), ''.join(self.lines))
+
+
+if __name__ == '__main__':
+    unittest.main()